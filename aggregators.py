@@ -0,0 +1,197 @@
+import re
+from collections import Counter
+from datetime import datetime
+
+
+# Зарегистрированные агрегаторы: имя -> класс
+AGGREGATORS = {}
+
+# Дни недели в порядке datetime.weekday() (как strftime('%A') в локали C)
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Глубина префикса пути для статистики по каталогам
+PATH_PREFIX_DEPTH = 2
+
+# Старый формат адреса: str() от psutil addr, например "addr(ip='10.0.0.1', port=443)"
+_PSUTIL_ADDR = re.compile(r"ip='([^']*)'")
+
+
+def register_aggregator(cls):
+    """Регистрирует агрегатор под его именем; используется как декоратор класса"""
+    AGGREGATORS[cls.name] = cls
+    return cls
+
+
+class Aggregator:
+    """Счётчик по ключу, вычисляемый за один проход и объединяемый с другими частичными результатами"""
+
+    name = None
+    needs_timestamp = False  # нужен ли разобранный timestamp записи
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def key(self, record, timestamp):
+        """Ключ записи; None — запись не учитывается"""
+        raise NotImplementedError
+
+    def add(self, record, timestamp):
+        key = self.key(record, timestamp)
+        if key is not None:
+            self.counts[key] += 1
+
+    def merge(self, other):
+        """Добавляет частичный результат другого агрегатора того же типа"""
+        self.counts.update(other.counts)
+        return self
+
+    def result(self):
+        return self.counts
+
+    def to_state(self):
+        """Состояние для сохранения в JSON"""
+        return list(self.counts.items())
+
+    @classmethod
+    def from_state(cls, state):
+        aggregator = cls()
+        for key, count in state:
+            aggregator.counts[key] = count
+        return aggregator
+
+
+@register_aggregator
+class TotalAggregator(Aggregator):
+    name = "total"
+
+    def key(self, record, timestamp):
+        return "events"
+
+    def result(self):
+        return self.counts["events"]
+
+
+@register_aggregator
+class EventTypeAggregator(Aggregator):
+    name = "event_type"
+
+    def key(self, record, timestamp):
+        return record.get("event_type")
+
+
+@register_aggregator
+class UserAggregator(Aggregator):
+    name = "user"
+
+    def key(self, record, timestamp):
+        return record.get("user", "Unknown")
+
+
+@register_aggregator
+class SourceAggregator(Aggregator):
+    name = "source"
+
+    def key(self, record, timestamp):
+        return record.get("source", "Unknown")
+
+
+@register_aggregator
+class WeekdayAggregator(Aggregator):
+    name = "weekday"
+    needs_timestamp = True
+
+    def key(self, record, timestamp):
+        return WEEKDAYS[timestamp.weekday()]
+
+
+@register_aggregator
+class HourAggregator(Aggregator):
+    name = "hour"
+    needs_timestamp = True
+
+    def key(self, record, timestamp):
+        return timestamp.hour
+
+
+@register_aggregator
+class PathPrefixAggregator(Aggregator):
+    name = "path_prefix"
+
+    def key(self, record, timestamp):
+        path = record.get("src_path")
+        if not path:
+            return None
+        parts = path.split("/", PATH_PREFIX_DEPTH + 1)
+        return "/".join(parts[:PATH_PREFIX_DEPTH + 1]) or "/"
+
+
+@register_aggregator
+class RemoteIpAggregator(Aggregator):
+    name = "remote_ip"
+
+    def key(self, record, timestamp):
+        address = record.get("remote_address")
+        if isinstance(address, dict):
+            return address.get("ip")
+        if isinstance(address, str):
+            match = _PSUTIL_ADDR.search(address)
+            return match.group(1) if match else None
+        return None
+
+
+@register_aggregator
+class HostAggregator(Aggregator):
+    """Хост-источник события; поле host есть только в журналах коллектора (см. collector)"""
+    name = "host"
+
+    def key(self, record, timestamp):
+        return record.get("host")
+
+
+def parse_timestamp(record):
+    """Разбирает timestamp записи; None, если его нет или он повреждён"""
+    try:
+        return datetime.fromisoformat(record["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def create_aggregators(names=None):
+    """Создаёт пустые агрегаторы по именам (по умолчанию — все зарегистрированные)"""
+    return {name: AGGREGATORS[name]() for name in (names or AGGREGATORS)}
+
+
+def aggregate(records, names=None, aggregators=None):
+    """Считает всю статистику за один проход; timestamp каждой записи разбирается не более одного раза"""
+    if aggregators is None:
+        aggregators = create_aggregators(names)
+    plain = [aggregator.add for aggregator in aggregators.values() if not aggregator.needs_timestamp]
+    timed = [aggregator.add for aggregator in aggregators.values() if aggregator.needs_timestamp]
+
+    for record in records:
+        for add in plain:
+            add(record, None)
+        if timed:
+            timestamp = parse_timestamp(record)
+            if timestamp is not None:
+                for add in timed:
+                    add(record, timestamp)
+    return aggregators
+
+
+def merge_aggregators(target, partial):
+    """Объединяет частичные результаты (например, из разных файлов или процессов)"""
+    for name, aggregator in partial.items():
+        if name in target:
+            target[name].merge(aggregator)
+        else:
+            target[name] = aggregator
+    return target
+
+
+def aggregators_to_state(aggregators):
+    return {name: aggregator.to_state() for name, aggregator in aggregators.items()}
+
+
+def aggregators_from_state(state):
+    return {name: AGGREGATORS[name].from_state(value) for name, value in state.items() if name in AGGREGATORS}
@@ -0,0 +1,359 @@
+import re
+import sys
+import csv
+import json
+import argparse
+from datetime import datetime
+from collections import Counter
+from itertools import islice
+from log_reader import EVENT_LOG_FILE, archive_files, iter_records
+from log_index import search_log_file
+from report_generator import iter_filtered_logs
+
+
+# Язык фильтров: source=process and (user=root or user=admin) and ts>=2024-11-04
+FIELD_ALIASES = {"ts": "timestamp", "type": "event_type"}
+INDEXED_CRITERIA = ("event_type", "user", "source")  # равенства по ним уходят в индексы и filter_logs
+TIME_FIELD = "timestamp"
+OPERATORS = ("!=", "!~", ">=", "<=", "=", "~", ">", "<")  # ~ — подстрока, как в окне журнала
+KEYWORDS = ("and", "or", "not")
+
+# Вывод
+OUTPUT_FORMATS = ("jsonl", "csv")
+CSV_FIELDS = ("timestamp", "source", "event_type", "user")  # остальные поля — JSON в колонке details
+
+_TOKEN = re.compile(r"""\s*(?:(?P<paren>[()])|(?P<op>!=|!~|>=|<=|=|~|>|<)|"(?P<dq>(?:[^"\\]|\\.)*)"|'(?P<sq>[^']*)'"""
+                    r"""|(?P<word>[^\s()=!<>~"']+))""")
+
+
+def tokenize(text):
+    """Разбивает выражение на лексемы (вид, значение)"""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"unexpected character at {position}: {text[position:position + 10]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "dq":
+            kind, value = "string", re.sub(r"\\(.)", r"\1", value)
+        elif kind == "sq":
+            kind = "string"
+        elif kind == "word" and value.lower() in KEYWORDS:
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Рекурсивный спуск: or < and < not < (скобки | поле оператор значение)"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            expected = value or kind or "token"
+            raise ValueError(f"expected {expected} at token {self.position + 1}, got {token[1]!r}")
+        self.position += 1
+        return token[1]
+
+    def parse(self):
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"unexpected {self.tokens[self.position][1]!r} at token {self.position + 1}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self):
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return ("not", self.parse_not())
+        if self.peek() == ("paren", "("):
+            self.take()
+            node = self.parse_or()
+            self.take("paren", ")")
+            return node
+        field = self.take("word")
+        op = self.take("op")
+        kind, value = self.peek()
+        if kind not in ("word", "string"):
+            raise ValueError(f"expected value after {field}{op}")
+        self.take()
+        return ("term", FIELD_ALIASES.get(field, field), op, value)
+
+
+def parse_expression(text):
+    """Выражение -> дерево: ("and"|"or", [узлы]), ("not", узел), ("term", поле, оператор, значение)"""
+    tokens = tokenize(text)
+    return _Parser(tokens).parse() if tokens else None
+
+
+def _getter(field):
+    """Функция чтения поля; вложенные поля через точку (local_address.port)"""
+    if "." not in field:
+        return lambda record: record.get(field)
+    parts = field.split(".")
+
+    def get(record):
+        value = record
+        for part in parts:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+    return get
+
+
+def _parse_time(value):
+    try:
+        bound = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"bad timestamp {value!r}, expected ISO format like 2024-11-04 or 2024-11-04T10:00:00")
+    if bound.tzinfo is not None:
+        # В журнале наивное локальное время: ...Z и ...+03:00 переводятся в него
+        bound = bound.astimezone().replace(tzinfo=None)
+    return bound
+
+
+def _compile_term(field, op, value):
+    get = _getter(field)
+    if field == TIME_FIELD:
+        # Сравнение времени — как в filter_logs: datetime из ISO-строки записи
+        bound = _parse_time(value)
+        compare = {"=": bound.__eq__, "!=": bound.__ne__, ">=": bound.__le__, "<=": bound.__ge__,
+                   ">": bound.__lt__, "<": bound.__gt__}.get(op)
+        if compare is None:
+            raise ValueError(f"operator {op} is not supported for {field}")
+
+        def match_time(record):
+            try:
+                return compare(datetime.fromisoformat(record[TIME_FIELD]))
+            except (KeyError, TypeError, ValueError):
+                return False
+        return match_time
+
+    if op in ("=", "!="):
+        # Отсутствующее поле равно пустой строке, как user в filter_logs
+        equal = op == "="
+        return lambda record: (str(get(record) if get(record) is not None else "") == value) == equal
+    if op in ("~", "!~"):
+        contains = op == "~"
+        return lambda record: (value in str(get(record) if get(record) is not None else "")) == contains
+
+    # >, <, >=, <=: числа сравниваются как числа, остальное — как строки
+    try:
+        bound = float(value)
+        convert = float
+    except ValueError:
+        bound = value
+        convert = str
+    compare = {">=": bound.__le__, "<=": bound.__ge__, ">": bound.__lt__, "<": bound.__gt__}[op]
+
+    def match_order(record):
+        current = get(record)
+        if current is None:
+            return False
+        try:
+            return compare(convert(current))
+        except (TypeError, ValueError):
+            return False
+    return match_order
+
+
+def compile_predicate(node):
+    """Дерево выражения -> функция record -> bool; None — подходит любая запись"""
+    if node is None:
+        return None
+    kind = node[0]
+    if kind == "term":
+        return _compile_term(*node[1:])
+    if kind == "not":
+        inner = compile_predicate(node[1])
+        return lambda record: not inner(record)
+
+    predicates = [compile_predicate(child) for child in node[1]]
+    if kind == "and":
+        def match_all(record):
+            for predicate in predicates:
+                if not predicate(record):
+                    return False
+            return True
+        return match_all
+
+    def match_any(record):
+        for predicate in predicates:
+            if predicate(record):
+                return True
+        return False
+    return match_any
+
+
+class Query:
+    """Скомпилированный фильтр
+
+    Условия верхнего уровня «и» делятся на две части: равенства по event_type/user/source и
+    границы времени передаются в индексы журнала и в report_generator.iter_filtered_logs
+    (те же правила, что в окне журнала и отчётах), остальное проверяется предикатом.
+    """
+
+    def __init__(self, text=""):
+        self.text = text
+        self.criteria = {}
+        self.start_time = None  # включительно (ts>=); для ts> — граница чтения, точная проверка в предикате
+        self.end_time = None
+        node = parse_expression(text)
+        terms = node[1] if node is not None and node[0] == "and" else [node] if node is not None else []
+        residual = []
+        for term in terms:
+            if not self._push_down(term):
+                residual.append(term)
+        self.residual = residual[0] if len(residual) == 1 else ("and", residual) if residual else None
+        self.predicate = compile_predicate(self.residual)
+
+    def _push_down(self, term):
+        """Переносит условие в criteria/границы времени; True, если отдельная проверка не нужна"""
+        if term[0] != "term":
+            return False
+        _, field, op, value = term
+        if field in INDEXED_CRITERIA and op == "=" and value and field not in self.criteria:
+            self.criteria[field] = value
+            return True
+        if field != TIME_FIELD or op not in ("=", ">=", ">", "<=", "<"):
+            return False
+        bound = _parse_time(value)
+        if op in ("=", ">=", ">") and (self.start_time is None or bound > self.start_time):
+            self.start_time = bound
+        if op in ("=", "<=", "<") and (self.end_time is None or bound < self.end_time):
+            self.end_time = bound
+        return op in (">=", "<=")
+
+    def candidates(self, file_path=EVENT_LOG_FILE, include_archives=False):
+        """Записи, которые могут подойти: архивы отсекаются по манифесту, журнал — по индексам"""
+        if include_archives:
+            for path in archive_files(file_path, start_time=self.start_time, end_time=self.end_time):
+                yield from iter_records(path)
+        yield from search_log_file(file_path, self.criteria, self.start_time, self.end_time, substring=False)
+
+    def run(self, file_path=EVENT_LOG_FILE, include_archives=False):
+        """Подходящие записи в порядке журнала"""
+        records = iter_filtered_logs(self.candidates(file_path, include_archives), self.criteria.get("event_type"),
+                                     self.criteria.get("user"), self.criteria.get("source"),
+                                     self.start_time, self.end_time)
+        if self.predicate is None:
+            return records
+        return filter(self.predicate, records)
+
+    def explain(self):
+        return {
+            "criteria": self.criteria,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "residual": self.residual,
+        }
+
+
+def group_counts(records, fields, limit=None):
+    """Число записей по значениям полей, от самых частых; limit — сколько групп вернуть"""
+    getters = [_getter(field) for field in fields]
+    counts = Counter(tuple(get(record) if not isinstance(get(record), dict) else json.dumps(get(record))
+                           for get in getters) for record in records)
+    return [dict(zip(fields, key), count=count) for key, count in counts.most_common(limit)]
+
+
+def write_jsonl(rows, output):
+    count = 0
+    for row in rows:
+        output.write(json.dumps(row) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(rows, output, fields=None):
+    """CSV с колонками fields; без fields — CSV_FIELDS и остальные поля записи в details"""
+    writer = csv.writer(output)
+    writer.writerow(list(fields or CSV_FIELDS) + ([] if fields else ["details"]))
+    getters = [_getter(field) for field in fields or CSV_FIELDS]
+    count = 0
+    for row in rows:
+        values = [get(row) for get in getters]
+        values = [json.dumps(value) if isinstance(value, (dict, list)) else value for value in values]
+        if not fields:
+            details = {key: value for key, value in row.items() if key not in CSV_FIELDS}
+            values.append(json.dumps(details) if details else "")
+        writer.writerow(values)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="audit-query",
+        description="Query the audit log without the GUI",
+        epilog="Expression example: source=process and event_type=PROCESS_START and user=root and ts>=2024-11-04. "
+               "Operators: = != ~ (substring) !~ > >= < <=; combine with and, or, not and parentheses.",
+    )
+    parser.add_argument("expression", nargs="*", help="filter expression (empty matches everything)")
+    parser.add_argument("--log-file", default=EVENT_LOG_FILE, help="log file to query")
+    parser.add_argument("--archives", action="store_true", help="include rotated segments from the archive")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="jsonl", help="output format")
+    parser.add_argument("--fields", help="comma-separated CSV columns (dotted names for nested fields)")
+    parser.add_argument("--count", action="store_true", help="print only the number of matching records")
+    parser.add_argument("--group-by", help="comma-separated fields to count matches by")
+    parser.add_argument("--limit", type=int, help="stop after this many records (or groups with --group-by)")
+    parser.add_argument("--explain", action="store_true", help="print the compiled plan to stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        query = Query(" ".join(args.expression))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.explain:
+        print(json.dumps(query.explain()), file=sys.stderr)
+
+    records = query.run(args.log_file, args.archives)
+    try:
+        if args.group_by:
+            rows = group_counts(records, args.group_by.split(","), args.limit)
+            fields = args.group_by.split(",") + ["count"]
+        else:
+            # Поток с ранним выходом: после limit совпадений журнал дальше не читается
+            rows = islice(records, args.limit) if args.limit is not None else records
+            fields = args.fields.split(",") if args.fields else None
+        if args.count:
+            print(sum(1 for _ in rows))
+        elif args.format == "csv":
+            write_csv(rows, sys.stdout, fields)
+        else:
+            write_jsonl(rows, sys.stdout)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Вывод оборван (например, | head) — это не ошибка
+        sys.stderr.close()
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
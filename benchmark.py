@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+
+from event_writer import EventWriter
+from report_generator import filter_logs, generate_text_report, load_logs
+from workload_generator import WorkloadGenerator, generate_log
+
+
+# Результат каждого замера: лучший и медианный из REPEAT прогонов
+REPEAT = 3
+RECORDS = 200_000           # Размер синтетического журнала по умолчанию
+WRITE_RECORDS = 100_000     # Событий в замере log_event
+PRODUCERS = 4               # Параллельных производителей в замере log_event
+TABLE_RECORDS = 100_000     # Записей в замере update_table
+
+
+def _measure(run, repeat, units):
+    """Запускает run() repeat раз; units — сколько записей обрабатывает один прогон"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "records": units,
+        "best_seconds": round(best, 6),
+        "median_seconds": round(statistics.median(timings), 6),
+        "records_per_sec": round(units / best) if best else None,
+    }
+
+
+def _skipped(reason):
+    return {"skipped": reason}
+
+
+# Замеры
+
+def bench_log_event(tmp_dir, records=WRITE_RECORDS, producers=PRODUCERS, repeat=REPEAT, log_format="json"):
+    """log_event из нескольких нитей до записи на диск последнего события"""
+    try:
+        import one_file_logger
+    except ImportError as e:
+        return _skipped(f"one_file_logger: {e}")
+
+    header = ("timestamp", "source", "event_type")
+    events = [(record["source"], record["event_type"],
+               {key: value for key, value in record.items() if key not in header})
+              for record in WorkloadGenerator(seed=1).records(records)]
+    shares = [events[number::producers] for number in range(producers)]
+    log_file = os.path.join(tmp_dir, "log_event.json")
+    last_stats = {}
+
+    def produce(share):
+        log_event = one_file_logger.log_event
+        for source, event_type, details in share:
+            log_event(source, event_type, details)
+
+    def run():
+        if os.path.exists(log_file):
+            os.remove(log_file)
+        # log_event пишет через модульного писателя: на время замера он подменяется писателем во временный файл
+        writer = EventWriter(log_file, quiet=True, log_format=log_format)
+        original = one_file_logger.event_writer
+        one_file_logger.event_writer = writer
+        try:
+            threads = [threading.Thread(target=produce, args=(share,)) for share in shares]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            writer.close()
+        finally:
+            one_file_logger.event_writer = original
+        last_stats.update(writer.stats())
+
+    result = _measure(run, repeat, records)
+    result.update(producers=producers, log_format=log_format, bytes=os.path.getsize(log_file),
+                  blocked=last_stats.get("blocked"), written=last_stats.get("written"))
+    return result
+
+
+def bench_load_logs(log_file, records, repeat=REPEAT):
+    return _measure(lambda: load_logs(log_file), repeat, records)
+
+
+def bench_filter_logs(logs, repeat=REPEAT):
+    """Обе реализации filter_logs: точное совпадение (report_generator) и подстрока (journal)"""
+    start_time = datetime.fromisoformat(logs[len(logs) // 4]["timestamp"])
+    end_time = datetime.fromisoformat(logs[len(logs) * 3 // 4]["timestamp"])
+
+    results = {
+        "report_generator": _measure(lambda: filter_logs(logs, event_type="FILE_MODIFIED"),
+                                     repeat, len(logs)),
+        "report_generator_time_range": _measure(
+            lambda: filter_logs(logs, start_time=start_time, end_time=end_time), repeat, len(logs)),
+    }
+    try:
+        import journal
+    except ImportError as e:
+        results["journal"] = _skipped(f"journal: {e}")
+        return results
+    results["journal"] = _measure(lambda: journal.filter_logs(logs, "FILE", "", "file"), repeat, len(logs))
+    results["journal_time_range"] = _measure(
+        lambda: journal.filter_logs(logs, "", "", "", start_time, end_time), repeat, len(logs))
+    return results
+
+
+def bench_text_report(logs, tmp_dir, repeat=REPEAT, chart_format="none"):
+    output_dir = os.path.join(tmp_dir, "report")
+    result = _measure(lambda: generate_text_report(logs, output_dir, chart_format), repeat, len(logs))
+    result["chart_format"] = chart_format
+    return result
+
+
+def bench_update_table(logs, repeat=REPEAT):
+    """journal.update_table с отрисовкой видимого окна; нужен дисплей"""
+    if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        return _skipped("no DISPLAY")
+    try:
+        import tkinter as tk
+        import journal
+        from virtual_table import VirtualTable
+    except ImportError as e:
+        return _skipped(str(e))
+
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        table = VirtualTable(root, journal.file_columns, journal.format_row)
+
+        def run():
+            journal.update_table(table, logs, journal.file_columns)
+            root.update_idletasks()
+
+        result = _measure(run, repeat, len(logs))
+        result["sort_timestamp"] = _measure(lambda: journal.sort_column(table, 1, reverse=False), 1, len(logs))
+        return result
+    finally:
+        root.destroy()
+
+
+# Сведения об окружении, чтобы результаты разных версий и машин можно было сравнивать
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+BENCHMARKS = ("log_event", "load_logs", "filter_logs", "text_report", "update_table")
+
+
+def run_benchmarks(log_file=None, records=RECORDS, selected=BENCHMARKS, repeat=REPEAT, producers=PRODUCERS,
+                   write_records=WRITE_RECORDS, log_format="json", chart_format="none"):
+    """Выполняет выбранные замеры; возвращает словарь, готовый к json.dump"""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="audit_bench_") as tmp_dir:
+        workload = {"generated": log_file is None}
+        if log_file is None:
+            log_file = generate_log(os.path.join(tmp_dir, "event_log.json"), records)
+        logs = load_logs(log_file)
+        workload.update(records=len(logs), bytes=os.path.getsize(log_file))
+
+        if "log_event" in selected:
+            results["log_event"] = bench_log_event(tmp_dir, write_records, producers, repeat, log_format)
+        if "load_logs" in selected:
+            results["load_logs"] = bench_load_logs(log_file, len(logs), repeat)
+        if "filter_logs" in selected:
+            results["filter_logs"] = bench_filter_logs(logs, repeat)
+        if "text_report" in selected:
+            results["text_report"] = bench_text_report(logs, tmp_dir, repeat, chart_format)
+        if "update_table" in selected:
+            results["update_table"] = bench_update_table(logs[:TABLE_RECORDS], repeat)
+
+    return {"environment": environment(), "workload": workload, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the logger, the report and the viewer; prints JSON")
+    parser.add_argument("--log", help="existing event_log.json (default: generate a synthetic one)")
+    parser.add_argument("--records", type=int, default=RECORDS, help="size of the synthetic log")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--producers", type=int, default=PRODUCERS, help="threads calling log_event")
+    parser.add_argument("--write-records", type=int, default=WRITE_RECORDS)
+    parser.add_argument("--log-format", choices=("json", "binary"), default="json")
+    parser.add_argument("--charts", choices=("png", "html", "none"), default="none")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.log, args.records, args.only, args.repeat, args.producers, args.write_records,
+                            args.log_format, args.charts)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,396 @@
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+
+# Формат файла:
+#   заголовок файла BINARY_MAGIC
+#   блоки: заголовок блока + сжатое zlib содержимое
+# Содержимое блока:
+#   длина и JSON-словарь блока: строки (источники, типы событий), формы записей
+#   (наборы имён полей) и таблица значений
+#   записи: длина и номер формы (по 2 байта), затем для стандартной формы время
+#   в микросекундах, номера источника и типа события, и номера значений полей формы
+BINARY_MAGIC = b"AUDBIN1\n"
+BLOCK_MAGIC = b"BLK1"
+BLOCK_RECORDS = 4096          # максимум записей в блоке
+COMPRESSION_LEVEL = 6
+
+# magic, размер сжатых данных, размер несжатых данных, число записей, минимальное и максимальное время
+_BLOCK_HEADER = struct.Struct("<4sIIIqq")
+_RECORD_PREFIX = struct.Struct("<HH")   # длина остатка записи, форма
+_STANDARD_HEAD = "<qHH"                  # время, источник, тип события
+_DICT_LENGTH = struct.Struct("<I")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MIN_TIME = -2 ** 63
+_MAX_TIME = 2 ** 63 - 1
+
+# Поля заголовка записи, как их пишет one_file_logger.log_event
+_HEADER_FIELDS = ("timestamp", "source", "event_type")
+
+
+def is_binary_log(file_path):
+    """Проверяет, записан ли файл в бинарном формате"""
+    try:
+        with open(file_path, "rb") as file:
+            return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    except OSError:
+        return False
+
+
+# Время: ISO-строка <-> микросекунды от эпохи
+
+_seconds_cache = {}
+
+
+def format_timestamp(timestamp_us):
+    """Микросекунды от эпохи -> строка, как datetime.isoformat() для наивного времени"""
+    seconds, microseconds = divmod(timestamp_us, 1000000)
+    base = _seconds_cache.get(seconds)
+    if base is None:
+        if len(_seconds_cache) > 65536:
+            _seconds_cache.clear()
+        base = _seconds_cache[seconds] = (_EPOCH + timedelta(seconds=seconds)).isoformat()
+    return f"{base}.{microseconds:06d}" if microseconds else base
+
+
+def parse_timestamp(value):
+    """ISO-строка -> микросекунды от эпохи; None, если строку нельзя восстановить без потерь"""
+    if type(value) is not str:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if timestamp.tzinfo is not None:
+        return None
+    timestamp_us = (timestamp - _EPOCH) // _MICROSECOND
+    return timestamp_us if format_timestamp(timestamp_us) == value else None
+
+
+# Запись блоков
+
+class BlockEncoder:
+    """Накопитель одного блока с интернированием строк, форм записей и значений"""
+
+    def __init__(self):
+        self.strings = {}
+        self.shapes = {}
+        self.values = {}
+        self.records = []
+        self.min_time = _MAX_TIME
+        self.max_time = _MIN_TIME
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _intern(table, key):
+        index = table.get(key)
+        if index is None:
+            index = table[key] = len(table)
+        return index
+
+    def _value_id(self, value):
+        # Ключ различает 1, 1.0 и True; вложенные объекты сравниваются по JSON
+        if isinstance(value, (dict, list, tuple)):
+            key = ("json", json.dumps(value))
+        elif isinstance(value, (str, int, float, type(None))):
+            key = (type(value), value)
+        else:
+            # Иначе ошибка всплыла бы только в encode() и погубила бы весь блок
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        index = self.values.get(key)
+        if index is None:
+            index = self.values[key] = (len(self.values), value)
+        return index[0]
+
+    def add(self, record):
+        keys = tuple(record)
+        timestamp_us = None
+        if keys[:3] == _HEADER_FIELDS and type(record["source"]) is str and type(record["event_type"]) is str:
+            timestamp_us = parse_timestamp(record["timestamp"])
+
+        if timestamp_us is not None:
+            field_names = keys[3:]
+            value_ids = [self._value_id(record[name]) for name in field_names]
+            payload = struct.pack(f"{_STANDARD_HEAD}{len(value_ids)}I", timestamp_us,
+                                  self._intern(self.strings, record["source"]),
+                                  self._intern(self.strings, record["event_type"]), *value_ids)
+            self.min_time = min(self.min_time, timestamp_us)
+            self.max_time = max(self.max_time, timestamp_us)
+        else:
+            # Нестандартная запись хранится целиком как набор полей; блок нельзя пропускать по времени
+            field_names = keys
+            value_ids = [self._value_id(record[name]) for name in field_names]
+            payload = struct.pack(f"<{len(value_ids)}I", *value_ids)
+            self.min_time, self.max_time = _MIN_TIME, _MAX_TIME
+
+        shape = self._intern(self.shapes, (timestamp_us is not None, field_names))
+        self.records.append(_RECORD_PREFIX.pack(len(payload), shape) + payload)
+
+    def encode(self):
+        """Готовый блок: заголовок и сжатое содержимое"""
+        dictionary = json.dumps({
+            "strings": list(self.strings),
+            "shapes": [[standard, list(names)] for standard, names in self.shapes],
+            "values": [value for _, value in sorted(self.values.values(), key=lambda item: item[0])],
+        }).encode()
+        raw = _DICT_LENGTH.pack(len(dictionary)) + dictionary + b"".join(self.records)
+        compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+        min_time = self.min_time if self.records else 0
+        max_time = self.max_time if self.records else 0
+        header = _BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), len(raw), len(self.records), min_time, max_time)
+        return header + compressed
+
+
+def complete_length(file):
+    """Длина начала файла, состоящего из заголовка и целых блоков
+
+    Всё, что дальше, — оборванный при сбое блок или мусор: читатель остановится на нём и не
+    увидит блоков, дописанных после.
+    """
+    file.seek(0)
+    if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        return 0
+    position = len(BINARY_MAGIC)
+    size = file.seek(0, os.SEEK_END)
+    file.seek(position)
+    while position + _BLOCK_HEADER.size <= size:
+        magic, compressed_size = _BLOCK_HEADER.unpack(file.read(_BLOCK_HEADER.size))[:2]
+        if magic != BLOCK_MAGIC or position + _BLOCK_HEADER.size + compressed_size > size:
+            break
+        position += _BLOCK_HEADER.size + compressed_size
+        file.seek(position)
+    return position
+
+
+class BinaryLogWriter:
+    """Дописывает записи в бинарный журнал блоками"""
+
+    def __init__(self, file, block_records=BLOCK_RECORDS):
+        self.file = file
+        self.block_records = block_records
+        self.block = BlockEncoder()
+        self.truncated = 0  # байт оборванного хвоста, отрезанных при открытии
+        size = file.seek(0, os.SEEK_END)
+        if size:
+            # Хвост после сбоя отрезается, иначе новые блоки окажутся за ним и не будут прочитаны
+            length = complete_length(file)
+            if length < size:
+                file.truncate(length)
+                self.truncated = size - length
+            size = length
+        if size == 0:
+            # Новому (пустому) файлу нужен заголовок
+            file.write(BINARY_MAGIC)
+        file.seek(0, os.SEEK_END)
+
+    def write(self, record):
+        self.block.add(record)
+        if len(self.block) >= self.block_records:
+            self.flush_block()
+
+    def flush_block(self):
+        """Записывает накопленный блок в файл"""
+        if len(self.block):
+            self.file.write(self.block.encode())
+            self.block = BlockEncoder()
+
+
+# Чтение блоков
+
+def _decode_block(raw):
+    dictionary_length = _DICT_LENGTH.unpack_from(raw)[0]
+    position = _DICT_LENGTH.size + dictionary_length
+    dictionary = json.loads(raw[_DICT_LENGTH.size:position])
+    strings = dictionary["strings"]
+    lookup = dictionary["values"].__getitem__
+    shapes = []
+    for standard, names in dictionary["shapes"]:
+        if standard:
+            shapes.append((True, _HEADER_FIELDS[1:] + tuple(names),
+                           struct.Struct(f"{_STANDARD_HEAD}{len(names)}I").unpack_from))
+        else:
+            shapes.append((False, tuple(names), struct.Struct(f"<{len(names)}I").unpack_from))
+
+    # Цикл по записям — самая горячая часть чтения, поэтому всё нужное заранее в локальных переменных
+    records = []
+    append = records.append
+    unpack_prefix = _RECORD_PREFIX.unpack_from
+    prefix_size = _RECORD_PREFIX.size
+    seconds_cache = _seconds_cache
+    end = len(raw)
+    while position < end:
+        length, shape = unpack_prefix(raw, position)
+        position += prefix_size
+        standard, names, unpack = shapes[shape]
+        fields = unpack(raw, position)
+        position += length
+        if standard:
+            seconds, microseconds = divmod(fields[0], 1000000)
+            base = seconds_cache.get(seconds) or format_timestamp(seconds * 1000000)
+            record = {"timestamp": f"{base}.{microseconds:06d}" if microseconds else base}
+            record.update(zip(names, (strings[fields[1]], strings[fields[2]], *map(lookup, fields[3:]))))
+        else:
+            record = dict(zip(names, map(lookup, fields)))
+        append(record)
+    return records
+
+
+def _to_us(timestamp, default):
+    return default if timestamp is None else (timestamp - _EPOCH) // _MICROSECOND
+
+
+def read_file_records(file, position, end=None, stats=None, follow=False, start_time=None, end_time=None):
+    """Читает блоки из открытого файла, начиная с границы блока position
+
+    stats.offset указывает на конец последнего полностью прочитанного блока. Блоки, не
+    пересекающиеся с [start_time, end_time], пропускаются без распаковки. Оборванный
+    последний блок (запись ещё идёт) при follow=True оставляется до следующего чтения,
+    иначе считается повреждённым.
+    """
+    min_time = _to_us(start_time, _MIN_TIME)
+    max_time = _to_us(end_time, _MAX_TIME)
+    position = max(position, len(BINARY_MAGIC))
+    file.seek(position)
+    if stats is not None:
+        stats.offset = position
+
+    while end is None or position < end:
+        header = file.read(_BLOCK_HEADER.size)
+        if not header:
+            break
+        torn = len(header) < _BLOCK_HEADER.size
+        if not torn:
+            magic, compressed_size, raw_size, count, block_min, block_max = _BLOCK_HEADER.unpack(header)
+            if magic != BLOCK_MAGIC:
+                if stats is not None:
+                    stats.malformed += 1
+                break
+            # Блок читается целиком и тогда, когда он будет пропущен: так оборванный блок
+            # распознаётся одинаково и в обычном, и в сжатом gzip архиве
+            compressed = file.read(compressed_size)
+            torn = len(compressed) < compressed_size
+        if torn:
+            if not follow and stats is not None:
+                stats.malformed += 1
+            break
+
+        records = []
+        if block_min <= max_time and block_max >= min_time:
+            try:
+                records = _decode_block(zlib.decompress(compressed))
+            except (zlib.error, ValueError, struct.error, IndexError):
+                if stats is not None:
+                    stats.malformed += count
+
+        position += _BLOCK_HEADER.size + compressed_size
+        if stats is not None:
+            stats.offset = position
+            stats.records += len(records)
+        yield from records
+
+
+def iter_binary_records(file_path, stats=None, start=0, end=None, follow=False, start_time=None, end_time=None):
+    """Лениво читает бинарный журнал поблочно; start/end — смещения границ блоков"""
+    try:
+        file = open(file_path, "rb")
+    except FileNotFoundError:
+        return
+
+    with file:
+        if stats is not None:
+            stats.files += 1
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{file_path}: not a binary event log")
+        yield from read_file_records(file, start, end, stats, follow, start_time, end_time)
+
+
+# Преобразование форматов
+
+def convert_to_binary(json_path, binary_path, block_records=BLOCK_RECORDS):
+    """JSON-строки -> бинарный журнал; возвращает число записей"""
+    from log_reader import iter_records, RAISE
+
+    count = 0
+    with open(binary_path, "wb") as file:
+        writer = BinaryLogWriter(file, block_records)
+        for record in iter_records(json_path, on_error=RAISE):
+            writer.write(record)
+            count += 1
+        writer.flush_block()
+    return count
+
+
+def convert_to_json(binary_path, json_path):
+    """Бинарный журнал -> JSON-строки в формате one_file_logger; возвращает число записей"""
+    count = 0
+    with open(json_path, "w", encoding="utf-8") as file:
+        for record in iter_binary_records(binary_path):
+            file.write(json.dumps(record) + "\n")
+            count += 1
+    return count
+
+
+def benchmark(json_path):
+    """Сравнение размера на диске и скорости декодирования JSON и бинарного формата"""
+    from log_reader import iter_records, JSON_DECODER
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        binary_path = os.path.join(tmp_dir, "event_log.bin")
+        started = time.perf_counter()
+        records = convert_to_binary(json_path, binary_path)
+        encode_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        json_records = sum(1 for _ in iter_records(json_path))
+        json_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        binary_records = sum(1 for _ in iter_binary_records(binary_path))
+        binary_seconds = time.perf_counter() - started
+
+        return {
+            "records": records,
+            "json_decoder": JSON_DECODER,
+            "json_bytes": os.path.getsize(json_path),
+            "binary_bytes": os.path.getsize(binary_path),
+            "encode_records_per_sec": records / encode_seconds if encode_seconds else None,
+            "json_decode_records_per_sec": json_records / json_seconds if json_seconds else None,
+            "binary_decode_records_per_sec": binary_records / binary_seconds if binary_seconds else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary event log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_binary = commands.add_parser("to-binary", help="convert event_log.json to the binary format")
+    to_binary.add_argument("source")
+    to_binary.add_argument("target")
+    to_json = commands.add_parser("to-json", help="convert a binary log back to JSON lines")
+    to_json.add_argument("source")
+    to_json.add_argument("target")
+    bench = commands.add_parser("bench", help="compare size and decode speed with JSON")
+    bench.add_argument("source", nargs="?", default="event_log.json")
+    args = parser.parse_args(argv)
+
+    if args.command == "to-binary":
+        print(f"Converted {convert_to_binary(args.source, args.target)} records")
+    elif args.command == "to-json":
+        print(f"Converted {convert_to_json(args.source, args.target)} records")
+    else:
+        json.dump(benchmark(args.source), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,717 @@
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import socket
+import struct
+import signal
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from log_reader import EVENT_LOG_FILE, LogTailer, ReadStats, default_archive_dir, find_archived_segment, iter_records
+from log_rotator import LogRotator, MAX_SIZE, MAX_AGE_SECONDS, RETENTION_DAYS, RETENTION_BYTES
+from report_generator import CHART_FORMAT, generate_parallel_report
+from workload_generator import WorkloadGenerator
+
+
+# Сеть
+COLLECTOR_PORT = 9470
+COLLECTOR_ADDRESS = f"127.0.0.1:{COLLECTOR_PORT}"  # host:port или unix:/путь/к/сокету
+CONNECT_TIMEOUT = 10           # Подключение и ожидание подтверждения, с
+RECONNECT_MIN = 1              # Пауза перед повторным подключением растёт от MIN до MAX, с
+RECONNECT_MAX = 30
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# Агент
+BATCH_RECORDS = 1000           # Событий в пакете
+BATCH_INTERVAL = 1.0           # Неполный пакет отправляется не реже, с
+POLL_INTERVAL = 0.2            # Пауза при отсутствии новых событий в журнале, с
+WINDOW = 8                     # Пакетов без подтверждения в пути
+COMPRESSION_LEVEL = 1          # zlib: на локальной сети скорость важнее степени сжатия
+SPOOL_SUFFIX = ".spool"        # Каталог неподтверждённых пакетов рядом с журналом
+SPOOL_MAX_BYTES = 256 * 1024 * 1024  # При переполнении выбрасываются самые старые пакеты
+
+# Коллектор
+COLLECTOR_ROOT = "collected"   # <корень>/<хост>/event_log.json и архив хоста
+HOST_STATE_FILE = ".collector_state"
+INGEST_WORKERS = 4             # Нитей записи: хосты пишутся параллельно, пакеты одного хоста — по порядку
+
+# Кадр: магия, тип, флаги, номер пакета, длина данных
+FRAME_MAGIC = b"AUDC"
+_FRAME = struct.Struct("<4sBBQI")
+HELLO = 1                      # агент -> коллектор: {"host", "epoch"}; ответ ACK с последним принятым номером
+BATCH = 2                      # агент -> коллектор: JSON-строки событий
+ACK = 3                        # коллектор -> агент: пакет с этим номером записан
+FLAG_ZLIB = 1
+
+
+def encode_frame(kind, sequence, payload=b"", flags=0):
+    return _FRAME.pack(FRAME_MAGIC, kind, flags, sequence, len(payload)) + payload
+
+
+def decode_header(header):
+    """Заголовок кадра -> (тип, флаги, номер, длина)"""
+    magic, kind, flags, sequence, length = _FRAME.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise ValueError("bad frame magic")
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"frame too large: {length} bytes")
+    return kind, flags, sequence, length
+
+
+def encode_batch(records, host, compress=True):
+    """События -> (флаги, данные): JSON-строки как в журнале, с полем host, при необходимости сжатые"""
+    data = "".join(json.dumps(record if "host" in record else dict(record, host=host)) + "\n"
+                   for record in records).encode()
+    if compress:
+        return FLAG_ZLIB, zlib.compress(data, COMPRESSION_LEVEL)
+    return 0, data
+
+
+def parse_address(address):
+    """"host:port" -> (AF_INET, (host, port)); "unix:/path" или путь -> (AF_UNIX, path)"""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host.strip("[]") or "127.0.0.1", int(port or COLLECTOR_PORT))
+
+
+def safe_host(name):
+    """Имя хоста как имя каталога: только буквы, цифры, точка, дефис и подчёркивание"""
+    name = "".join(c if c.isalnum() or c in "._-" else "_" for c in name).strip(".")
+    return name or "unknown"
+
+
+# Агент: пакеты сначала попадают в спул на диске, удаляются после подтверждения
+
+class Spool:
+    """Каталог готовых к отправке кадров <номер>.batch
+
+    Номера растут монотонно и переживают перезапуск; epoch меняется только вместе с каталогом,
+    поэтому коллектор отличает повтор уже принятого пакета от нового спула с теми же номерами.
+    Файл state атомарно фиксирует последний номер вместе с позицией чтения журнала (tail):
+    пакеты с номерами больше зафиксированного при открытии удаляются — их события будут
+    прочитаны из журнала заново, а не отправлены дважды.
+    """
+
+    def __init__(self, directory, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.epoch = self._read("epoch")
+        if not self.epoch:
+            self.epoch = uuid.uuid4().hex
+            self._write("epoch", self.epoch)
+        state = json.loads(self._read("state") or "{}")
+        self.sequence = state.get("sequence", 0)
+        self.tail = state.get("tail")  # [inode, устройство, смещение] в журнале после последнего пакета
+        self.files = deque()  # (номер, путь, размер) от старых к новым
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".batch"):
+                path = os.path.join(directory, name)
+                if int(name[:-6]) > self.sequence:
+                    os.unlink(path)  # записан, но не зафиксирован до сбоя
+                    continue
+                self.files.append((int(name[:-6]), path, os.path.getsize(path)))
+        self.bytes = sum(size for _, _, size in self.files)
+        self.dropped = 0
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, name, value):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w") as file:
+            file.write(str(value))
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return len(self.files)
+
+    def put(self, batches, tail=None):
+        """Сохраняет пакеты [(флаги, данные), ...] и позицию журнала после них; возвращает последний номер"""
+        sequence = self.sequence
+        written = []
+        for flags, payload in batches:
+            sequence += 1
+            frame = encode_frame(BATCH, sequence, payload, flags)
+            path = os.path.join(self.directory, f"{sequence:020d}.batch")
+            with open(path + ".tmp", "wb") as file:
+                file.write(frame)
+            os.replace(path + ".tmp", path)
+            written.append((sequence, path, len(frame)))
+        if tail is not None:
+            self.tail = list(tail)
+        # Фиксация: до этой записи новые пакеты при перезапуске считаются несуществующими
+        self._write("state", json.dumps({"sequence": sequence, "tail": self.tail}))
+        self.sequence = sequence
+        self.files.extend(written)
+        self.bytes += sum(size for _, _, size in written)
+        while self.max_bytes and self.bytes > self.max_bytes and len(self.files) > 1:
+            # Коллектор недоступен слишком долго: теряем самые старые события, а не новые
+            self._remove(self.files.popleft())
+            self.dropped += 1
+        return self.sequence
+
+    def ack(self, sequence):
+        """Удаляет пакеты с номерами до sequence включительно"""
+        while self.files and self.files[0][0] <= sequence:
+            self._remove(self.files.popleft())
+
+    def _remove(self, entry):
+        try:
+            os.unlink(entry[1])
+        except FileNotFoundError:
+            pass
+        self.bytes -= entry[2]
+
+
+class Agent:
+    """Отправка событий коллектору пакетами, с окном неподтверждённых пакетов и спулом на диске"""
+
+    def __init__(self, address=COLLECTOR_ADDRESS, host=None, spool_dir=EVENT_LOG_FILE + SPOOL_SUFFIX,
+                 compress=True, batch_records=BATCH_RECORDS, batch_interval=BATCH_INTERVAL, window=WINDOW,
+                 spool_max_bytes=SPOOL_MAX_BYTES, timeout=CONNECT_TIMEOUT):
+        self.family, self.address = parse_address(address)
+        self.host = host or socket.gethostname()
+        self.spool = Spool(spool_dir, spool_max_bytes)
+        self.compress = compress
+        self.batch_records = batch_records
+        self.batch_interval = batch_interval
+        self.window = window
+        self.timeout = timeout
+
+        self._buffer = []
+        self._buffer_since = None
+        self._position = None  # позиция журнала после последнего добавленного события
+        self._socket = None
+        self._retry_at = 0.0
+        self._backoff = RECONNECT_MIN
+
+        # Счётчики
+        self.batches = 0
+        self.records = 0
+        self.sent_bytes = 0
+        self.acked = 0
+        self.reconnects = 0
+
+    def add(self, records, position=None):
+        """Добавляет события; position — позиция журнала сразу после них (см. LogTailer.position)
+
+        Набрался полный пакет — весь буфер уходит в спул вместе с позицией, поэтому позиция
+        в спуле всегда приходится на границу уже сохранённых событий.
+        """
+        if records and not self._buffer:
+            self._buffer_since = time.monotonic()
+        self._buffer.extend(records)
+        if position is not None:
+            self._position = position
+        if len(self._buffer) >= self.batch_records:
+            self._spool()
+
+    def flush(self, force=False):
+        """Отправляет в спул неполный пакет, если он ждёт дольше batch_interval (или force)"""
+        if self._buffer and (force or time.monotonic() - self._buffer_since >= self.batch_interval):
+            self._spool()
+
+    def _spool(self):
+        records, self._buffer = self._buffer, []
+        batches = [encode_batch(records[start:start + self.batch_records], self.host, self.compress)
+                   for start in range(0, len(records), self.batch_records)]
+        self.spool.put(batches, self._position)
+        self.batches += len(batches)
+        self.records += len(records)
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            hello = json.dumps({"host": self.host, "epoch": self.spool.epoch}).encode()
+            sock.sendall(encode_frame(HELLO, 0, hello))
+            # Ответ на HELLO — последний принятый пакет: подтверждения, потерянные при разрыве, не нужны повторно
+            self.spool.ack(self._read_ack(sock))
+        except (OSError, ValueError):
+            sock.close()
+            raise
+        self._socket = sock
+        self._backoff = RECONNECT_MIN
+
+    def _read_ack(self, sock):
+        header = _recv_exactly(sock, _FRAME.size)
+        kind, _, sequence, length = decode_header(header)
+        if kind != ACK or length:
+            raise ValueError(f"unexpected frame type {kind}")
+        return sequence
+
+    def disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send_pending(self):
+        """Отправляет пакеты из спула; возвращает число подтверждённых. Ошибки сети не выбрасываются"""
+        if not self.spool.files:
+            return 0
+        if self._socket is None:
+            if time.monotonic() < self._retry_at:
+                return 0
+            try:
+                self._connect()
+            except (OSError, ValueError) as e:
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, RECONNECT_MAX)
+                print(f"Collector unavailable ({e}), {len(self.spool)} batches spooled", file=sys.stderr)
+                return 0
+            self.reconnects += 1
+
+        acked = 0
+        in_flight = deque()
+        pending = iter(list(self.spool.files))
+        try:
+            while True:
+                # Окно: следующий пакет уходит, не дожидаясь подтверждения предыдущих
+                while len(in_flight) < self.window:
+                    entry = next(pending, None)
+                    if entry is None:
+                        break
+                    with open(entry[1], "rb") as file:
+                        frame = file.read()
+                    self._socket.sendall(frame)
+                    self.sent_bytes += len(frame)
+                    in_flight.append(entry[0])
+                if not in_flight:
+                    break
+                sequence = self._read_ack(self._socket)
+                while in_flight and in_flight[0] <= sequence:
+                    in_flight.popleft()
+                    acked += 1
+                self.spool.ack(sequence)
+        except (OSError, ValueError) as e:
+            print(f"Collector connection lost: {e}", file=sys.stderr)
+            self.disconnect()
+            self._retry_at = time.monotonic() + self._backoff
+        self.acked += acked
+        return acked
+
+    def _catch_up(self, log_file, tailer):
+        """Продолжает с позиции, сохранённой в спуле: дочитывает ротированный за время простоя журнал
+
+        Без сохранённой позиции (первый запуск) текущая позиция сразу фиксируется, чтобы
+        события, записанные до следующего запуска, не потерялись.
+        """
+        if self.spool.tail is None:
+            position = tailer.position()
+            if position is not None:
+                self.spool.put([], position)
+            return
+        inode, device, offset = self.spool.tail
+        if tailer.resume(inode, device, offset):
+            return
+        segment = find_archived_segment(log_file, inode, device)
+        if segment is None:
+            print(f"{log_file}: the log read before restart is gone, shipping the current log from the start",
+                  file=sys.stderr)
+        else:
+            read_stats = ReadStats()
+            chunk = []
+            for record in iter_records(segment, start=offset, stats=read_stats):
+                chunk.append(record)
+                if len(chunk) >= self.batch_records:
+                    self.add(chunk, (inode, device, read_stats.offset))
+                    chunk = []
+            self.add(chunk, (inode, device, read_stats.offset))
+            self.flush(force=True)
+        # Ротированный журнал отправлен: дальше — новый файл с начала
+        position = tailer.position()
+        if position is not None:
+            self.spool.put([], position)
+
+    def run(self, log_file=EVENT_LOG_FILE, stop_event=None, from_start=False):
+        """Читает новые строки журнала и отправляет их до установки stop_event
+
+        Позиция чтения хранится в спуле, поэтому после перезапуска чтение продолжается с неё;
+        from_start действует только при первом запуске (спул без позиции).
+        """
+        tailer = LogTailer(log_file, from_end=not from_start)
+        self._catch_up(log_file, tailer)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                records = tailer.poll()
+                self.add(records, tailer.position())
+                self.flush()
+                self.send_pending()
+                if not records:
+                    if stop_event is not None:
+                        stop_event.wait(POLL_INTERVAL)
+                    else:
+                        time.sleep(POLL_INTERVAL)
+            # Остановка: последний неполный пакет и попытка его отправить; неотправленное остаётся в спуле
+            self.add(tailer.poll(), tailer.position())
+            self.flush(force=True)
+            self._retry_at = 0.0
+            self.send_pending()
+        finally:
+            tailer.close()
+            self.disconnect()
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "batches": self.batches,
+            "records": self.records,
+            "sent_bytes": self.sent_bytes,
+            "acked": self.acked,
+            "spooled": len(self.spool),
+            "spool_bytes": self.spool.bytes,
+            "spool_dropped": self.spool.dropped,
+            "reconnects": self.reconnects,
+        }
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return bytes(data)
+
+
+# Коллектор: журнал и архив на каждый хост
+
+class HostLog:
+    """Журнал одного хоста: <корень>/<хост>/event_log.json с ротацией, как у one_file_logger
+
+    Пакет подтверждается после записи в файл; номер последнего записанного пакета хранится
+    рядом, поэтому повтор после разрыва соединения не дублирует события.
+    """
+
+    def __init__(self, directory, fsync=False, max_bytes=MAX_SIZE, max_age=MAX_AGE_SECONDS):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, EVENT_LOG_FILE)
+        self.state_file = os.path.join(directory, HOST_STATE_FILE)
+        self.fsync = fsync
+        self.rotator = LogRotator(self.path, default_archive_dir(self.path), max_bytes=max_bytes, max_age=max_age,
+                                  retention_days=RETENTION_DAYS, retention_bytes=RETENTION_BYTES)
+        self.rotator.recover()
+        self.lock = asyncio.Lock()
+        self._file = None
+        self._opened_at = None
+        try:
+            with open(self.state_file) as file:
+                state = json.load(file)
+            self.epoch, self.sequence = state["epoch"], state["sequence"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.epoch, self.sequence = None, 0
+
+    def last_sequence(self, epoch):
+        """Последний записанный пакет спула epoch; 0 — этот спул ещё ничего не присылал"""
+        return self.sequence if epoch == self.epoch else 0
+
+    def append(self, data, epoch, sequence):
+        """Дописывает JSON-строки пакета (вызывается из нити записи)"""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            self._opened_at = time.time()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.epoch, self.sequence = epoch, sequence
+        with open(self.state_file + ".tmp", "w") as file:
+            json.dump({"epoch": epoch, "sequence": sequence}, file)
+        os.replace(self.state_file + ".tmp", self.state_file)
+        if self.rotator.due(self._file.tell(), self._opened_at):
+            self._close_file()
+            self.rotator.rotate()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_file()
+        self.rotator.close()
+
+
+class Collector:
+    """Приём пакетов от агентов по TCP или Unix-сокету; соединения обслуживаются одним циклом asyncio"""
+
+    def __init__(self, root=COLLECTOR_ROOT, fsync=False, workers=INGEST_WORKERS):
+        self.root = root
+        self.fsync = fsync
+        self.hosts = {}
+        self._connections = {}  # задача -> writer открытого соединения
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+
+        # Счётчики
+        self.connections = 0
+        self.batches = 0
+        self.duplicates = 0
+        self.records = 0
+        self.received_bytes = 0
+        self.raw_bytes = 0
+
+    def host_log(self, host):
+        name = safe_host(host)
+        if name not in self.hosts:
+            self.hosts[name] = HostLog(os.path.join(self.root, name), self.fsync)
+        return self.hosts[name]
+
+    async def _read_frame(self, reader):
+        kind, flags, sequence, length = decode_header(await reader.readexactly(_FRAME.size))
+        payload = await reader.readexactly(length) if length else b""
+        self.received_bytes += _FRAME.size + length
+        return kind, flags, sequence, payload
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+        self._connections[asyncio.current_task()] = writer
+        peer = writer.get_extra_info("peername")
+        try:
+            kind, _, _, payload = await self._read_frame(reader)
+            if kind != HELLO:
+                raise ValueError("expected HELLO")
+            hello = json.loads(payload)
+            epoch = hello["epoch"]
+            log = self.host_log(hello["host"])
+            writer.write(encode_frame(ACK, log.last_sequence(epoch)))
+
+            while True:
+                try:
+                    kind, flags, sequence, payload = await self._read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break  # агент закрыл соединение
+                if kind != BATCH:
+                    raise ValueError(f"unexpected frame type {kind}")
+                async with log.lock:
+                    if sequence <= log.last_sequence(epoch):
+                        self.duplicates += 1
+                    else:
+                        data = zlib.decompress(payload) if flags & FLAG_ZLIB else payload
+                        if data and not data.endswith(b"\n"):
+                            raise ValueError("batch does not end with a newline")
+                        # Запись на диск — в пуле нитей: другие хосты тем временем принимаются дальше
+                        await loop.run_in_executor(self.executor, log.append, data, epoch, sequence)
+                        self.batches += 1
+                        self.records += data.count(b"\n")
+                        self.raw_bytes += len(data)
+                writer.write(encode_frame(ACK, sequence))
+                await writer.drain()
+        except (ValueError, KeyError, TypeError, zlib.error, ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"Dropping agent connection {peer}: {e}", file=sys.stderr)
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def serve(self, address=COLLECTOR_ADDRESS):
+        family, target = parse_address(address)
+        if family == socket.AF_UNIX:
+            try:
+                os.unlink(target)
+            except FileNotFoundError:
+                pass
+            return await asyncio.start_unix_server(self.handle, target)
+        return await asyncio.start_server(self.handle, *target)
+
+    async def shutdown(self):
+        """Закрывает соединения агентов (начатая запись пакета завершается) и журналы хостов
+
+        Неподтверждённые пакеты остаются в спулах агентов и придут после перезапуска.
+        """
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for log in self.hosts.values():
+            log.close()
+
+    def stats(self):
+        return {
+            "hosts": len(self.hosts),
+            "connections": self.connections,
+            "batches": self.batches,
+            "duplicates": self.duplicates,
+            "records": self.records,
+            "received_bytes": self.received_bytes,
+            "raw_bytes": self.raw_bytes,
+        }
+
+
+async def run_collector(address=COLLECTOR_ADDRESS, root=COLLECTOR_ROOT, fsync=False):
+    """Принимает пакеты до SIGTERM/SIGINT; начатые пакеты дописываются до выхода"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    collector = Collector(root, fsync)
+    server = await collector.serve(address)
+    print(f"Collector listening on {address}, writing to {root}")
+    await stop.wait()
+    server.close()
+    await collector.shutdown()
+    await server.wait_closed()
+    print(f"Collector stopped: {collector.stats()}")
+
+
+# Отчёт по всем хостам
+
+def host_logs(root=COLLECTOR_ROOT):
+    """Активные журналы всех хостов коллектора"""
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(root, name, EVENT_LOG_FILE) for name in names
+            if os.path.isdir(os.path.join(root, name))]
+
+
+def generate_hosts_report(root=COLLECTOR_ROOT, output_dir="/home/akpchelkova/audi", include_archives=True,
+                          workers=None, chart_format=CHART_FORMAT):
+    """Один отчёт по журналам и архивам всех хостов (раздел Events by Host — по полю host)"""
+    return generate_parallel_report(host_logs(root), output_dir, include_archives, workers,
+                                    chart_format=chart_format)
+
+
+# Замер скорости приёма на loopback
+
+def bench_loopback(records=200_000, agents=4, transport="unix", compress=True, batch_records=BATCH_RECORDS,
+                   window=WINDOW):
+    """Коллектор и agents агентов в одном процессе; время до подтверждения всех пакетов"""
+    events = list(WorkloadGenerator(seed=0).records(records // agents))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        address = f"unix:{tmp_dir}/collector.sock" if transport == "unix" else "127.0.0.1:0"
+        collector = Collector(os.path.join(tmp_dir, "collected"))
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(collector.serve(address))
+        if transport == "tcp":
+            address = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        shipped = []
+
+        def ship(index):
+            agent = Agent(address, host=f"bench-{index}", spool_dir=os.path.join(tmp_dir, f"spool-{index}"),
+                          compress=compress, batch_records=batch_records, window=window)
+            agent.add(events)
+            agent.flush(force=True)
+            while agent.spool.files:
+                agent.send_pending()
+            agent.disconnect()
+            shipped.append(agent.stats())
+
+        started = time.perf_counter()
+        senders = [threading.Thread(target=ship, args=(index,)) for index in range(agents)]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        seconds = time.perf_counter() - started
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.run_until_complete(collector.shutdown())
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+        stats = collector.stats()
+
+    total = sum(agent["records"] for agent in shipped)
+    return {
+        "transport": transport,
+        "compress": compress,
+        "agents": agents,
+        "batch_records": batch_records,
+        "window": window,
+        "records": total,
+        "stored_records": stats["records"],
+        "seconds": round(seconds, 6),
+        "records_per_sec": round(total / seconds) if seconds else None,
+        "wire_bytes": stats["received_bytes"],
+        "raw_bytes": stats["raw_bytes"],
+        "compression_ratio": round(stats["raw_bytes"] / stats["received_bytes"], 3) if stats["received_bytes"] else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ship audit events from many hosts to one collector")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    collect = commands.add_parser("collect", help="receive batches and write one log per host")
+    collect.add_argument("--listen", default=COLLECTOR_ADDRESS, help="host:port or unix:/path")
+    collect.add_argument("--root", default=COLLECTOR_ROOT, help="directory with one subdirectory per host")
+    collect.add_argument("--fsync", action="store_true", help="fsync every batch before acknowledging it")
+
+    agent = commands.add_parser("agent", help="tail the local log and ship it to the collector")
+    agent.add_argument("--connect", default=COLLECTOR_ADDRESS, help="host:port or unix:/path")
+    agent.add_argument("--log-file", default=EVENT_LOG_FILE)
+    agent.add_argument("--host", help="name of this host (default: hostname)")
+    agent.add_argument("--spool-dir", help="default: <log file>.spool")
+    agent.add_argument("--batch-records", type=int, default=BATCH_RECORDS)
+    agent.add_argument("--batch-interval", type=float, default=BATCH_INTERVAL)
+    agent.add_argument("--no-compress", action="store_true")
+    agent.add_argument("--from-start", action="store_true", help="ship the whole log, not only new lines")
+
+    bench = commands.add_parser("bench", help="measure ingest rate over loopback")
+    bench.add_argument("--records", type=int, default=200_000)
+    bench.add_argument("--agents", type=int, default=4)
+    bench.add_argument("--transport", choices=("unix", "tcp"), default="unix")
+    bench.add_argument("--batch-records", type=int, default=BATCH_RECORDS)
+    bench.add_argument("--window", type=int, default=WINDOW)
+    bench.add_argument("--no-compress", action="store_true")
+
+    report = commands.add_parser("report", help="one report over the logs of all hosts")
+    report.add_argument("--root", default=COLLECTOR_ROOT)
+    report.add_argument("--output-dir", default="/home/akpchelkova/audi")
+    report.add_argument("--workers", type=int, default=None)
+    report.add_argument("--no-archives", action="store_true")
+    report.add_argument("--charts", choices=("png", "html", "none"), default=CHART_FORMAT)
+    args = parser.parse_args(argv)
+
+    if args.command == "collect":
+        asyncio.run(run_collector(args.listen, args.root, args.fsync))
+    elif args.command == "agent":
+        shipper = Agent(args.connect, args.host, args.spool_dir or args.log_file + SPOOL_SUFFIX,
+                        compress=not args.no_compress, batch_records=args.batch_records,
+                        batch_interval=args.batch_interval)
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop.set())
+        shipper.run(args.log_file, stop, args.from_start)
+        print(f"Agent stopped: {shipper.stats()}")
+    elif args.command == "bench":
+        json.dump(bench_loopback(args.records, args.agents, args.transport, not args.no_compress,
+                                 args.batch_records, args.window), sys.stdout, indent=2)
+        print()
+    else:
+        generate_hosts_report(args.root, args.output_dir, not args.no_archives, args.workers, args.charts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import queue
+import collections
+import threading
+
+from binary_log import BINARY_MAGIC, BinaryLogWriter
+
+
+# Политики при переполнении очереди
+BLOCK = "block"              # производитель ждёт освобождения места
+DROP_OLDEST = "drop_oldest"  # выбрасываем самое старое событие из очереди
+DROP_NEWEST = "drop_newest"  # выбрасываем новое событие
+
+QUEUE_FULL_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+# Форматы журнала
+JSON_FORMAT = "json"      # одна JSON-строка на событие
+BINARY_FORMAT = "binary"  # сжатые блоки, см. binary_log; блок пишется при каждом сбросе
+
+LOG_FORMATS = (JSON_FORMAT, BINARY_FORMAT)
+
+
+class EventWriter:
+    """Фоновый писатель событий: одна нить, ограниченная очередь, пакетная запись в файл"""
+
+    def __init__(self, path, max_queue=10000, batch_size=500, flush_every=1000,
+                 flush_interval_ms=1000, fsync=False, quiet=False, queue_full_policy=BLOCK,
+                 log_format=JSON_FORMAT, rotator=None, metrics=None):
+        if queue_full_policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"Unknown queue full policy: {queue_full_policy}")
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format: {log_format}")
+        existing = self._existing_format(path)
+        if rotator is None and existing not in (None, log_format):
+            raise ValueError(f"{path} is a {existing} log, cannot append {log_format} records; "
+                             f"move it away or enable rotation")
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync = fsync
+        self.quiet = quiet
+        self.queue_full_policy = queue_full_policy
+        self.log_format = log_format
+        self.rotator = rotator  # log_rotator.LogRotator или None
+        self.metrics = metrics  # metrics.LoggerMetrics или None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._put_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._file = None
+        self._binary = None
+        self._identity = None   # (inode, устройство) открытого файла
+        self._opened_at = None
+
+        # Счётчики
+        self.enqueued = 0
+        self.written = 0
+        self.blocked = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.flushes = 0
+        self.rotations = 0
+        self.reopens = 0
+        self.failed_batches = 0  # пакеты, которые не удалось записать (нет места, ошибка ротации)
+        self.failed_events = 0   # события этих пакетов и отдельные события, не сериализуемые в JSON
+
+    # Работа с очередью (вызывается из нитей-мониторов)
+
+    def write(self, entry):
+        """Ставит событие в очередь на запись согласно политике переполнения
+
+        После close() событие не принимается: возвращается False.
+        """
+        if self._closed:
+            self._count_dropped(entry)
+            return False
+        self._ensure_started()
+        # В очереди хранится и время постановки: по нему считается задержка записи
+        item = (time.monotonic(), entry)
+
+        if self.queue_full_policy == BLOCK:
+            try:
+                self._queue.put_nowait(item)
+                blocked = False
+            except queue.Full:
+                blocked = True
+                self._queue.put(item)
+            with self._put_lock:
+                self.blocked += blocked
+                self.enqueued += 1
+            return True
+
+        with self._put_lock:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.queue_full_policy == DROP_NEWEST:
+                    self.dropped_newest += 1
+                    self._count_dropped(entry)
+                    return False
+                try:
+                    _, dropped = self._queue.get_nowait()
+                    self.dropped_oldest += 1
+                    self._count_dropped(dropped)
+                except queue.Empty:
+                    pass
+                self._queue.put_nowait(item)
+            self.enqueued += 1
+            return True
+
+    def _count_dropped(self, entry):
+        if self.metrics is not None:
+            self.metrics.dropped.inc(entry.get("source"))
+
+    def queue_depth(self):
+        """Текущее количество событий в очереди"""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Счётчики писателя"""
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "blocked": self.blocked,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_newest": self.dropped_newest,
+            "flushes": self.flushes,
+            "rotations": self.rotations,
+            "reopens": self.reopens,
+            "failed_batches": self.failed_batches,
+            "failed_events": self.failed_events,
+            "queue_depth": self.queue_depth(),
+        }
+
+    # Жизненный цикл
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None and not self._closed:
+                thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def close(self, timeout=None):
+        """Останавливает писателя, дописывая и синхронизируя всё, что осталось в очереди"""
+        with self._start_lock:
+            self._closed = True
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # Нить записи
+
+    @staticmethod
+    def _existing_format(path):
+        """Формат уже записанного журнала; None — файла нет или он пуст"""
+        try:
+            with open(path, "rb") as file:
+                head = file.read(len(BINARY_MAGIC))
+        except FileNotFoundError:
+            return None
+        if not head:
+            return None
+        # Оборванный при создании заголовок бинарного журнала — тоже бинарный журнал
+        return BINARY_FORMAT if BINARY_MAGIC.startswith(head) else JSON_FORMAT
+
+    def _open(self):
+        existing = self._existing_format(self.path)
+        if existing not in (None, self.log_format):
+            # Формат сменили (LOG_FORMAT/--log-format): смешанный файл не прочитал бы ни один читатель,
+            # поэтому старый журнал уходит в архив целиком
+            if self.rotator is None:
+                raise ValueError(f"{self.path} is a {existing} log, cannot append {self.log_format} records")
+            self.rotator.rotate()
+            self.rotations += 1
+        if self.log_format == BINARY_FORMAT:
+            self._file = open(self.path, "a+b")
+            self._binary = BinaryLogWriter(self._file, block_records=max(self.flush_every, self.batch_size))
+            if self._binary.truncated:
+                print(f"{self.path}: dropped {self._binary.truncated} bytes of a torn block")
+        else:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._binary = None
+        st = os.fstat(self._file.fileno())
+        self._identity = (st.st_ino, st.st_dev)
+        self._opened_at = time.time()
+
+    def _close(self):
+        # Закрытие всегда с fsync: после него файл может быть переименован и сжат
+        if self._file is None:
+            return
+        if self._binary is not None:
+            self._binary.flush_block()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.flushes += 1
+        self._file.close()
+        self._file = None
+
+    def _check_rotation(self):
+        """Ротация после сброса: своя по правилам rotator или внешняя (файл переименован или удалён)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or (st.st_ino, st.st_dev) != self._identity:
+            # Журнал ротирован снаружи (например, python log_rotator.py): пишем в новый файл
+            self._close()
+            self._open()
+            self.reopens += 1
+        elif self.rotator is not None and self.rotator.due(st.st_size, self._opened_at):
+            # Переименование между пачками: все записанные события целиком остаются в сегменте
+            self._close()
+            self.rotator.rotate()
+            self._open()
+            self.rotations += 1
+
+    def _flush(self):
+        started = time.perf_counter()
+        if self._binary is not None:
+            self._binary.flush_block()
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.flushes += 1
+        if self.metrics is not None:
+            self.metrics.flush_duration.observe(time.perf_counter() - started)
+
+    def _drain(self, first):
+        """Забирает из очереди пакет событий, начиная с уже полученного"""
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        written = []
+        lines = []
+        for enqueued_at, entry in batch:
+            # Несериализуемое событие пропускается одно, остальные события пакета пишутся
+            try:
+                if self._binary is not None:
+                    self._binary.write(entry)
+                else:
+                    lines.append(json.dumps(entry) + "\n")
+            except (TypeError, ValueError) as e:
+                self._report_error("serializing an event for", e)
+                self.failed_events += 1
+                self._count_dropped(entry)
+                continue
+            written.append((enqueued_at, entry))
+        if lines:
+            self._file.write("".join(lines))
+        entries = [entry for _, entry in written]
+        self.written += len(entries)
+        if self.metrics is not None and written:
+            now = time.monotonic()
+            self.metrics.write_latency.observe_many([now - enqueued_at for enqueued_at, _ in written])
+            self.metrics.written.inc_many(collections.Counter(entry.get("source") for entry in entries))
+        if not self.quiet:
+            for entry in entries:
+                print(f"Logged {entry.get('source')} event: {entry}")
+
+    def _report_error(self, action, error, batch=None):
+        """Ошибка записи не останавливает нить: иначе производители навсегда повиснут на полной очереди"""
+        if batch is not None:
+            self.failed_batches += 1
+            self.failed_events += len(batch)
+            for _, entry in batch:
+                self._count_dropped(entry)
+        lost = f", {len(batch)} events lost" if batch is not None else ""
+        print(f"Event writer: {action} {self.path} failed: {error!r}{lost}", file=sys.stderr)
+
+    def _run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    first = None
+
+                if first is not None:
+                    batch = self._drain(first)
+                    try:
+                        if self._file is None:
+                            self._open()
+                        self._write_batch(batch)
+                        pending += len(batch)
+                    except Exception as e:
+                        self._report_error("writing to", e, batch)
+
+                now = time.monotonic()
+                if pending and (pending >= self.flush_every or now - last_flush >= self.flush_interval):
+                    try:
+                        self._flush()
+                        self._check_rotation()
+                    except Exception as e:
+                        # Файл мог остаться закрытым (например, после неудачной ротации): откроется заново
+                        self._report_error("flushing", e)
+                        if self._file is not None and self._file.closed:
+                            self._file = None
+                    pending = 0
+                    last_flush = now
+                elif first is None and not pending and self._file is not None:
+                    # Простой без событий: сегмент всё равно должен ротироваться по возрасту
+                    try:
+                        self._check_rotation()
+                    except Exception as e:
+                        self._report_error("rotating", e)
+                        if self._file is not None and self._file.closed:
+                            self._file = None
+
+                if self._stop.is_set() and self._queue.empty():
+                    break
+        finally:
+            # При остановке всегда сбрасываем буферы на диск
+            try:
+                self._close()
+            except Exception as e:
+                self._report_error("closing", e)
@@ -1,65 +1,115 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import json
+import queue
+import threading
+import ipaddress
 from datetime import datetime
+from virtual_table import VirtualTable
+from log_index import search_log_file
+from log_reader import LogTailer
 from report_generator import ( 
-    load_logs,
     #generate_event_type_stats,
-    generate_text_report,
+    generate_incremental_report,
     #save_chart_to_file
 )
 
 from send_report import send_email_with_attachments
 
+SEARCH_POLL_MS = 100            # Как часто главный поток забирает результаты поиска
+SEARCH_PROGRESS_EVERY = 1000    # Как часто фоновый поиск сообщает о прогрессе
+
+FOLLOW_INTERVAL_MS = 500       # Период чтения новых строк в режиме слежения
+FOLLOW_MAX_ROWS = 10000        # Сколько строк хранится в таблице в режиме слежения
+
+# Текущий фоновый поиск
+search_state = {"cancel": None}
+
+# Режим слежения за журналом
+follow_state = {"tailer": None, "job": None}
+
+# Форматирование сетевого адреса {"ip", "port"} как "IP:порт"
+def format_address(address):
+    if isinstance(address, dict):
+        return f"{address['ip']}:{address['port']}"
+    if address is None:
+        return ""  # у слушающих и неподключённых сокетов нет удалённого адреса
+    return address
+
+# Функция для формирования строки таблицы по записи журнала
+def format_row(index, log):
+    if 'local_address' in log and 'remote_address' in log and 'status' in log:
+        # Форматируем local_address и remote_address как "IP:порт"
+        local_address = format_address(log['local_address'])
+        remote_address = format_address(log['remote_address'])
+        return [
+            index, 
+            log['timestamp'], 
+            log['source'], 
+            log['event_type'], 
+            local_address,  # Теперь отображается как IP:порт
+            remote_address,  # Теперь отображается как IP:порт
+            log['status']
+        ]
+    elif 'src_path' in log:  # Для изменений файлов
+        return [
+            index, 
+            log['timestamp'], 
+            log['source'], 
+            log['event_type'], 
+            log['src_path'], 
+        ]
+    else:  # Для процессов
+        return [
+            index, 
+            log['timestamp'], 
+            log['source'], 
+            log['event_type'], 
+            log.get('pid'), 
+            log.get('user', '')
+        ]
+
 # Функция для обновления таблицы с результатами фильтрации
-def update_table(tree, logs, columns):
-    for row in tree.get_children():
-        tree.delete(row)
-
-    # Добавляем строку с порядковым номером
-    for index, log in enumerate(logs, start=1):
-        # Вставляем данные для каждой строки таблицы
-        if 'local_address' in log and 'remote_address' in log and 'status' in log:
-            # Форматируем local_address и remote_address как "IP:порт"
-            local_address = f"{log['local_address']['ip']}:{log['local_address']['port']}" if isinstance(log['local_address'], dict) else log['local_address']
-            remote_address = f"{log['remote_address']['ip']}:{log['remote_address']['port']}" if isinstance(log['remote_address'], dict) else log['remote_address']
-            row_data = [
-                index, 
-                log['timestamp'], 
-                log['source'], 
-                log['event_type'], 
-                local_address,  # Теперь отображается как IP:порт
-                remote_address,  # Теперь отображается как IP:порт
-                log['status']
-            ]
-        elif 'src_path' in log:  # Для изменений файлов
-            row_data = [
-                index, 
-                log['timestamp'], 
-                log['source'], 
-                log['event_type'], 
-                log['src_path'], 
-            ]
-        else:  # Для процессов
-            row_data = [
-                index, 
-                log['timestamp'], 
-                log['source'], 
-                log['event_type'], 
-                log.get('pid'), 
-                log.get('user', '')
-            ]
-        tree.insert("", "end", values=row_data[:len(columns)])
-
-# Функция для обработки сортировки по столбцам
-def sort_column(treeview, col, reverse):
-    data = [(treeview.item(item)['values'], item) for item in treeview.get_children('')]
-    data.sort(key=lambda x: x[0][col], reverse=reverse)
-    
-    for i, (values, item) in enumerate(data):
-        treeview.item(item, values=values)
-    
-    return not reverse
+# (в Treeview попадают только видимые строки, см. VirtualTable)
+def update_table(table, logs, columns):
+    table.set_records(logs if isinstance(logs, list) else list(logs))
+
+# Типизированные ключи сортировки: время — как число, pid и номера — как целые, адреса — как (IP, порт)
+def timestamp_sort_key(value):
+    try:
+        return (1, datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return (0, 0.0)
+
+def int_sort_key(value):
+    try:
+        return (1, int(value))
+    except (TypeError, ValueError):
+        return (0, 0)
+
+def address_sort_key(value):
+    ip, _, port = str(value or "").rpartition(":")
+    try:
+        address = ipaddress.ip_address(ip)
+        return (1, address.version, int(address), int(port))
+    except ValueError:
+        return (0, 0, 0, 0)
+
+def text_sort_key(value):
+    return "" if value is None else str(value)
+
+COLUMN_SORT_KEYS = {
+    "#": int_sort_key,
+    "Timestamp": timestamp_sort_key,
+    "Process ID": int_sort_key,
+    "Local Address": address_sort_key,
+    "Remote Address": address_sort_key,
+}
+
+# Функция для обработки сортировки по столбцам (сортируется модель, перерисовывается только окно).
+# reverse=None переключает направление при повторном клике; возвращает текущее направление
+def sort_column(table, col, reverse=None):
+    to_key = COLUMN_SORT_KEYS.get(table.columns[col], text_sort_key)
+    return table.sort_by(col, lambda number, log: to_key(table.formatter(number, log)[col]), reverse)
 
 # Функция для отправки письма
 def send_report_email():
@@ -75,7 +125,10 @@ def send_report_email():
 
 # Функция для фильтрации логов (заменена на простую фильтрацию)
 def filter_logs(logs, event_type, user, source, start_time=None, end_time=None):
-    filtered_logs = []
+    return list(iter_filtered_logs(logs, event_type, user, source, start_time, end_time))
+
+# Ленивая фильтрация потока записей
+def iter_filtered_logs(logs, event_type, user, source, start_time=None, end_time=None):
     for log in logs:
         if event_type and event_type not in log.get('event_type', ''):
             continue
@@ -83,12 +136,43 @@ def filter_logs(logs, event_type, user, source, start_time=None, end_time=None):
             continue
         if source and source not in log.get('source', ''):
             continue
-        if start_time and log.get('timestamp') < start_time:
-            continue
-        if end_time and log.get('timestamp') > end_time:
-            continue
-        filtered_logs.append(log)
-    return filtered_logs
+        if start_time or end_time:
+            # Время сравнивается как datetime, а не как строка
+            try:
+                timestamp = datetime.fromisoformat(log['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start_time and timestamp < start_time:
+                continue
+            if end_time and timestamp > end_time:
+                continue
+        yield log
+
+# Поиск в фоновом потоке: Tk не трогается, результаты и прогресс передаются через очередь
+def run_search(criteria, start_time, end_time, cancel_event, results):
+    try:
+        logs = search_log_file(criteria=criteria, start_time=start_time, end_time=end_time)
+        filtered_logs = []
+        for log in iter_filtered_logs(logs, criteria['event_type'], criteria['user'], criteria['source'],
+                                      start_time, end_time):
+            if cancel_event.is_set():
+                results.put(("cancelled", len(filtered_logs)))
+                return
+            filtered_logs.append(log)
+            if len(filtered_logs) % SEARCH_PROGRESS_EVERY == 0:
+                results.put(("progress", len(filtered_logs)))
+        results.put(("done", filtered_logs))
+    except Exception as e:
+        results.put(("error", e))
+
+# Преобразование строки времени из поля ввода в datetime (None, если пусто или с ошибкой)
+def parse_time(value):
+    if value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return None
 
 # Обработчик поиска
 def search_logs():
@@ -99,170 +183,223 @@ def search_logs():
     end_time_str = end_time_var.get()
 
     # Преобразование строк времени в объекты datetime
-    start_time = None
-    end_time = None
-    if start_time_str:
-        try:
-            start_time = datetime.fromisoformat(start_time_str)
-        except ValueError:
-            pass
-
-    if end_time_str:
-        try:
-            end_time = datetime.fromisoformat(end_time_str)
-        except ValueError:
-            pass
-
-    # Загружаем логи
-    logs = load_logs()
+    start_time = parse_time(start_time_str)
+    end_time = parse_time(end_time_str)
 
     # Фильтруем логи по source для каждой вкладки
     selected_tab = notebook.index(notebook.select())  # Получаем индекс текущей вкладки
-
-    if selected_tab == 0:  # Вкладка "Network Monitoring"
-        filtered_logs = filter_logs(logs, event_type, user, source='network', start_time=start_time, end_time=end_time)
-        update_table(network_tree, filtered_logs, network_columns)
-    elif selected_tab == 1:  # Вкладка "Process Monitoring"
-        filtered_logs = filter_logs(logs, event_type, user, source='process', start_time=start_time, end_time=end_time)
-        update_table(process_tree, filtered_logs, process_columns)
-    elif selected_tab == 2:  # Вкладка "File Change Monitoring"
-        filtered_logs = filter_logs(logs, event_type, user, source='file', start_time=start_time, end_time=end_time)
-        update_table(file_tree, filtered_logs, file_columns)
+    source, table, columns = tab_tables[selected_tab]
+
+    # Предыдущий незавершённый поиск отменяется
+    cancel_search()
+    cancel_event = threading.Event()
+    results = queue.Queue()
+    search_state["cancel"] = cancel_event
+
+    # Кандидаты берутся из индексов журнала (значения ищутся как подстроки, как и в filter_logs),
+    # а фильтр окончательно проверяет каждую найденную запись
+    criteria = {"event_type": event_type, "user": user, "source": source}
+    threading.Thread(target=run_search, args=(criteria, start_time, end_time, cancel_event, results),
+                     daemon=True).start()
+
+    status_var.set("Searching...")
+    progress_bar.start(10)
+    cancel_button.config(state="normal")
+    root.after(SEARCH_POLL_MS, poll_search, table, columns, cancel_event, results)
+
+# Опрос результатов фонового поиска из главного потока Tk
+def poll_search(table, columns, cancel_event, results):
+    if cancel_event.is_set():
+        return  # поиск отменён или заменён новым, его результаты не нужны
+    while True:
+        try:
+            kind, value = results.get_nowait()
+        except queue.Empty:
+            break
+        if kind == "progress":
+            status_var.set(f"Searching... {value} records found")
+            continue
+        finish_search(cancel_event)
+        if kind == "done":
+            update_table(table, value, columns)
+            status_var.set(f"{len(value)} records found")
+        else:
+            status_var.set("Search failed")
+            messagebox.showerror("Error", f"Error searching logs: {value}")
+        return
+    root.after(SEARCH_POLL_MS, poll_search, table, columns, cancel_event, results)
+
+def finish_search(cancel_event):
+    if search_state["cancel"] is cancel_event:
+        search_state["cancel"] = None
+        progress_bar.stop()
+        cancel_button.config(state="disabled")
+
+# Отмена текущего поиска
+def cancel_search():
+    cancel_event = search_state["cancel"]
+    if cancel_event is not None:
+        cancel_event.set()
+        finish_search(cancel_event)
+        status_var.set("Search cancelled")
+
+# Режим слежения: новые строки журнала дописываются в таблицу текущей вкладки
+def toggle_follow():
+    if follow_var.get():
+        # Читаются только строки, дописанные после включения режима
+        follow_state["tailer"] = LogTailer()
+        follow_tick()
+    else:
+        stop_follow()
+
+def follow_tick():
+    tailer = follow_state["tailer"]
+    if tailer is None:
+        return
+    records = tailer.poll()
+    if records:
+        selected_tab = notebook.index(notebook.select())
+        source, table, columns = tab_tables[selected_tab]
+        filtered_logs = filter_logs(records, event_type_var.get(), user_var.get(), source,
+                                    parse_time(start_time_var.get()), parse_time(end_time_var.get()))
+        table.append_records(filtered_logs, max_rows=FOLLOW_MAX_ROWS)
+    follow_state["job"] = root.after(FOLLOW_INTERVAL_MS, follow_tick)
+
+def stop_follow():
+    if follow_state["job"] is not None:
+        root.after_cancel(follow_state["job"])
+        follow_state["job"] = None
+    if follow_state["tailer"] is not None:
+        follow_state["tailer"].close()
+        follow_state["tailer"] = None
 
 # Функция для генерации отчета
 def generate_report():
-    
-    
-
-    #report_file = generate_text_report(logs)
     try:
-        # Загружаем логи
-        #log_file = "event_log.json"
-        logs = load_logs()
-        if not logs:
+        # Статистика досчитывается только по событиям, появившимся с прошлого отчёта
+        report_file = generate_incremental_report()
+        if report_file is None:
             messagebox.showerror("Error", "No logs found.")
             return
 
-        # Генерируем статистику по типам событий
-        #event_type_stats = generate_event_type_stats(logs)
-
-        # Сохраняем отчет в текстовом формате
-        report_file = generate_text_report(logs)
         messagebox.showinfo("Report", f"Report generated successfully: {report_file}")
 
-        # Сохраняем график
-        #save_chart_to_file(event_type_stats)
-        #messagebox.showinfo("Chart", "Chart saved as event_type_report.png")
-
     except Exception as e:
         messagebox.showerror("Error", f"Error generating report: {e}")
 
-# Создание основного окна Tkinter
-root = tk.Tk()
-root.title("Event Log Viewer")
+# Колонки таблиц каждой вкладки
+network_columns = ("#", "Timestamp", "Source", "Event Type", "Local Address", "Remote Address", "Status")
+process_columns = ("#", "Timestamp", "Source", "Event Type", "Process ID", "User")
+file_columns = ("#", "Timestamp", "Source", "Event Type", "File Path")
 
-# Создание вкладок с использованием ttk.Notebook
-notebook = ttk.Notebook(root)
-notebook.pack(padx=10, pady=10, fill="both", expand=True)
 
-# Вкладка мониторинга сети
-network_tab = ttk.Frame(notebook)
-notebook.add(network_tab, text="Network Monitoring")
+# Окно создаётся только при запуске модуля: импорт (например, из benchmark) не трогает Tk
+if __name__ == "__main__":
+    # Создание основного окна Tkinter
+    root = tk.Tk()
+    root.title("Event Log Viewer")
 
-# Вкладка мониторинга процессов
-process_tab = ttk.Frame(notebook)
-notebook.add(process_tab, text="Process Monitoring")
+    # Создание вкладок с использованием ttk.Notebook
+    notebook = ttk.Notebook(root)
+    notebook.pack(padx=10, pady=10, fill="both", expand=True)
 
-# Вкладка мониторинга изменений файлов
-file_tab = ttk.Frame(notebook)
-notebook.add(file_tab, text="File Change Monitoring")
+    # Вкладка мониторинга сети
+    network_tab = ttk.Frame(notebook)
+    notebook.add(network_tab, text="Network Monitoring")
 
-# Создание виджетов для ввода критериев поиска
-frame = tk.Frame(root)
-frame.pack(padx=10, pady=10)
+    # Вкладка мониторинга процессов
+    process_tab = ttk.Frame(notebook)
+    notebook.add(process_tab, text="Process Monitoring")
 
-tk.Label(frame, text="Event Type:").grid(row=0, column=0, sticky="w")
-event_type_var = tk.StringVar()
-event_type_entry = tk.Entry(frame, textvariable=event_type_var)
-event_type_entry.grid(row=0, column=1)
+    # Вкладка мониторинга изменений файлов
+    file_tab = ttk.Frame(notebook)
+    notebook.add(file_tab, text="File Change Monitoring")
 
-tk.Label(frame, text="User:").grid(row=1, column=0, sticky="w")
-user_var = tk.StringVar()
-user_entry = tk.Entry(frame, textvariable=user_var)
-user_entry.grid(row=1, column=1)
+    # Создание виджетов для ввода критериев поиска
+    frame = tk.Frame(root)
+    frame.pack(padx=10, pady=10)
 
-tk.Label(frame, text="Source:").grid(row=2, column=0, sticky="w")
-source_var = tk.StringVar()
-source_entry = tk.Entry(frame, textvariable=source_var)
-source_entry.grid(row=2, column=1)
+    tk.Label(frame, text="Event Type:").grid(row=0, column=0, sticky="w")
+    event_type_var = tk.StringVar()
+    event_type_entry = tk.Entry(frame, textvariable=event_type_var)
+    event_type_entry.grid(row=0, column=1)
 
-tk.Label(frame, text="Start Time (YYYY-MM-DDTHH:MM:SS):").grid(row=3, column=0, sticky="w")
-start_time_var = tk.StringVar()
-start_time_entry = tk.Entry(frame, textvariable=start_time_var)
-start_time_entry.grid(row=3, column=1)
+    tk.Label(frame, text="User:").grid(row=1, column=0, sticky="w")
+    user_var = tk.StringVar()
+    user_entry = tk.Entry(frame, textvariable=user_var)
+    user_entry.grid(row=1, column=1)
 
-tk.Label(frame, text="End Time (YYYY-MM-DDTHH:MM:SS):").grid(row=4, column=0, sticky="w")
-end_time_var = tk.StringVar()
-end_time_entry = tk.Entry(frame, textvariable=end_time_var)
-end_time_entry.grid(row=4, column=1)
+    tk.Label(frame, text="Source:").grid(row=2, column=0, sticky="w")
+    source_var = tk.StringVar()
+    source_entry = tk.Entry(frame, textvariable=source_var)
+    source_entry.grid(row=2, column=1)
 
-search_button = tk.Button(frame, text="Search", command=search_logs)
-search_button.grid(row=5, column=0, columnspan=2, pady=10)
+    tk.Label(frame, text="Start Time (YYYY-MM-DDTHH:MM:SS):").grid(row=3, column=0, sticky="w")
+    start_time_var = tk.StringVar()
+    start_time_entry = tk.Entry(frame, textvariable=start_time_var)
+    start_time_entry.grid(row=3, column=1)
 
-# Создание кнопки для генерации отчета
-report_button = tk.Button(frame, text="Generate Report", command=generate_report)
-report_button.grid(row=6, column=0, columnspan=2, pady=10)
+    tk.Label(frame, text="End Time (YYYY-MM-DDTHH:MM:SS):").grid(row=4, column=0, sticky="w")
+    end_time_var = tk.StringVar()
+    end_time_entry = tk.Entry(frame, textvariable=end_time_var)
+    end_time_entry.grid(row=4, column=1)
 
-# Создание кнопки для отправления письма
-send_email_button = tk.Button(frame, text="Send Email with Attachments", command=send_report_email)
-send_email_button.grid(row=7, column=0, columnspan=2, pady=10)
+    search_button = tk.Button(frame, text="Search", command=search_logs)
+    search_button.grid(row=5, column=0, pady=10)
 
-# Создание таблиц для отображения результатов для каждой вкладки
-network_columns = ("#", "Timestamp", "Source", "Event Type", "Local Address", "Remote Address", "Status")
-process_columns = ("#", "Timestamp", "Source", "Event Type", "Process ID", "User")
-file_columns = ("#", "Timestamp", "Source", "Event Type", "File Path")
+    cancel_button = tk.Button(frame, text="Cancel", command=cancel_search, state="disabled")
+    cancel_button.grid(row=5, column=1, pady=10)
+
+    # Переключатель режима слежения за журналом
+    follow_var = tk.BooleanVar()
+    follow_check = tk.Checkbutton(frame, text="Follow", variable=follow_var, command=toggle_follow)
+    follow_check.grid(row=10, column=0, columnspan=2)
 
-network_tree = ttk.Treeview(network_tab, columns=network_columns, show="headings", height=10)
-network_tree.pack(padx=10, pady=10, fill="both", expand=True)
+    # Индикатор фонового поиска
+    progress_bar = ttk.Progressbar(frame, mode="indeterminate", length=200)
+    progress_bar.grid(row=8, column=0, columnspan=2, pady=(10, 0))
+    status_var = tk.StringVar()
+    tk.Label(frame, textvariable=status_var).grid(row=9, column=0, columnspan=2)
 
-process_tree = ttk.Treeview(process_tab, columns=process_columns, show="headings", height=10)
-process_tree.pack(padx=10, pady=10, fill="both", expand=True)
+    # Создание кнопки для генерации отчета
+    report_button = tk.Button(frame, text="Generate Report", command=generate_report)
+    report_button.grid(row=6, column=0, columnspan=2, pady=10)
 
-file_tree = ttk.Treeview(file_tab, columns=file_columns, show="headings", height=10)
-file_tree.pack(padx=10, pady=10, fill="both", expand=True)
+    # Создание кнопки для отправления письма
+    send_email_button = tk.Button(frame, text="Send Email with Attachments", command=send_report_email)
+    send_email_button.grid(row=7, column=0, columnspan=2, pady=10)
 
 
-# Добавление прокрутки с обычным ползунком
-scrollbar = ttk.Scrollbar(root, orient="vertical")
-scrollbar.pack(side="right", fill="y")
+    # В таблицах создаются только видимые строки, данные подкачиваются при прокрутке
+    network_table = VirtualTable(network_tab, network_columns, format_row)
+    network_tree = network_table.tree
 
-# Привязка прокрутки ко всем таблицам
-network_tree.configure(yscrollcommand=scrollbar.set)
-process_tree.configure(yscrollcommand=scrollbar.set)
-file_tree.configure(yscrollcommand=scrollbar.set)
-scrollbar.config(command=lambda *args: [network_tree.yview(*args), process_tree.yview(*args), file_tree.yview(*args)])
+    process_table = VirtualTable(process_tab, process_columns, format_row)
+    process_tree = process_table.tree
 
-# Сортировка по колонке при клике на заголовок
-reverse_sort = {col: False for col in network_columns + process_columns + file_columns}
+    file_table = VirtualTable(file_tab, file_columns, format_row)
+    file_tree = file_table.tree
 
-def on_column_click(tree, col, reverse):
-    data = [(tree.item(item)['values'], item) for item in tree.get_children('')]
-    data.sort(key=lambda x: x[0][col], reverse=reverse)
-    
-    for i, (values, item) in enumerate(data):
-        tree.item(item, values=values)
-    
-    return not reverse
+    # Источник, таблица и колонки для каждой вкладки (в порядке вкладок)
+    tab_tables = [
+        ('network', network_table, network_columns),
+        ('process', process_table, process_columns),
+        ('file', file_table, file_columns),
+    ]
 
-# Привязка обработчиков кликов по колонкам для каждой таблицы
-for idx, col in enumerate(network_columns):
-    network_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(network_tree, idx, reverse_sort[network_columns[idx]]))
+    # Сортировка по колонке при клике на заголовок (повторный клик меняет направление)
+    def on_column_click(table, col):
+        return sort_column(table, col)
 
-for idx, col in enumerate(process_columns):
-    process_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(process_tree, idx, reverse_sort[process_columns[idx]]))
+    # Привязка обработчиков кликов по колонкам для каждой таблицы
+    for idx, col in enumerate(network_columns):
+        network_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(network_table, idx))
+
+    for idx, col in enumerate(process_columns):
+        process_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(process_table, idx))
 
-for idx, col in enumerate(file_columns):
-    file_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(file_tree, idx, reverse_sort[file_columns[idx]]))
+    for idx, col in enumerate(file_columns):
+        file_tree.heading(col, text=col, command=lambda idx=idx: on_column_click(file_table, idx))
 
-# Запуск главного цикла Tkinter
-root.mainloop()
+    # Запуск главного цикла Tkinter
+    root.mainloop()
@@ -0,0 +1,457 @@
+import os
+import fcntl
+import struct
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from log_reader import EVENT_LOG_FILE, fingerprint, iter_records, loads
+from binary_log import is_binary_log, iter_binary_records
+
+
+# Разреженный индекс времени хранится рядом с журналом
+TIME_INDEX_SUFFIX = ".tidx"
+INDEX_EVERY_RECORDS = 1000  # новая точка индекса каждые N записей...
+INDEX_EVERY_SECONDS = 60    # ...или при смене минуты
+# Записи в журнале идут по времени, но события разных мониторов могут
+# попасть в очередь писателя с небольшим опозданием
+INDEX_SLACK_SECONDS = 5
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_TIMESTAMP_KEYS = (b'"timestamp": "', b'"timestamp":"')
+
+# magic, inode, устройство, контрольная сумма начала журнала, резерв,
+# проиндексированное смещение, максимум времени, минута последней точки, записей с последней точки
+_TIME_HEADER = struct.Struct("<8sQQIIQqqQ")
+_TIME_ENTRY = struct.Struct("<qQ")  # максимум времени до смещения, смещение
+_TIME_MAGIC = b"AUDTIDX1"
+
+
+def to_epoch_us(timestamp):
+    """datetime (наивное локальное время, как в журнале) -> микросекунды от эпохи"""
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _line_timestamp(line):
+    """Быстро достаёт timestamp из строки журнала, не разбирая весь JSON"""
+    for key in _TIMESTAMP_KEYS:
+        start = line.find(key)
+        if start >= 0:
+            break
+    else:
+        return None
+    start += len(key)
+    end = line.find(b'"', start)
+    try:
+        return to_epoch_us(datetime.fromisoformat(line[start:end].decode()))
+    except ValueError:
+        return None
+
+
+class TimeIndex:
+    """Разреженный индекс «время -> смещение в байтах» для журнала, дописываемого по времени
+
+    Точка индекса (M, o) означает: все записи до смещения o имеют время не больше M.
+    Индекс достраивается по мере роста журнала и перестраивается при его ротации или усечении.
+    """
+
+    def __init__(self, log_file=EVENT_LOG_FILE, index_file=None, every_records=INDEX_EVERY_RECORDS,
+                 every_seconds=INDEX_EVERY_SECONDS):
+        self.log_file = log_file
+        self.index_file = index_file or log_file + TIME_INDEX_SUFFIX
+        self.every_records = every_records
+        self.every_us = every_seconds * 1000000
+        self.times = []
+        self.offsets = []
+        self.indexed_offset = 0
+
+    def update(self):
+        """Дочитывает журнал с последнего проиндексированного места; возвращает число новых точек"""
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            self.times, self.offsets, self.indexed_offset = [], [], 0
+            return 0
+
+        fd = os.open(self.index_file, os.O_RDWR | os.O_CREAT, 0o644)
+        with open(fd, "r+b") as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            header = self._read(index, st)
+            if header is None:
+                index.truncate(0)
+                index.write(bytes(_TIME_HEADER.size))  # место под заголовок
+                indexed_offset, max_time, last_minute, since_entry = 0, -2 ** 63, -1, 0
+            else:
+                indexed_offset, max_time, last_minute, since_entry = header
+
+            new_entries = []
+            position = indexed_offset
+            with open(self.log_file, "rb") as log:
+                log.seek(position)
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        break  # строка ещё дописывается
+                    timestamp = _line_timestamp(line)
+                    if timestamp is not None:
+                        minute = timestamp // self.every_us
+                        if since_entry >= self.every_records or minute != last_minute:
+                            new_entries.append((max_time, position))
+                            last_minute = minute
+                            since_entry = 0
+                        since_entry += 1
+                        max_time = max(max_time, timestamp)
+                    position += len(line)
+
+            index.seek(0, os.SEEK_END)
+            for entry in new_entries:
+                index.write(_TIME_ENTRY.pack(*entry))
+                self.times.append(entry[0])
+                self.offsets.append(entry[1])
+            index.seek(0)
+            index.write(_TIME_HEADER.pack(_TIME_MAGIC, st.st_ino, st.st_dev, fingerprint(self.log_file, position), 0,
+                                          position, max_time, last_minute, since_entry))
+            self.indexed_offset = position
+        return len(new_entries)
+
+    def _read(self, index, st):
+        """Загружает индекс; None, если его нет или он относится к другому файлу"""
+        data = index.read()
+        self.times, self.offsets = [], []
+        if len(data) < _TIME_HEADER.size:
+            return None
+        magic, inode, device, crc, _, indexed_offset, max_time, last_minute, since_entry = \
+            _TIME_HEADER.unpack_from(data)
+        if magic != _TIME_MAGIC or (inode, device) != (st.st_ino, st.st_dev) or st.st_size < indexed_offset:
+            return None
+        if fingerprint(self.log_file, indexed_offset) != crc:
+            return None
+        for max_before, offset in _TIME_ENTRY.iter_unpack(data[_TIME_HEADER.size:]):
+            self.times.append(max_before)
+            self.offsets.append(offset)
+        return indexed_offset, max_time, last_minute, since_entry
+
+    def byte_range(self, start_time=None, end_time=None):
+        """Диапазон байт (start, end), в котором лежат все записи из [start_time, end_time]; end=None — до конца"""
+        start = 0
+        if start_time is not None:
+            position = bisect_left(self.times, to_epoch_us(start_time)) - 1
+            if position >= 0:
+                start = self.offsets[position]
+        end = None
+        if end_time is not None:
+            limit = to_epoch_us(end_time) + INDEX_SLACK_SECONDS * 1000000
+            position = bisect_right(self.times, limit)
+            if position < len(self.offsets):
+                end = self.offsets[position]
+        return start, end
+
+
+def iter_logs_between(file_path=EVENT_LOG_FILE, start_time=None, end_time=None, stats=None):
+    """Читает только ту часть журнала, где могут быть записи из [start_time, end_time]
+
+    Записи на краях диапазона могут выходить за границы — точная фильтрация остаётся за вызывающим.
+    """
+    if start_time is None and end_time is None:
+        yield from iter_records(file_path, stats=stats)
+        return
+    if is_binary_log(file_path):
+        # В бинарном журнале диапазон времени есть в заголовке каждого блока
+        yield from iter_binary_records(file_path, stats, start_time=start_time, end_time=end_time)
+        return
+    index = TimeIndex(file_path)
+    index.update()
+    start, end = index.byte_range(start_time, end_time)
+    yield from iter_records(file_path, stats=stats, start=start, end=end)
+
+
+# Инвертированный индекс по значениям полей хранится рядом с журналом
+INVERTED_INDEX_SUFFIX = ".iidx"
+INDEXED_FIELDS = ("event_type", "user", "source", "src_path")
+PATH_FIELD = "path"          # компоненты src_path индексируются как отдельные значения
+MAX_INDEX_BLOCKS = 32        # после стольких дописанных блоков индекс уплотняется в один
+
+# magic, inode, устройство, контрольная сумма начала журнала, резерв, проиндексированное смещение
+_INVERTED_HEADER = struct.Struct("<8sQQIIQ")
+_INVERTED_MAGIC = b"AUDIIDX3"  # версия 2: в заголовке число целых блоков; 3: разности в varint
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data, position):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _encode_postings(offsets):
+    """Смещения по возрастанию -> первое смещение и разности, все в varint
+
+    Разности не ограничены 32 битами: в многогигабайтном журнале соседние вхождения
+    редкого терма могут отстоять больше чем на 4 ГиБ.
+    """
+    out = bytearray()
+    _encode_varint(offsets[0], out)
+    for a, b in zip(offsets, offsets[1:]):
+        _encode_varint(b - a, out)
+    return out
+
+
+def _decode_postings(data):
+    offsets = []
+    position = 0
+    offset = 0
+    while position < len(data):
+        delta, position = _decode_varint(data, position)
+        offset += delta
+        offsets.append(offset)
+    return offsets
+
+
+def record_terms(record):
+    """Термы записи: (поле, значение) для индексируемых полей и компонентов пути"""
+    terms = set()
+    for field in INDEXED_FIELDS:
+        value = record.get(field)
+        if value is not None:
+            terms.add((field, str(value)))
+    path = record.get("src_path")
+    if isinstance(path, str):
+        for component in path.split("/"):
+            if component:
+                terms.add((PATH_FIELD, component))
+    return terms
+
+
+class InvertedIndex:
+    """Инвертированный индекс «значение поля -> смещения записей» со сжатыми списками
+
+    Индекс дописывается блоками только для новых строк журнала и периодически
+    уплотняется; при ротации или усечении журнала перестраивается с нуля.
+    """
+
+    def __init__(self, log_file=EVENT_LOG_FILE, index_file=None):
+        self.log_file = log_file
+        self.index_file = index_file or log_file + INVERTED_INDEX_SUFFIX
+        self.terms = {}  # (поле, значение) -> [сжатые разности смещений, ...] по блокам
+        self.indexed_offset = 0
+        self._data_end = _INVERTED_HEADER.size  # конец последнего учтённого блока в файле индекса
+
+    def update(self):
+        """Дочитывает журнал с последнего проиндексированного места; возвращает число новых записей"""
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            self.terms, self.indexed_offset = {}, 0
+            return 0
+
+        fd = os.open(self.index_file, os.O_RDWR | os.O_CREAT, 0o644)
+        with open(fd, "r+b") as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            blocks = self._read(index, st)
+            if blocks is None:
+                index.truncate(0)
+                index.write(bytes(_INVERTED_HEADER.size))  # место под заголовок
+                blocks = 0
+                self._data_end = _INVERTED_HEADER.size
+
+            new_postings = {}
+            records = 0
+            position = self.indexed_offset
+            with open(self.log_file, "rb") as log:
+                log.seek(position)
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        break  # строка ещё дописывается
+                    try:
+                        record = loads(line)
+                    except ValueError:
+                        record = None
+                    if isinstance(record, dict):
+                        for term in record_terms(record):
+                            new_postings.setdefault(term, []).append(position)
+                        records += 1
+                    position += len(line)
+
+            if new_postings:
+                chunks = {}
+                for term, offsets in new_postings.items():
+                    chunk = _encode_postings(offsets)
+                    self.terms.setdefault(term, []).append(chunk)
+                    chunks[term] = chunk
+                if blocks + 1 >= MAX_INDEX_BLOCKS:
+                    self._compact()
+                    index.seek(_INVERTED_HEADER.size)
+                    index.truncate()
+                    index.write(self._encode_block({term: chunks[0] for term, chunks in self.terms.items()}))
+                    blocks = 1
+                else:
+                    # Хвост после последнего учтённого блока (сбой до записи заголовка) затирается
+                    index.seek(self._data_end)
+                    index.truncate()
+                    index.write(self._encode_block(chunks))
+                    blocks += 1
+                self._data_end = index.tell()
+
+            # Заголовок пишется последним: блоки сверх его счётчика при чтении игнорируются,
+            # поэтому сбой между дописыванием блока и заголовком не дублирует смещения
+            index.seek(0)
+            index.write(_INVERTED_HEADER.pack(_INVERTED_MAGIC, st.st_ino, st.st_dev,
+                                              fingerprint(self.log_file, position), blocks, position))
+            self.indexed_offset = position
+        return records
+
+    def _compact(self):
+        """Склеивает блоки каждого терма в один"""
+        for term, chunks in self.terms.items():
+            if len(chunks) > 1:
+                offsets = []
+                for data in chunks:
+                    offsets.extend(_decode_postings(data))
+                self.terms[term] = [_encode_postings(offsets)]
+
+    @staticmethod
+    def _encode_block(chunks):
+        out = bytearray()
+        _encode_varint(len(chunks), out)
+        for (field, value), data in chunks.items():
+            for text in (field, value):
+                encoded = text.encode()
+                _encode_varint(len(encoded), out)
+                out += encoded
+            _encode_varint(len(data), out)
+            out += data
+        body = bytearray()
+        _encode_varint(len(out), body)
+        return bytes(body + out)
+
+    def _read(self, index, st):
+        """Загружает индекс; число блоков или None, если его нет, он повреждён или от другого файла"""
+        data = index.read()
+        self.terms, self.indexed_offset = {}, 0
+        if len(data) < _INVERTED_HEADER.size:
+            return None
+        magic, inode, device, crc, block_count, indexed_offset = _INVERTED_HEADER.unpack_from(data)
+        if magic != _INVERTED_MAGIC or (inode, device) != (st.st_ino, st.st_dev) or st.st_size < indexed_offset:
+            return None
+        if fingerprint(self.log_file, indexed_offset) != crc:
+            return None
+
+        blocks = 0
+        position = _INVERTED_HEADER.size
+        try:
+            while blocks < block_count:
+                length, position = _decode_varint(data, position)
+                block_end = position + length
+                if block_end > len(data):
+                    self.terms = {}
+                    return None  # учтённый в заголовке блок оборван: индекс повреждён
+                count, position = _decode_varint(data, position)
+                for _ in range(count):
+                    texts = []
+                    for _ in range(2):
+                        size, position = _decode_varint(data, position)
+                        texts.append(data[position:position + size].decode())
+                        position += size
+                    size, position = _decode_varint(data, position)
+                    chunk = data[position:position + size]
+                    position += size
+                    self.terms.setdefault(tuple(texts), []).append(chunk)
+                blocks += 1
+        except (IndexError, UnicodeDecodeError):
+            self.terms = {}
+            return None
+        self.indexed_offset = indexed_offset
+        self._data_end = position
+        return blocks
+
+    def postings(self, field, value):
+        """Отсортированные смещения записей с точным значением поля"""
+        offsets = []
+        for data in self.terms.get((field, value), ()):
+            offsets.extend(_decode_postings(data))
+        return offsets
+
+    def values(self, field):
+        """Все проиндексированные значения поля"""
+        return [value for term_field, value in self.terms if term_field == field]
+
+    def matching_postings(self, field, needle, substring=True):
+        """Смещения записей, где значение поля содержит needle (или равно ему при substring=False)"""
+        if not substring:
+            return self.postings(field, needle)
+        merged = set()
+        for value in self.values(field):
+            if needle in value:
+                merged.update(self.postings(field, value))
+        return sorted(merged)
+
+
+def intersect_postings(lists):
+    """Пересечение отсортированных списков смещений, начиная с самого короткого"""
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not result:
+            break
+        matched = []
+        position = 0
+        for offset in result:
+            position = bisect_left(other, offset, position)
+            if position == len(other):
+                break
+            if other[position] == offset:
+                matched.append(offset)
+        result = matched
+    return result
+
+
+def read_records_at(file_path, offsets):
+    """Читает записи журнала по смещениям строк"""
+    with open(file_path, "rb") as log:
+        for offset in offsets:
+            log.seek(offset)
+            try:
+                record = loads(log.readline())
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def search_log_file(file_path=EVENT_LOG_FILE, criteria=None, start_time=None, end_time=None, substring=True):
+    """Поиск по индексам: пересечение списков для всех критериев и ограничение по времени
+
+    criteria — {поле: значение}; при substring=True значение ищется как подстрока (как в окне журнала).
+    Без критериев читается весь журнал (или участок по индексу времени).
+    """
+    criteria = {field: value for field, value in (criteria or {}).items() if value}
+    if not criteria or is_binary_log(file_path):
+        # Индексы строятся по смещениям строк, поэтому бинарный журнал читается по блокам
+        yield from iter_logs_between(file_path, start_time, end_time)
+        return
+
+    index = InvertedIndex(file_path)
+    index.update()
+    offsets = intersect_postings([index.matching_postings(field, value, substring)
+                                  for field, value in criteria.items()])
+
+    if start_time is not None or end_time is not None:
+        time_index = TimeIndex(file_path)
+        time_index.update()
+        start, end = time_index.byte_range(start_time, end_time)
+        offsets = offsets[bisect_left(offsets, start):bisect_left(offsets, end) if end is not None else None]
+
+    yield from read_records_at(file_path, offsets)
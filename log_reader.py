@@ -0,0 +1,376 @@
+import os
+import gzip
+import json
+import zlib
+from datetime import datetime
+
+from binary_log import BINARY_MAGIC, read_file_records
+
+# Более быстрый декодер JSON, если он установлен
+try:
+    import orjson
+    loads = orjson.loads
+    JSON_DECODER = "orjson"
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+        JSON_DECODER = "ujson"
+    except ImportError:
+        loads = json.loads
+        JSON_DECODER = "json"
+
+
+# Константы
+EVENT_LOG_FILE = "event_log.json"
+ARCHIVE_DIR = "log_archive"        # Каталог ротированных журналов рядом с активным
+ARCHIVE_PATTERN = ("log_", ".log")  # log_<YYYYmmdd_HHMMSS>.log, см. log_rotator
+COMPRESSED_SUFFIX = ".gz"          # сжатые архивные сегменты: log_<...>.log.gz
+MANIFEST_FILE = "manifest.json"    # описание сегментов архива с диапазонами времени
+
+# Что делать со строкой, которую не удалось разобрать
+SKIP = "skip"              # пропустить и посчитать
+QUARANTINE = "quarantine"  # дописать строку в <журнал>.quarantine
+RAISE = "raise"            # прервать чтение с ошибкой
+
+# Сколько первых байт журнала хешируется, чтобы распознать подмену файла
+FINGERPRINT_BYTES = 256
+
+
+class ReadStats:
+    """Счётчики чтения журнала"""
+
+    def __init__(self):
+        self.files = 0
+        self.records = 0
+        self.malformed = 0
+        self.quarantined = 0
+        self.offset = 0  # позиция после последней полностью прочитанной строки текущего файла
+
+    def __repr__(self):
+        return (f"ReadStats(files={self.files}, records={self.records}, "
+                f"malformed={self.malformed}, quarantined={self.quarantined})")
+
+
+def open_log(file_path):
+    """Открывает журнал или архивный сегмент (.gz распаковывается на лету) для чтения байтов"""
+    if file_path.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(file_path, "rb")
+    return open(file_path, "rb")
+
+
+def iter_records(file_path=EVENT_LOG_FILE, on_error=SKIP, stats=None, start=0, end=None, follow=False):
+    """Лениво читает записи журнала построчно, начиная с байта start и до байта end
+
+    Повреждённые строки (например, оборванные при ротации) не прерывают чтение, а
+    обрабатываются согласно on_error. При follow=True незавершённая последняя строка
+    считается ещё дописываемой и оставляется до следующего чтения.
+    Бинарный журнал (см. binary_log) распознаётся по заголовку и читается поблочно;
+    тогда start, end и stats.offset — границы блоков.
+    """
+    if stats is None:
+        stats = ReadStats()
+    try:
+        file = open_log(file_path)
+    except FileNotFoundError:
+        return
+
+    with file:
+        stats.files += 1
+        yield from read_records(file, file_path, on_error, stats, start, end, follow)
+
+
+def read_records(file, file_path=EVENT_LOG_FILE, on_error=SKIP, stats=None, start=0, end=None, follow=False):
+    """То же, что iter_records, но из уже открытого файла (см. open_log)"""
+    if stats is None:
+        stats = ReadStats()
+    file.seek(0)
+    if file.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+        yield from read_file_records(file, start, end, stats, follow)
+        return
+    file.seek(start)
+    position = start
+    stats.offset = position
+
+    quarantine = None
+    try:
+        for line in file:
+            if end is not None and position >= end:
+                break
+            if not line.endswith(b"\n") and follow:
+                break
+            line_start = position
+            position += len(line)
+            stats.offset = position
+
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("record is not an object")
+            except ValueError as e:
+                stats.malformed += 1
+                if on_error == RAISE:
+                    raise ValueError(f"{file_path}: malformed record at byte {line_start}: {e}")
+                if on_error == QUARANTINE:
+                    if quarantine is None:
+                        quarantine = open(file_path + ".quarantine", "ab")
+                    quarantine.write(line + b"\n")
+                    stats.quarantined += 1
+                continue
+
+            stats.records += 1
+            yield record
+    finally:
+        if quarantine is not None:
+            quarantine.close()
+
+
+def fingerprint(file_path, length):
+    """Контрольная сумма первых байт файла (не больше FINGERPRINT_BYTES); для .gz — распакованных"""
+    with open_log(file_path) as file:
+        return fingerprint_file(file, length)
+
+
+def fingerprint_file(file, length):
+    """fingerprint для уже открытого файла; позиция чтения сохраняется"""
+    position = file.tell()
+    file.seek(0)
+    checksum = zlib.crc32(file.read(min(length, FINGERPRINT_BYTES)))
+    file.seek(position)
+    return checksum
+
+
+def default_archive_dir(file_path=EVENT_LOG_FILE):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), ARCHIVE_DIR)
+
+
+def load_manifest(archive_dir):
+    """Сегменты архива из manifest.json: имя файла -> описание; пустой словарь, если манифеста нет"""
+    try:
+        with open(os.path.join(archive_dir, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            return {segment["file"]: segment for segment in json.load(file)["segments"]}
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def _overlaps(segment, start_time, end_time):
+    """Может ли сегмент содержать записи из [start_time, end_time]; без диапазона — может"""
+    try:
+        if start_time is not None and datetime.fromisoformat(segment["last"]) < start_time:
+            return False
+        if end_time is not None and datetime.fromisoformat(segment["first"]) > end_time:
+            return False
+    except (KeyError, TypeError, ValueError):
+        pass
+    return True
+
+
+def archive_files(file_path=EVENT_LOG_FILE, archive_dir=None, start_time=None, end_time=None):
+    """Ротированные файлы журнала от старых к новым
+
+    Если задан диапазон времени, сегменты, которые по манифесту в него не попадают, пропускаются.
+    """
+    if archive_dir is None:
+        archive_dir = default_archive_dir(file_path)
+    try:
+        names = os.listdir(archive_dir)
+    except FileNotFoundError:
+        return []
+    prefix, suffix = ARCHIVE_PATTERN
+    segments = {}
+    for name in names:
+        base = name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name
+        if base.startswith(prefix) and base.endswith(suffix):
+            # Пока сегмент сжимается, на миг существуют оба файла; сжатый уже полный
+            if base not in segments or name != base:
+                segments[base] = name
+
+    manifest = load_manifest(archive_dir) if start_time is not None or end_time is not None else {}
+    # Имена содержат время ротации, поэтому сортировка по имени хронологическая
+    return [os.path.join(archive_dir, segments[base]) for base in sorted(segments)
+            if segments[base] not in manifest or _overlaps(manifest[segments[base]], start_time, end_time)]
+
+
+def find_archived_segment(file_path, inode, device, head=None, archive_dir=None):
+    """Архивный сегмент, в который был переименован журнал с данным inode (в том числе уже сжатый)
+
+    После сжатия inode исходного файла освобождается и может достаться новому файлу, поэтому
+    head=(длина, контрольная сумма) дополнительно сверяет начало сегмента (см. fingerprint).
+    Поиск идёт от новых сегментов к старым.
+    """
+    if archive_dir is None:
+        archive_dir = default_archive_dir(file_path)
+    for path in reversed(archive_files(file_path, archive_dir)):
+        # Несжатый сегмент могут сжать прямо во время проверки; тогда он уже есть как .gz
+        candidates = [path] if path.endswith(COMPRESSED_SUFFIX) else [path, path + COMPRESSED_SUFFIX]
+        for candidate in candidates:
+            try:
+                if segment_identity(candidate, load_manifest(archive_dir)) != (inode, device):
+                    continue
+                if head is None or fingerprint(candidate, head[0]) == head[1]:
+                    return candidate
+            except (OSError, EOFError):
+                continue
+    return None
+
+
+def segment_identity(path, manifest):
+    """(inode, устройство) исходного файла сегмента; для сжатого — из манифеста"""
+    if path.endswith(COMPRESSED_SUFFIX):
+        segment = manifest.get(os.path.basename(path), {})
+        return segment.get("inode"), segment.get("device")
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_dev
+
+
+def log_files(file_path=EVENT_LOG_FILE, include_archives=False, archive_dir=None, start_time=None, end_time=None):
+    """Файлы журнала в хронологическом порядке: архивы (если нужно), затем активный"""
+    files = archive_files(file_path, archive_dir, start_time, end_time) if include_archives else []
+    files.append(file_path)
+    return files
+
+
+def iter_logs(file_path=EVENT_LOG_FILE, include_archives=False, on_error=SKIP, stats=None, archive_dir=None,
+              start_time=None, end_time=None):
+    """Лениво читает записи из активного журнала и, при необходимости, из архивов
+
+    start_time/end_time только отсекают архивы по манифесту; точная фильтрация — за вызывающим.
+    """
+    if stats is None:
+        stats = ReadStats()
+    for path in log_files(file_path, include_archives, archive_dir, start_time, end_time):
+        yield from iter_records(path, on_error=on_error, stats=stats)
+
+
+class LogTailer:
+    """Чтение только новых строк активного журнала, переживающее ротацию и усечение файла"""
+
+    def __init__(self, file_path=EVENT_LOG_FILE, from_end=True, on_error=SKIP):
+        self.file_path = file_path
+        self.on_error = on_error
+        self.stats = ReadStats()
+        self._file = None
+        self._pending = b""  # начало ещё не дописанной строки
+        self._open(seek_end=from_end)
+
+    def _open(self, seek_end=False):
+        try:
+            self._file = open(self.file_path, "rb")
+        except FileNotFoundError:
+            self._file = None
+            return
+        if seek_end:
+            self._file.seek(0, os.SEEK_END)
+        self._pending = b""
+        self._binary = None  # формат станет известен, когда в файле появится заголовок
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def position(self):
+        """(inode, устройство, смещение) конца последней прочитанной записи; None — файла нет"""
+        if self._file is None:
+            return None
+        st = os.fstat(self._file.fileno())
+        return st.st_ino, st.st_dev, self._file.tell() - len(self._pending)
+
+    def resume(self, inode, device, offset):
+        """Продолжает чтение с позиции, сохранённой через position()
+
+        Если журнал за это время ротирован или подменён, чтение начинается с начала нового
+        файла и возвращается False: хвост старого надо искать в архиве (find_archived_segment).
+        """
+        if self._file is None:
+            self._open()
+            if self._file is None:
+                return False
+        st = os.fstat(self._file.fileno())
+        same_file = (st.st_ino, st.st_dev) == (inode, device) and st.st_size >= offset
+        self._file.seek(offset if same_file else 0)
+        self._pending = b""
+        self._binary = None
+        return same_file
+
+    def _detect_format(self):
+        position = self._file.tell()
+        self._file.seek(0)
+        head = self._file.read(len(BINARY_MAGIC))
+        self._file.seek(position)
+        if len(head) == len(BINARY_MAGIC) or not BINARY_MAGIC.startswith(head):
+            self._binary = head == BINARY_MAGIC
+
+    def _read_records(self, max_bytes):
+        if self._binary is None:
+            self._detect_format()
+            if self._binary is None:
+                return []
+        if self._binary:
+            # Бинарный журнал читается целыми блоками; оборванный блок ждёт следующего вызова
+            records = list(read_file_records(self._file, self._file.tell(), stats=self.stats, follow=True))
+            self._file.seek(self.stats.offset)
+            return records
+        return self._decode(self._read(max_bytes))
+
+    def _read(self, max_bytes):
+        data = self._file.read(max_bytes)
+        if not data:
+            return []
+        data = self._pending + data
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        return lines
+
+    def _decode(self, lines):
+        records = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("record is not an object")
+            except ValueError:
+                self.stats.malformed += 1
+                if self.on_error == RAISE:
+                    raise
+                continue
+            self.stats.records += 1
+            records.append(record)
+        return records
+
+    def poll(self, max_bytes=1024 * 1024):
+        """Новые записи с прошлого вызова (не больше max_bytes за раз)"""
+        if self._file is None:
+            self._open()
+            if self._file is None:
+                return []
+
+        records = self._read_records(max_bytes)
+        if not records:
+            try:
+                st = os.stat(self.file_path)
+            except FileNotFoundError:
+                return []  # журнал переименован, новый ещё не создан
+            current = os.fstat(self._file.fileno())
+            if (st.st_ino, st.st_dev) != (current.st_ino, current.st_dev):
+                # Ротация: старый файл дочитан, переходим на новый с начала
+                self.close()
+                self._open()
+                if self._file is not None:
+                    records = self._read_records(max_bytes)
+            elif st.st_size < self._file.tell():
+                # Усечение: читаем файл заново с начала
+                self._file.seek(0)
+                self._pending = b""
+                self._binary = None
+                records = self._read_records(max_bytes)
+        return records
@@ -1,24 +1,263 @@
 import os
-import shutil
+import json
 import time
+import gzip
+import queue
+import shutil
+import threading
+from datetime import datetime, timedelta
+from log_reader import (
+    ARCHIVE_PATTERN,
+    COMPRESSED_SUFFIX,
+    MANIFEST_FILE,
+    default_archive_dir,
+    iter_records,
+    load_manifest,
+)
 
 LOG_FILE = '/home/akpchelkova/audi/event_log.json'
 ARCHIVE_DIR = '/home/akpchelkova/audi/log_archive/'
 MAX_SIZE = 10 * 1024 * 1024  # 10MB, например
+MAX_AGE_SECONDS = 24 * 60 * 60      # Ротация не реже раза в сутки (0 — только по размеру)
+RETENTION_DAYS = 90                 # Сегменты старше удаляются (0 — не удалять по возрасту)
+RETENTION_BYTES = 1024 ** 3         # Общий размер архива (0 — без ограничения)
+HANDOFF_GRACE_SECONDS = 5           # Сколько ждать, пока логгер заметит внешнюю ротацию
+
+
+class LogRotator:
+    """Ротация журнала: переименование по размеру или возрасту, сжатие в фоне, хранение и манифест
+
+    Переименование выполняет сама нить записи (EventWriter) между пачками событий, поэтому
+    ни одно событие не теряется и не обрывается. Закрытые сегменты сжимаются отдельной нитью,
+    после чего манифест архива пополняется диапазоном времени сегмента и применяются правила хранения.
+    """
+
+    def __init__(self, log_file=LOG_FILE, archive_dir=None, max_bytes=MAX_SIZE, max_age=MAX_AGE_SECONDS,
+                 retention_days=RETENTION_DAYS, retention_bytes=RETENTION_BYTES, compress=True):
+        self.log_file = log_file
+        self.archive_dir = archive_dir or default_archive_dir(log_file)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        self.compress = compress
+
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+
+        # Счётчики
+        self.rotations = 0
+        self.compressed = 0
+        self.removed = 0
+
+    # Ротация (вызывается нитью записи)
+
+    def due(self, size, opened_at):
+        """Пора ли ротировать сегмент данного размера, открытый в момент opened_at (time.time())"""
+        if not size:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - opened_at >= self.max_age
+
+    def _archive_name(self):
+        prefix, suffix = ARCHIVE_PATTERN
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        name = f"{prefix}{stamp}{suffix}"
+        attempt = 0
+        # Несколько ротаций в одну секунду: log_<время>_001.log сортируется после log_<время>.log
+        while any(os.path.exists(os.path.join(self.archive_dir, candidate))
+                  for candidate in (name, name + COMPRESSED_SUFFIX)):
+            attempt += 1
+            name = f"{prefix}{stamp}_{attempt:03d}{suffix}"
+        return os.path.join(self.archive_dir, name)
+
+    def rotate(self, delay=0):
+        """Переименовывает активный журнал в архивный сегмент и ставит его в очередь на сжатие
+
+        Файл должен быть закрыт (или дописан и больше не использоваться) вызывающим; delay
+        откладывает сжатие, если в файл ещё может писать другой процесс.
+        Возвращает путь сегмента или None, если журнала нет.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive_path = self._archive_name()
+        try:
+            os.rename(self.log_file, archive_path)
+        except FileNotFoundError:
+            return None
+        self.rotations += 1
+        print(f"Лог файл ротацирован: {archive_path}")
+        self.schedule(archive_path, delay)
+        return archive_path
+
+    # Фоновая обработка сегментов
+
+    def schedule(self, path, delay=0):
+        """Ставит закрытый сегмент в очередь на сжатие и применение правил хранения"""
+        self._ensure_started()
+        self._jobs.put((path, time.monotonic() + delay))
+
+    def recover(self):
+        """Досжимает сегменты, оставшиеся несжатыми (прерванная работа или старая ротация)"""
+        prefix, suffix = ARCHIVE_PATTERN
+        try:
+            names = sorted(os.listdir(self.archive_dir))
+        except FileNotFoundError:
+            return 0
+        pending = [name for name in names if name.startswith(prefix) and name.endswith(suffix)]
+        for name in pending:
+            self.schedule(os.path.join(self.archive_dir, name))
+        return len(pending)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="log-rotator", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def close(self, timeout=None):
+        """Дожидается обработки уже закрытых сегментов и останавливает фоновую нить"""
+        if self._thread is None:
+            return
+        self._jobs.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            path, not_before = job
+            delay = not_before - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.archive_segment(path)
+            except OSError as e:
+                print(f"Не удалось обработать сегмент {path}: {e}")
+
+    def archive_segment(self, path):
+        """Сжимает сегмент, дописывает его в манифест и применяет правила хранения"""
+        if not os.path.exists(path):
+            return None
+        st = os.stat(path)
+        segment = {"inode": st.st_ino, "device": st.st_dev}
+        segment.update(self._time_range(path))
+
+        if not self.compress or path.endswith(COMPRESSED_SUFFIX):
+            segment["file"] = os.path.basename(path)
+            segment["bytes"] = os.path.getsize(path)
+            self._add_to_manifest(segment)
+            return path
+
+        # Порядок важен для читателей (report_generator ищет сегмент по inode из манифеста):
+        # полный .gz.tmp, запись в манифест, атомарное появление .gz, удаление исходного файла
+        target = path + COMPRESSED_SUFFIX
+        with open(path, "rb") as source, gzip.open(target + ".tmp", "wb") as compressed:
+            shutil.copyfileobj(source, compressed, 1024 * 1024)
+        segment["file"] = os.path.basename(target)
+        segment["bytes"] = os.path.getsize(target + ".tmp")
+        self._add_to_manifest(segment)
+        os.replace(target + ".tmp", target)
+        os.remove(path)
+        self.compressed += 1
+        return target
+
+    def _add_to_manifest(self, segment):
+        with self._manifest_lock:
+            segments = load_manifest(self.archive_dir)
+            segments[segment["file"]] = segment
+            if segment["file"].endswith(COMPRESSED_SUFFIX):
+                segments.pop(segment["file"][:-len(COMPRESSED_SUFFIX)], None)
+            self._apply_retention(segments)
+            self._save_manifest(segments)
+
+    @staticmethod
+    def _time_range(path):
+        first = last = None
+        records = 0
+        for record in iter_records(path):
+            records += 1
+            try:
+                timestamp = datetime.fromisoformat(record["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if first is None or timestamp < first:
+                first = timestamp
+            if last is None or timestamp > last:
+                last = timestamp
+        return {
+            "first": first.isoformat() if first else None,
+            "last": last.isoformat() if last else None,
+            "records": records,
+        }
+
+    # Хранение
+
+    def _apply_retention(self, segments):
+        """Удаляет сегменты старше retention_days и самые старые сверх retention_bytes"""
+        names = sorted(segments)  # от старых к новым
+        expired = set()
+        if self.retention_days:
+            cutoff = datetime.now() - timedelta(days=self.retention_days)
+            for name in names:
+                last = segments[name].get("last")
+                try:
+                    if last and datetime.fromisoformat(last) < cutoff:
+                        expired.add(name)
+                except ValueError:
+                    pass
+        if self.retention_bytes:
+            total = sum(segments[name].get("bytes", 0) for name in names if name not in expired)
+            for name in names:
+                if total <= self.retention_bytes:
+                    break
+                if name not in expired:
+                    expired.add(name)
+                    total -= segments[name].get("bytes", 0)
+
+        for name in expired:
+            try:
+                os.remove(os.path.join(self.archive_dir, name))
+            except FileNotFoundError:
+                pass
+            del segments[name]
+            self.removed += 1
+
+    def _save_manifest(self, segments):
+        manifest_path = os.path.join(self.archive_dir, MANIFEST_FILE)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"segments": [segments[name] for name in sorted(segments)]}, file, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def stats(self):
+        return {
+            "rotations": self.rotations,
+            "compressed": self.compressed,
+            "removed": self.removed,
+            "pending": self._jobs.qsize(),
+        }
+
 
 def rotate_logs():
+    """Разовая ротация снаружи работающего логгера
+
+    Логгер замечает переименование по смене inode и открывает новый файл сам; сжатие
+    откладывается на HANDOFF_GRACE_SECONDS, чтобы последние события успели попасть в сегмент.
+    """
+    rotator = LogRotator(LOG_FILE, ARCHIVE_DIR)
+    rotator.recover()
     # Проверяем размер лог-файла
-    if os.path.getsize(LOG_FILE) >= MAX_SIZE:
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        archive_name = f"{ARCHIVE_DIR}log_{timestamp}.log"
-        
-        # Архивируем текущий лог
-        shutil.move(LOG_FILE, archive_name)
-        
-        # Создаем новый пустой лог файл
-        with open(LOG_FILE, 'w') as f:
-            pass
-        print(f"Лог файл ротацирован: {archive_name}")
-
-# Вызов функции
-rotate_logs()
+    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) >= MAX_SIZE:
+        rotator.rotate(delay=HANDOFF_GRACE_SECONDS)
+    rotator.close()
+
+
+if __name__ == "__main__":
+    rotate_logs()
@@ -0,0 +1,411 @@
+import os
+import sys
+import json
+import time
+import bisect
+import signal
+import threading
+import traceback
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Границы корзин гистограмм по умолчанию, с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_HOST = "127.0.0.1"   # Эндпоинт слушает только локальный интерфейс
+METRICS_PORT = 9464
+STATS_INTERVAL = 60          # Период записи файла статистики, с
+PROFILE_SECONDS = 10         # Длительность одного снятия профиля, с
+PROFILE_INTERVAL = 0.005     # Период выборки стеков, с
+PROFILE_MAX_DEPTH = 64
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _label_key(names, values):
+    return ",".join(f"{name}={value}" for name, value in zip(names, values)) or "total"
+
+
+# Метрики
+
+class Counter:
+    """Монотонный счётчик с метками; значения меток передаются позиционно"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def inc_many(self, counts):
+        """Прибавляет сразу несколько значений: {значение метки (или кортеж значений): количество}"""
+        with self._lock:
+            for key, amount in counts.items():
+                key = key if isinstance(key, tuple) else (key,)
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return {_label_key(self.labels, key): value for key, value in items}
+
+
+class Gauge:
+    """Мгновенное значение, вычисляемое при чтении: function() -> число или {значения меток: число}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, function, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+
+    def _items(self):
+        value = self.function()
+        if isinstance(value, dict):
+            return sorted((key if isinstance(key, tuple) else (key,), item) for key, item in value.items())
+        return [((), value)]
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self._items()]
+
+    def snapshot(self):
+        return {_label_key(self.labels, key): value for key, value in self._items()}
+
+
+class Histogram:
+    """Распределение значений по фиксированным корзинам (как гистограммы Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # значения меток -> [счётчики корзин..., +Inf], сумма, количество
+        self._lock = threading.Lock()
+
+    def _get(self, label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._get(label_values)
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_many(self, values, *label_values):
+        """Учитывает пачку значений под одной блокировкой"""
+        buckets = self.buckets
+        with self._lock:
+            series = self._get(label_values)
+            counts = series[0]
+            for value in values:
+                counts[bisect.bisect_left(buckets, value)] += 1
+                series[1] += value
+            series[2] += len(values)
+
+    def _items(self):
+        with self._lock:
+            return sorted((key, (list(counts), total, count))
+                          for key, (counts, total, count) in self._series.items())
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in self._items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                labels = _format_labels(self.labels, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def snapshot(self):
+        result = {}
+        for key, (counts, total, count) in self._items():
+            result[_label_key(self.labels, key)] = {
+                "count": count,
+                "sum": total,
+                "buckets": {_format_value(float(bound)): bucket
+                            for bound, bucket in zip(self.buckets + (float("inf"),), counts) if bucket},
+            }
+        return result
+
+
+class Registry:
+    """Набор метрик процесса: текст Prometheus и снимок для файла статистики"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        # Повторная регистрация имени заменяет метрику (например, gauge нового писателя)
+        with self._lock:
+            self._metrics = [old for old in self._metrics if old.name != metric.name]
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, function, labels=()):
+        return self._add(Gauge(name, help, function, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in list(self._metrics)}
+
+
+class LoggerMetrics:
+    """Метрики one_file_logger: счётчики по источникам, задержка записи, очередь и шаги циклов мониторов"""
+
+    def __init__(self, registry=None):
+        registry = self.registry = registry or Registry()
+        self.seen = registry.counter("audit_events_seen_total", "Events reported by the monitors", ("source",))
+        self.excluded = registry.counter("audit_events_excluded_total", "Events dropped by exclusion rules",
+                                         ("source",))
+        self.dropped = registry.counter("audit_events_dropped_total", "Events dropped on a full writer queue",
+                                        ("source",))
+        self.written = registry.counter("audit_events_written_total", "Events written to the log", ("source",))
+        self.write_latency = registry.histogram("audit_write_latency_seconds",
+                                                "Time from log_event to the write of the event")
+        self.flush_duration = registry.histogram("audit_flush_seconds", "Duration of a log flush")
+        self.tick_duration = registry.histogram("audit_loop_tick_seconds", "Wall time of one monitor loop step",
+                                                ("loop",))
+        self.tick_cpu = registry.counter("audit_loop_cpu_seconds_total", "Thread CPU time of the monitor loops",
+                                         ("loop",))
+
+    def tick_recorder(self, loop):
+        """Обработчик on_tick(длительность, CPU) для цикла монитора loop"""
+        def record(duration, cpu_time):
+            self.tick_duration.observe(duration, loop)
+            self.tick_cpu.inc(loop, amount=cpu_time)
+        return record
+
+    def watch_writer(self, writer):
+        """Глубина очереди и счётчики EventWriter как мгновенные значения"""
+        self.registry.gauge("audit_queue_depth", "Events waiting in the writer queue", writer.queue_depth)
+        self.registry.gauge("audit_writer", "EventWriter counters",
+                            lambda: {key: value for key, value in writer.stats().items() if key != "queue_depth"},
+                            ("counter",))
+
+    def watch_tree(self, watcher):
+        """Сводка tree_watcher.TreeWatcher: наблюдаемые каталоги, обход, лимиты и память"""
+        self.registry.gauge("audit_file_monitor", "File monitor registration and scan statistics",
+                            lambda: {key: value for key, value in watcher.stats().items()
+                                     if isinstance(value, (int, float))},
+                            ("stat",))
+
+
+    def watch_cache(self, cache):
+        """Попадания и промахи pid_cache.ProcessCache"""
+        self.registry.gauge("audit_pid_cache", "Process info cache statistics",
+                            lambda: {key: value for key, value in cache.stats().items()
+                                     if isinstance(value, (int, float))},
+                            ("stat",))
+
+
+# Публикация: HTTP эндпоинт и периодический файл статистики
+
+class MetricsServer:
+    """GET /metrics в текстовом формате Prometheus из отдельной нити"""
+
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # запросы не засоряют вывод логгера
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StatsFileWriter:
+    """Раз в interval секунд атомарно переписывает JSON-файл со снимком метрик"""
+
+    def __init__(self, registry, path, interval=STATS_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-stats", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"timestamp": time.time(), "pid": os.getpid(), "metrics": self.registry.snapshot()}, file,
+                      indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Не удалось записать статистику {self.path}: {e}")
+
+    def close(self):
+        """Останавливает нить и записывает последний снимок"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        try:
+            self.write()
+        except OSError:
+            pass
+
+
+# Профилировщик по сигналу
+
+class SamplingProfiler:
+    """Выборочный профилировщик: по сигналу в течение duration секунд снимает стеки всех нитей
+
+    Результат — файл в формате свёрнутых стеков (нить;внешняя функция;...;внутренняя количество),
+    который понимают flamegraph.pl и speedscope; в начало файла выводятся самые частые вершины стеков.
+    """
+
+    def __init__(self, output_prefix, duration=PROFILE_SECONDS, interval=PROFILE_INTERVAL,
+                 max_depth=PROFILE_MAX_DEPTH):
+        self.output_prefix = output_prefix
+        self.duration = duration
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def install(self, signum=None):
+        """Регистрирует обработчик сигнала (по умолчанию SIGUSR1); вызывать из главной нити"""
+        signum = signum or signal.SIGUSR1
+        signal.signal(signum, lambda received, frame: self.start())
+        return self
+
+    def start(self):
+        """Запускает снятие профиля, если оно ещё не идёт; сам обработчик сигнала ничего не ждёт"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return True
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def sample(self, duration=None):
+        """Снимает стеки в течение duration секунд; возвращает Counter {свёрнутый стек: выборок}"""
+        me = threading.get_ident()
+        stacks = collections.Counter()
+        deadline = time.monotonic() + (self.duration if duration is None else duration)
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[f"{names.get(ident, ident)};{self._stack(frame)}"] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    def dump(self, stacks):
+        path = f"{self.output_prefix}{time.strftime('%Y%m%d_%H%M%S')}.txt"
+        leaves = collections.Counter()
+        for stack, count in stacks.items():
+            thread, _, frames = stack.partition(";")
+            leaves[f"{thread}: {frames.rsplit(';', 1)[-1]}"] += count
+        total = sum(stacks.values()) or 1
+        with open(path, "w", encoding="utf-8") as file:
+            for leaf, count in leaves.most_common(20):
+                file.write(f"# {100.0 * count / total:5.1f}% {leaf}\n")
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self):
+        try:
+            path = self.dump(self.sample())
+            print(f"Профиль записан: {path}")
+        except Exception:
+            traceback.print_exc()
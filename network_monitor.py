@@ -0,0 +1,161 @@
+import os
+import time
+import socket
+from functools import lru_cache
+from process_monitor import read_start_time
+
+
+# Константы
+PROC_DIR = "/proc"
+PROC_NET_FILES = {
+    "tcp": ("/proc/net/tcp", socket.AF_INET),
+    "tcp6": ("/proc/net/tcp6", socket.AF_INET6),
+    "udp": ("/proc/net/udp", socket.AF_INET),
+    "udp6": ("/proc/net/udp6", socket.AF_INET6),
+}
+
+# Состояния TCP из include/net/tcp_states.h (названия как в psutil)
+TCP_STATES = {
+    b"01": "ESTABLISHED",
+    b"02": "SYN_SENT",
+    b"03": "SYN_RECV",
+    b"04": "FIN_WAIT1",
+    b"05": "FIN_WAIT2",
+    b"06": "TIME_WAIT",
+    b"07": "CLOSE",
+    b"08": "CLOSE_WAIT",
+    b"09": "LAST_ACK",
+    b"0A": "LISTEN",
+    b"0B": "CLOSING",
+    b"0C": "NEW_SYN_RECV",
+}
+
+
+@lru_cache(maxsize=65536)
+def decode_address(raw, family):
+    """Преобразует адрес из /proc/net ("0100007F:0016") в {"ip", "port"}; None для нулевого адреса"""
+    ip_hex, port_hex = raw.split(b":")
+    port = int(port_hex, 16)
+    packed = bytes.fromhex(ip_hex.decode())
+    # Ядро печатает адрес как последовательность 32-битных слов в порядке байт хоста
+    packed = b"".join(packed[i:i + 4][::-1] for i in range(0, len(packed), 4))
+    if port == 0 and not any(packed):
+        return None
+    return {"ip": socket.inet_ntop(family, packed), "port": port}
+
+
+def read_sockets(protocols=PROC_NET_FILES):
+    """Читает таблицы сокетов: (proto, laddr, raddr, inode) -> состояние"""
+    sockets = {}
+    for proto in protocols:
+        path = PROC_NET_FILES[proto][0]
+        try:
+            with open(path, "rb") as file:
+                lines = file.read().split(b"\n")[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            # laddr/raddr остаются в сыром виде и декодируются только для изменившихся сокетов
+            sockets[(proto, fields[1], fields[2], fields[9])] = fields[3]
+    return sockets
+
+
+def find_socket_pids(inodes):
+    """Находит pid владельцев сокетов по их inode через /proc/<pid>/fd"""
+    wanted = {f"socket:[{int(inode)}]" for inode in inodes if inode not in (b"0", 0)}
+    owners = {}
+    if not wanted:
+        return owners
+    for name in os.listdir(PROC_DIR):
+        if not name.isdigit():
+            continue
+        fd_dir = f"{PROC_DIR}/{name}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if link in wanted:
+                owners[int(link[8:-1])] = int(name)
+                wanted.discard(link)
+                if not wanted:
+                    return owners
+    return owners
+
+
+class NetworkMonitor:
+    """Сравнение таблиц сокетов из /proc/net за O(n) на шаг"""
+
+    def __init__(self, on_event, protocols=tuple(PROC_NET_FILES), attribute_pids=False, on_tick=None):
+        self.on_event = on_event  # on_event(event_type, local_address, remote_address, status, pid, start_time)
+        self.on_tick = on_tick    # on_tick(длительность шага, CPU шага) или None
+        self.protocols = protocols
+        self.attribute_pids = attribute_pids
+        self.owners = {}  # inode -> (pid, время старта) владельца, найденные при открытии (для события закрытия)
+        self.previous = read_sockets(self.protocols)
+        self.ticks = 0
+        self.events = 0
+        self.cpu_time = 0.0
+
+    def _emit(self, event_type, sockets, states, owners):
+        for key in sockets:
+            proto, laddr, raddr, inode = key
+            family = PROC_NET_FILES[proto][1]
+            status = TCP_STATES.get(states[key], "UNKNOWN") if proto.startswith("tcp") else "NONE"
+            pid, start_time = owners.get(int(inode), (None, None))
+            self.on_event(event_type, decode_address(laddr, family), decode_address(raddr, family),
+                          status, pid, start_time)
+
+    def poll(self):
+        """Один шаг: новые и закрытые соединения; возвращает число событий"""
+        started = time.perf_counter()
+        cpu_before = time.thread_time()
+        current = read_sockets(self.protocols)
+        new_sockets = current.keys() - self.previous.keys()
+        closed_sockets = self.previous.keys() - current.keys()
+
+        owners = {}
+        if self.attribute_pids and new_sockets:
+            # Время старта отличает владельца от процесса, позже получившего тот же pid
+            owners = {inode: (pid, read_start_time(pid))
+                      for inode, pid in find_socket_pids(key[3] for key in new_sockets).items()}
+            self.owners.update(owners)
+        closed_owners = {}
+        if self.owners:
+            for key in closed_sockets:
+                owner = self.owners.pop(int(key[3]), None)
+                if owner is not None:
+                    closed_owners[int(key[3])] = owner
+
+        self._emit("New connection", new_sockets, current, owners)
+        self._emit("Closed connection", closed_sockets, self.previous, closed_owners)
+
+        self.previous = current
+        changes = len(new_sockets) + len(closed_sockets)
+        self.ticks += 1
+        self.events += changes
+        cpu_time = time.thread_time() - cpu_before
+        self.cpu_time += cpu_time
+        if self.on_tick is not None:
+            self.on_tick(time.perf_counter() - started, cpu_time)
+        return changes
+
+    def run(self, interval=1.0, stop_event=None):
+        """Цикл мониторинга до установки stop_event"""
+        while stop_event is None or not stop_event.is_set():
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+            self.poll()
+
+    def stats(self):
+        """Собственные затраты монитора"""
+        return {"ticks": self.ticks, "events": self.events, "cpu_time": self.cpu_time}
@@ -1,67 +1,185 @@
 import os
-import json
+import sys
 import time
-import psutil
+import signal
+import asyncio
+import argparse
+import atexit
+import threading
 from datetime import datetime
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from concurrent.futures import ThreadPoolExecutor
+from event_writer import EventWriter, BLOCK, JSON_FORMAT, LOG_FORMATS
+from path_filter import load_path_filter
+from process_monitor import create_process_backend
+from network_monitor import NetworkMonitor
+from log_rotator import LogRotator
+from metrics import LoggerMetrics, MetricsServer, SamplingProfiler, StatsFileWriter
+from tree_watcher import TreeWatcher
+from pid_cache import ProcessCache
 
 
 # Константы
 EVENT_LOG_FILE = "event_log.json"  # Общий журнал событий
-
-
-
-# Хранилище последних событий для файлов
-recent_events = set()
+ARCHIVE_DIR = "log_archive"        # Каталог ротированных журналов (рядом с журналом)
+REPORT_DIR = "/home/akpchelkova/audi"  # Каталог, куда report_generator пишет отчёты
+REPORT_FILES = (
+    "event_log_report.txt",
+    "event_type_report.png",
+    "user_activity_report.png",
+    "weekday_distribution.png",
+    "event_log_report.html",
+    ".chart_cache.json",
+)
+
+# Мониторинг процессов
+PROCESS_BACKEND = "auto"          # proc / netlink / auto (netlink при запуске от root)
+PROCESS_SCAN_MIN_INTERVAL = 0.2   # Интервал сканирования /proc при активности, с
+PROCESS_SCAN_MAX_INTERVAL = 2.0   # ...и в простое, с
+PROCESS_STATS_INTERVAL = 60       # Как часто печатать собственные затраты CPU, с
+PID_CACHE_SIZE = 65536            # Процессов в кэше сведений (LRU)
+PID_CACHE_TTL = 300               # Сколько помнить завершившийся процесс (для атрибуции соединений), с
+
+# Мониторинг сети
+NETWORK_POLL_INTERVAL = 1.0       # Период сравнения таблиц сокетов, с
+NETWORK_ATTRIBUTE_PIDS = False    # Определять pid владельца для новых соединений (обход /proc/*/fd)
+
+# Правила исключения путей (по одному на строку, см. path_filter.PathFilter)
+EXCLUDE_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exclusions.conf")
+
+# Изменения одного пути в пределах окна склеиваются в одну запись (0 — выключено)
+DEBOUNCE_WINDOW_MS = 500
+
+# Наблюдение за деревьями каталогов (см. tree_watcher.TreeWatcher)
+WATCH_WORKERS = 4     # Нитей параллельной регистрации поддеревьев
+SCAN_INTERVAL = 60    # Период обхода поддеревьев, не поместившихся в max_user_watches, с
+
+# Настройки фоновой записи журнала
+WRITER_QUEUE_SIZE = 10000   # Максимум событий, ожидающих записи
+WRITER_BATCH_SIZE = 500     # Максимум событий в одной пачке записи
+FLUSH_EVERY_EVENTS = 1000   # Сброс буфера на диск каждые N событий
+FLUSH_INTERVAL_MS = 1000    # ...или каждые T миллисекунд
+FSYNC_ON_FLUSH = False      # Вызывать ли fsync при каждом сбросе (при остановке fsync выполняется всегда)
+QUIET_MODE = False          # Не печатать каждое событие в консоль
+QUEUE_FULL_POLICY = BLOCK   # block / drop_oldest / drop_newest
+
+# Обратное давление в демоне: мониторы ждут, пока очередь писателя не опустится ниже порога
+BACKPRESSURE_QUEUE_DEPTH = WRITER_QUEUE_SIZE * 3 // 4
+BACKPRESSURE_WAIT = 0.01    # Пауза между проверками, с
+FILE_EVENT_BACKLOG = 10000  # Событий watchdog, ожидающих цикла asyncio; дальше ждёт нить наблюдателя
+# json — JSON-строки; binary — сжатые блоки (binary_log). Читатели распознают формат сами,
+# поэтому имя журнала не меняется; преобразование: python binary_log.py to-json|to-binary
+LOG_FORMAT = JSON_FORMAT
+
+# Ротация журнала нитью записи (см. log_rotator.LogRotator)
+ROTATE_MAX_BYTES = 10 * 1024 * 1024    # Размер сегмента (0 — не ротировать по размеру)
+ROTATE_MAX_AGE_SECONDS = 24 * 60 * 60  # Возраст сегмента (0 — не ротировать по времени)
+RETENTION_DAYS = 90                    # Хранить сжатые сегменты не дольше (0 — без ограничения)
+RETENTION_BYTES = 1024 ** 3            # ...и не больше стольких байт в сумме (0 — без ограничения)
+
+# Метрики и профилирование (файлы event_log.json.* не попадают в журнал событий)
+METRICS_PORT = 9464                             # Эндпоинт Prometheus на 127.0.0.1 (0 — не запускать)
+STATS_FILE = EVENT_LOG_FILE + ".stats"          # Периодический снимок метрик в JSON ("" — не писать)
+STATS_INTERVAL = 60                             # ...раз в столько секунд
+PROFILE_SECONDS = 10                            # kill -USR1 <pid>: столько секунд снимать стеки всех нитей
+PROFILE_PREFIX = EVENT_LOG_FILE + ".profile_"   # ...и записать их в event_log.json.profile_<время>.txt
+
+
+# Счётчики по источникам, задержка записи, очередь и шаги циклов мониторов
+logger_metrics = LoggerMetrics()
+
+
+def create_output(log_file=EVENT_LOG_FILE, log_format=LOG_FORMAT, quiet=QUIET_MODE):
+    """Ротатор архива и писатель журнала; фоновые нити стартуют с первой ротацией и первым событием"""
+    rotator = LogRotator(
+        log_file,
+        os.path.join(os.path.dirname(os.path.abspath(log_file)), ARCHIVE_DIR),
+        max_bytes=ROTATE_MAX_BYTES,
+        max_age=ROTATE_MAX_AGE_SECONDS,
+        retention_days=RETENTION_DAYS,
+        retention_bytes=RETENTION_BYTES,
+    )
+    atexit.register(rotator.close)
+
+    writer = EventWriter(
+        log_file,
+        max_queue=WRITER_QUEUE_SIZE,
+        batch_size=WRITER_BATCH_SIZE,
+        flush_every=FLUSH_EVERY_EVENTS,
+        flush_interval_ms=FLUSH_INTERVAL_MS,
+        fsync=FSYNC_ON_FLUSH,
+        quiet=quiet,
+        queue_full_policy=QUEUE_FULL_POLICY,
+        log_format=log_format,
+        rotator=rotator,
+        metrics=logger_metrics,
+    )
+    atexit.register(writer.close)  # atexit вызывает в обратном порядке: писатель закрывается раньше ротатора
+    logger_metrics.watch_writer(writer)
+    return rotator, writer
+
+
+# Единственный писатель журнала, общий для всех мониторов (демон может переназначить его до первого события)
+log_rotator, event_writer = create_output()
+
+# Сведения о процессах по (pid, время старта): заполняет монитор процессов, читают PROCESS_END и сеть
+process_cache = ProcessCache(PID_CACHE_SIZE, PID_CACHE_TTL)
+logger_metrics.watch_cache(process_cache)
+
+# Правила исключения собираются один раз при запуске
+path_filter = load_path_filter(EXCLUDE_CONFIG_FILE)
 
 
 # Функции для логирования событий
 
 def is_excluded_path(path):
-    """Проверяет, находится ли путь внутри одной из исключённых директорий"""
-    abs_path = os.path.abspath(path)
-    for excluded_dir in EXCLUDED_DIRS:
-        excluded_abs_path = os.path.abspath(excluded_dir)
-        if abs_path.startswith(excluded_abs_path):
-            return True
-    return False
+    """Проверяет, попадает ли путь под одно из правил исключения"""
+    return path_filter.is_excluded(path)
 
 
 def log_event(source, event_type, details):
-    """Логирует события в общий файл"""
+    """Логирует события в общий файл через фонового писателя"""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "source": source,
         "event_type": event_type,
         **details
     }
-    
-    with open(EVENT_LOG_FILE, "a") as log:
-        log.write(json.dumps(log_entry) + "\n")
-    print(f"Logged {source} event: {log_entry}")
+
+    logger_metrics.seen.inc(source)
+    event_writer.write(log_entry)
 
 
-def log_file_event(event_type, src_path, dest_path=None):
+def log_file_event(event_type, src_path, dest_path=None, extra=None):
     """Логирует события файловой системы"""
     if is_excluded_path(src_path):
+        logger_metrics.seen.inc("file")
+        logger_metrics.excluded.inc("file")
         return
 
     event_details = {
         "src_path": src_path,
         "dest_path": dest_path
     }
+    if extra:
+        event_details.update(extra)
     log_event("file", event_type, event_details)
 
 
-def log_network_event(levelname, local_address, remote_address, status):
-    """Логирует сетевые события"""
+def log_network_event(levelname, local_address, remote_address, status, pid=None, start_time=None):
+    """Логирует сетевые события (адреса в виде {"ip": ..., "port": ...})"""
     event_details = {
         "local_address": local_address,
         "remote_address": remote_address,
         "status": status
     }
+    if pid is not None:
+        event_details["pid"] = pid
+        # Владелец соединения — из кэша процессов по точному ключу: по одному pid нашёлся бы
+        # и завершившийся процесс, раньше занимавший этот pid
+        process = process_cache.get(pid, start_time) if start_time is not None else None
+        if process is not None:
+            event_details["name"] = process.get("name")
+            event_details["user"] = process.get("username")
     log_event("network", levelname, event_details)
 
 
@@ -72,93 +190,403 @@ def log_process_event(event_type, process_info):
         "name": process_info.get("name"),
         "user": process_info.get("username")
     }
+    for field in ("ppid", "exe", "cmdline"):
+        if process_info.get(field) is not None:
+            event_details[field] = process_info[field]
     log_event("process", event_type, event_details)
 
 
-# Функции для мониторинга
+# Подавление собственных событий и склейка повторных изменений
+
+class SelfOutputFilter:
+    """Распознаёт собственные выходные файлы логгера: журнал, его служебные файлы, отчёты и архивы"""
+
+    def __init__(self, log_file=None, report_dir=None, archive_dir=None):
+        self.log_path = os.path.abspath(log_file or EVENT_LOG_FILE)
+        report_dir = os.path.abspath(report_dir or REPORT_DIR)
+        self.report_paths = {os.path.join(report_dir, name) for name in REPORT_FILES}
+        archive_dir = archive_dir or os.path.join(os.path.dirname(self.log_path), ARCHIVE_DIR)
+        self.archive_prefix = os.path.join(os.path.abspath(archive_dir), "")
 
-def start_file_monitor(directory_to_watch):
-    """Мониторинг файловой системы"""
-    class FileMonitorHandler(FileSystemEventHandler):
-        def on_created(self, event):
+    def __call__(self, path):
+        abs_path = os.path.abspath(path)
+        if abs_path == self.log_path or abs_path.startswith(self.log_path + "."):
+            return True  # сам журнал и файлы рядом с ним (event_log.json.*)
+        if abs_path in self.report_paths:
+            return True
+        return abs_path.startswith(self.archive_prefix) or abs_path + os.sep == self.archive_prefix
+
+
+class FileEventDebouncer:
+    """Склеивает изменения одного пути в пределах окна в одну запись со счётчиком и временем первого/последнего"""
+
+    def __init__(self, window_ms, emit=log_file_event):
+        self.window = window_ms / 1000.0
+        self.emit = emit
+        self._pending = {}  # путь -> [количество, первое время, последнее время, monotonic первого]
+        self._lock = threading.Lock()
+
+    def modified(self, path):
+        """Учитывает очередное изменение пути"""
+        if self.window <= 0:
+            self.emit("FILE_MODIFIED", path)
+            return
+        timestamp = datetime.now().isoformat()
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending is None:
+                self._pending[path] = [1, timestamp, timestamp, time.monotonic()]
+            else:
+                pending[0] += 1
+                pending[2] = timestamp
+
+    def _emit(self, path, pending):
+        count, first, last, _ = pending
+        extra = {"count": count, "first_timestamp": first, "last_timestamp": last}
+        self.emit("FILE_MODIFIED", path, extra=extra)
+
+    def flush_path(self, path):
+        """Сбрасывает накопленные изменения пути (перед удалением/перемещением, чтобы сохранить порядок)"""
+        with self._lock:
+            pending = self._pending.pop(path, None)
+        if pending is not None:
+            self._emit(path, pending)
+
+    def flush_expired(self):
+        """Сбрасывает записи, окно которых истекло"""
+        deadline = time.monotonic() - self.window
+        with self._lock:
+            expired = [(path, pending) for path, pending in self._pending.items() if pending[3] <= deadline]
+            for path, _ in expired:
+                del self._pending[path]
+        for path, pending in expired:
+            self._emit(path, pending)
+
+    def flush_all(self):
+        """Сбрасывает все накопленные записи"""
+        with self._lock:
+            pending_items = list(self._pending.items())
+            self._pending.clear()
+        for path, pending in pending_items:
+            self._emit(path, pending)
+
+
+class FileMonitorHandler(FileSystemEventHandler):
+    """Обработчик событий watchdog: отбрасывает собственные файлы логгера и склеивает изменения"""
+
+    def __init__(self, is_self_output, debouncer):
+        super().__init__()
+        self.is_self_output = is_self_output
+        self.debouncer = debouncer
+
+    def on_created(self, event):
+        if not self.is_self_output(event.src_path):
             log_file_event("FILE_CREATED", event.src_path)
 
-        def on_deleted(self, event):
+    def on_deleted(self, event):
+        if not self.is_self_output(event.src_path):
+            self.debouncer.flush_path(event.src_path)
             log_file_event("FILE_DELETED", event.src_path)
 
-        def on_modified(self, event):
-            log_file_event("FILE_MODIFIED", event.src_path)
+    def on_modified(self, event):
+        if not self.is_self_output(event.src_path):
+            self.debouncer.modified(event.src_path)
+
+    def on_moved(self, event):
+        if self.is_self_output(event.src_path) and self.is_self_output(event.dest_path):
+            return
+        self.debouncer.flush_path(event.src_path)
+        log_file_event("FILE_MOVED", event.src_path, event.dest_path)
 
-        def on_moved(self, event):
-            log_file_event("FILE_MOVED", event.src_path, event.dest_path)
 
-    event_handler = FileMonitorHandler()
-    observer = Observer()
-    observer.schedule(event_handler, directory_to_watch, recursive=True)
-    observer.start()
-    print(f"Monitoring started on directory: {directory_to_watch}")
+# Функции для мониторинга
 
+def create_tree_watcher(directories, handler):
+    """Наблюдение за корнями: исключённые поддеревья не ставятся на наблюдение вовсе,
+    остальные регистрируются в фоне, а не поместившиеся в лимит inotify — обходятся периодически"""
+    watcher = TreeWatcher(directories, handler, path_filter, workers=WATCH_WORKERS, scan_interval=SCAN_INTERVAL)
+    logger_metrics.watch_tree(watcher)
+    return watcher
+
+
+def start_file_monitor(directories_to_watch):
+    """Мониторинг файловой системы (один каталог или список)"""
+    if isinstance(directories_to_watch, str):
+        directories_to_watch = [directories_to_watch]
+    debouncer = FileEventDebouncer(DEBOUNCE_WINDOW_MS)
+    event_handler = FileMonitorHandler(SelfOutputFilter(), debouncer)
+    watcher = create_tree_watcher(directories_to_watch, event_handler).start()
+
+    # Задержка для снижения нагрузки на CPU, но не больше половины окна склейки
+    tick = min(1.0, debouncer.window / 2) if debouncer.window > 0 else 1.0
+    on_tick = logger_metrics.tick_recorder("file")
     try:
         while True:
-            time.sleep(1)  # Задержка для снижения нагрузки на CPU
+            time.sleep(tick)
+            started = time.perf_counter()
+            cpu_before = time.thread_time()
+            debouncer.flush_expired()
+            on_tick(time.perf_counter() - started, time.thread_time() - cpu_before)
     except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+        pass
+    watcher.stop()
+    debouncer.flush_all()
 
 
 def monitor_network():
     """Мониторинг сетевых соединений"""
-    prev_connections = psutil.net_connections(kind='inet')
-    while True:
-        time.sleep(1)
-        current_connections = psutil.net_connections(kind='inet')
-
-        new_connections = [conn for conn in current_connections if conn not in prev_connections]
-        for conn in new_connections:
-            log_network_event('New connection', str(conn.laddr), str(conn.raddr), conn.status)
-
-        closed_connections = [conn for conn in prev_connections if conn not in current_connections]
-        for conn in closed_connections:
-            log_network_event('Closed connection', str(conn.laddr), str(conn.raddr), conn.status)
-
-        prev_connections = current_connections
+    monitor = NetworkMonitor(log_network_event, attribute_pids=NETWORK_ATTRIBUTE_PIDS,
+                             on_tick=logger_metrics.tick_recorder("network"))
+    monitor.run(NETWORK_POLL_INTERVAL)
 
 
 def monitor_processes():
     """Мониторинг процессов"""
-    existing_pids = set(psutil.pids())
-    while True:
-        current_pids = set(psutil.pids())
-        new_pids = current_pids - existing_pids
-        for pid in new_pids:
-            try:
-                process = psutil.Process(pid)
-                process_info = {
-                    "pid": process.pid,
-                    "name": process.name(),
-                    "username": process.username()
-                }
-                log_process_event("PROCESS_START", process_info)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
+    backend = create_process_backend(
+        PROCESS_BACKEND,
+        log_process_event,
+        min_interval=PROCESS_SCAN_MIN_INTERVAL,
+        max_interval=PROCESS_SCAN_MAX_INTERVAL,
+        report_interval=PROCESS_STATS_INTERVAL,
+        on_tick=logger_metrics.tick_recorder("process"),
+        cache=process_cache,
+    )
+    print(f"Process monitoring started with backend: {backend.name}")
+    backend.run()
+
+
+def start_metrics(port=METRICS_PORT, stats_file=STATS_FILE, stats_interval=STATS_INTERVAL,
+                  profile_prefix=PROFILE_PREFIX):
+    """Эндпоинт Prometheus, файл статистики и профилировщик по SIGUSR1 (вызывать из главной нити)"""
+    if port:
+        try:
+            server = MetricsServer(logger_metrics.registry, port=port).start()
+            print(f"Metrics: http://{server.address[0]}:{server.address[1]}/metrics")
+        except OSError as e:
+            print(f"Metrics endpoint unavailable ({e})")
+    if stats_file:
+        stats_writer = StatsFileWriter(logger_metrics.registry, stats_file, stats_interval).start()
+
+        def close_stats():
+            # Последний снимок — после того как писатель дописал очередь (повторный close писателя безопасен)
+            event_writer.close()
+            stats_writer.close()
+        atexit.register(close_stats)
+    SamplingProfiler(profile_prefix, PROFILE_SECONDS).install()
+
+
+# Демон: все мониторы — задачи одного цикла asyncio
+
+class AsyncEventBridge(FileSystemEventHandler):
+    """Передаёт события watchdog из нити наблюдателя в цикл asyncio
+
+    Событий в пути не больше max_pending: если цикл не успевает (например, ждёт освобождения
+    очереди писателя), нить наблюдателя останавливается, и очередь растёт в буфере ядра (inotify).
+    """
+
+    def __init__(self, loop, max_pending=FILE_EVENT_BACKLOG):
+        super().__init__()
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.waits = 0
+
+    def dispatch(self, event):
+        # Вызывается в нити наблюдателя watchdog
+        if not self._slots.acquire(blocking=False):
+            self.waits += 1
+            self._slots.acquire()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def get(self):
+        """Следующее событие (None — наблюдатель остановлен и очередь пуста)"""
+        event = await self.queue.get()
+        if event is not None:
+            self._slots.release()
+        return event
+
+
+async def _sleep_or_stop(stop, delay):
+    """Пауза, прерываемая остановкой демона; True, если пора завершаться"""
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+    return stop.is_set()
+
 
-        ended_pids = existing_pids - current_pids
-        for pid in ended_pids:
-            log_process_event("PROCESS_END", {"pid": pid, "name": "unknown", "username": "unknown"})
+async def _wait_for_writer():
+    """Обратное давление: не производить события, пока очередь писателя почти полна"""
+    while event_writer.queue_depth() >= BACKPRESSURE_QUEUE_DEPTH:
+        await asyncio.sleep(BACKPRESSURE_WAIT)
 
-        existing_pids = current_pids
 
+async def run_file_events(bridge, handler):
+    """События watchdog обрабатываются обычным FileMonitorHandler, но уже в цикле asyncio"""
+    while True:
+        event = await bridge.get()
+        if event is None:
+            break
+        await _wait_for_writer()
+        handler.dispatch(event)
+
+
+async def run_debouncer(debouncer, stop):
+    on_tick = logger_metrics.tick_recorder("file")
+    tick = min(1.0, debouncer.window / 2) if debouncer.window > 0 else 1.0
+    while not await _sleep_or_stop(stop, tick):
+        started = time.perf_counter()
+        cpu_before = time.thread_time()
+        debouncer.flush_expired()
+        on_tick(time.perf_counter() - started, time.thread_time() - cpu_before)
+
+
+async def run_network_monitor(monitor, interval, stop):
+    while not await _sleep_or_stop(stop, interval):
+        await _wait_for_writer()
+        monitor.poll()
+
+
+async def run_process_monitor(backend, stop):
+    """Опрос /proc по таймеру; netlink — по готовности сокета, без отдельной нити"""
+    loop = asyncio.get_running_loop()
+    resume = None
+
+    async def resume_reading():
+        await _wait_for_writer()
+        if not stop.is_set():
+            loop.add_reader(backend.fileno(), on_readable)
+
+    def on_readable():
+        nonlocal resume
+        backend.tick()
+        # Обратное давление и для netlink: пока очередь писателя почти полна, сокет не читается
+        # (события копятся в буфере ядра), иначе put при политике BLOCK остановил бы весь цикл
+        if event_writer.queue_depth() >= BACKPRESSURE_QUEUE_DEPTH:
+            loop.remove_reader(backend.fileno())
+            resume = asyncio.create_task(resume_reading())
+
+    if hasattr(backend, "fileno"):
+        loop.add_reader(backend.fileno(), on_readable)
+    last_report = time.monotonic()
+    try:
+        while not stop.is_set():
+            if not hasattr(backend, "fileno"):
+                await _wait_for_writer()
+                backend.tick()
+            if backend.report_interval and time.monotonic() - last_report >= backend.report_interval:
+                print(backend.format_stats())
+                last_report = time.monotonic()
+            await _sleep_or_stop(stop, backend.wait_time() or backend.report_interval or 1.0)
+    finally:
+        if resume is not None:
+            resume.cancel()
+        if hasattr(backend, "fileno"):
+            loop.remove_reader(backend.fileno())
+
+
+async def run_daemon(args):
+    """Запускает мониторы до SIGTERM/SIGINT, затем дописывает все накопленные события"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    tasks = []
+    watcher = None
+    bridge = AsyncEventBridge(loop)
+    debouncer = FileEventDebouncer(args.debounce_ms)
+    if args.directories:
+        handler = FileMonitorHandler(SelfOutputFilter(args.log_file), debouncer)
+        # Корни ставятся на наблюдение сразу, поддеревья — в фоне, не задерживая остальные мониторы
+        watcher = create_tree_watcher(args.directories, bridge)
+        watcher.start()
+        tasks.append(asyncio.create_task(run_file_events(bridge, handler)))
+        tasks.append(asyncio.create_task(run_debouncer(debouncer, stop)))
+
+    if args.network_interval > 0:
+        monitor = NetworkMonitor(log_network_event, attribute_pids=args.network_pids,
+                                 on_tick=logger_metrics.tick_recorder("network"))
+        tasks.append(asyncio.create_task(run_network_monitor(monitor, args.network_interval, stop)))
+
+    backend = None
+    if args.process_backend != "off":
+        backend = create_process_backend(
+            args.process_backend,
+            log_process_event,
+            min_interval=args.process_min_interval,
+            max_interval=args.process_max_interval,
+            report_interval=PROCESS_STATS_INTERVAL,
+            on_tick=logger_metrics.tick_recorder("process"),
+            cache=process_cache,
+        )
+        print(f"Process monitoring started with backend: {backend.name}")
+        tasks.append(asyncio.create_task(run_process_monitor(backend, stop)))
+
+    await stop.wait()
+    print("Stopping...")
+
+    # Порядок остановки: наблюдатель, досылка его событий, склеенные изменения, писатель, архив
+    if watcher is not None:
+        await asyncio.to_thread(watcher.stop)
+        bridge.queue.put_nowait(None)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    debouncer.flush_all()
+    if backend is not None:
+        backend.close()
+    event_writer.close()
+    log_rotator.close()
+    print(f"Stopped: {event_writer.written} events written")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Audit logger daemon: file, process and network events into one log. "
+                    "Arguments can also be read from a file: one_file_logger.py @/etc/audit-logger.conf",
+        fromfile_prefix_chars="@",
+    )
+    parser.add_argument("directories", nargs="*", help="directories to watch (asked interactively if omitted)")
+    parser.add_argument("--log-file", default=EVENT_LOG_FILE)
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default=LOG_FORMAT)
+    parser.add_argument("--exclude-config", default=EXCLUDE_CONFIG_FILE)
+    parser.add_argument("--debounce-ms", type=int, default=DEBOUNCE_WINDOW_MS)
+    parser.add_argument("--network-interval", type=float, default=NETWORK_POLL_INTERVAL,
+                        help="socket table poll period, s (0 disables network monitoring)")
+    parser.add_argument("--network-pids", action="store_true", default=NETWORK_ATTRIBUTE_PIDS,
+                        help="attribute new connections to processes")
+    parser.add_argument("--process-backend", choices=("auto", "proc", "netlink", "off"), default=PROCESS_BACKEND)
+    parser.add_argument("--process-min-interval", type=float, default=PROCESS_SCAN_MIN_INTERVAL)
+    parser.add_argument("--process-max-interval", type=float, default=PROCESS_SCAN_MAX_INTERVAL)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="0 disables the endpoint")
+    parser.add_argument("--stats-file", help="default: <log file>.stats; empty string disables it")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    parser.add_argument("--quiet", action="store_true", default=QUIET_MODE, help="do not print every event")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global log_rotator, event_writer, path_filter
+
+    args = parse_args(argv)
+    if not args.directories and sys.stdin.isatty():
+        args.directories = [input("Enter the directory to monitor (e.g., /home/user): ").strip()]
+    missing = [directory for directory in args.directories if not os.path.isdir(directory)]
+    if missing:
+        print(f"Directory {', '.join(missing)} does not exist!")
+        return 1
+
+    # Параметры командной строки применяются до первого события
+    if (args.log_file, args.log_format, args.quiet) != (EVENT_LOG_FILE, LOG_FORMAT, QUIET_MODE):
+        log_rotator, event_writer = create_output(args.log_file, args.log_format, args.quiet)
+    if args.exclude_config != EXCLUDE_CONFIG_FILE:
+        path_filter = load_path_filter(args.exclude_config)
+
+    log_rotator.recover()
+    stats_file = args.log_file + ".stats" if args.stats_file is None else args.stats_file
+    start_metrics(args.metrics_port, stats_file, args.stats_interval, args.log_file + ".profile_")
+    asyncio.run(run_daemon(args))
+    return 0
 
-# Основной код для параллельного запуска мониторов
 
 if __name__ == "__main__":
-    directory = input("Enter the directory to monitor (e.g., /home/user): ").strip()
-
-    if not os.path.exists(directory):
-        print(f"Directory {directory} does not exist!")
-    else:
-        # Создаем пул потоков для параллельного выполнения
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            executor.submit(start_file_monitor, directory)
-            executor.submit(monitor_network)
-            executor.submit(monitor_processes)
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import os
+import re
+import fnmatch
+
+
+# Маркер конца пути в дереве исключённых каталогов
+_END = object()
+
+# Символы шаблонов fnmatch
+_GLOB_CHARS = set("*?[")
+
+
+class PathFilter:
+    """Правила исключения путей, собранные один раз: дерево компонентов пути + скомпилированные шаблоны
+
+    Поддерживаемые правила (по одному на строку файла конфигурации):
+      /var/log        — каталог и всё его поддерево (граница по компонентам: /var/log2 не исключается)
+      node_modules/   — каталог с таким именем на любой глубине
+      .git            — файл или каталог с таким именем на любой глубине
+      *.swp           — суффикс имени файла
+      *.tmp[0-9]      — произвольный шаблон для имени файла
+      /home/*/cache/* — шаблон для полного пути
+    """
+
+    def __init__(self, patterns=()):
+        self._trie = {}
+        self._names = set()
+        self._suffixes = []
+        self._name_globs = []
+        self._path_globs = []
+        self._name_regex = None
+        self._path_regex = None
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        """Добавляет правило исключения"""
+        pattern = pattern.strip()
+        if not pattern:
+            return
+        has_glob = bool(_GLOB_CHARS & set(pattern))
+
+        if pattern.startswith(os.sep) and not has_glob:
+            node = self._trie
+            for component in _components(os.path.normpath(pattern)):
+                node = node.setdefault(component, {})
+            node[_END] = True
+        elif not has_glob:
+            self._names.add(pattern.rstrip(os.sep))
+        elif os.sep in pattern.rstrip(os.sep):
+            self._path_globs.append(fnmatch.translate(pattern.rstrip(os.sep)))
+            self._path_regex = re.compile("|".join(self._path_globs))
+        elif pattern.startswith("*") and not _GLOB_CHARS & set(pattern[1:]):
+            self._suffixes.append(pattern[1:])
+        else:
+            self._name_globs.append(fnmatch.translate(pattern.rstrip(os.sep)))
+            self._name_regex = re.compile("|".join(self._name_globs))
+
+    def is_excluded(self, path):
+        """Проверяет путь за один проход по его компонентам"""
+        abs_path = os.path.abspath(path)
+        components = _components(abs_path)
+
+        node = self._trie
+        for component in components:
+            if _END in node:
+                return True
+            node = node.get(component)
+            if node is None:
+                break
+        else:
+            if _END in node:
+                return True
+
+        if self._names and not self._names.isdisjoint(components):
+            return True
+
+        name = components[-1] if components else ""
+        if self._suffixes and name.endswith(tuple(self._suffixes)):
+            return True
+        if self._name_regex is not None and self._name_regex.match(name):
+            return True
+        if self._path_regex is not None and self._path_regex.match(abs_path):
+            return True
+        return False
+
+    def has_excluded_below(self, directory):
+        """Есть ли внутри каталога исключённые поддеревья, заданные абсолютным путём"""
+        node = self._trie
+        for component in _components(os.path.abspath(directory)):
+            node = node.get(component)
+            if node is None:
+                return False
+        return any(key is not _END for key in node)
+
+    def watch_plan(self, root):
+        """Список (каталог, recursive) для наблюдателя, не покрывающий исключённые поддеревья
+
+        Исключения по абсолютному пути вырезаются из плана и до Python не доходят вовсе.
+        Правила по имени и шаблону могут сработать на любой глубине, поэтому их события
+        отбрасываются уже в is_excluded.
+        """
+        root = os.path.abspath(root)
+        if self.is_excluded(root):
+            return []
+        if not self.has_excluded_below(root):
+            return [(root, True)]
+
+        plan = [(root, False)]
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            return plan
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                plan.extend(self.watch_plan(entry.path))
+        return plan
+
+
+def _components(abs_path):
+    return [component for component in abs_path.split(os.sep) if component]
+
+
+def load_path_filter(config_file):
+    """Загружает правила исключения из файла (# — комментарий); отсутствующий файл — без исключений"""
+    patterns = []
+    try:
+        with open(config_file, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    patterns.append(line)
+    except FileNotFoundError:
+        print(f"Exclusion config {config_file} not found, no paths are excluded")
+    return PathFilter(patterns)
@@ -0,0 +1,104 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+PID_CACHE_SIZE = 65536   # Максимум процессов в кэше (вытесняются давно не использованные)
+PID_CACHE_TTL = 300      # Сколько хранить сведения о завершившемся процессе, с
+
+
+class ProcessCache:
+    """Сведения о процессах (имя, пользователь, exe, cmdline, ppid) по ключу (pid, время старта)
+
+    Заполняется при появлении процесса, пока его /proc ещё доступен; PROCESS_END и сетевые
+    события берут сведения отсюда без обращений к /proc. Живые процессы ограничены только
+    размером (LRU), завершившиеся хранятся ещё ttl секунд — для поздней атрибуции соединений.
+    Ключ с временем старта отличает процесс от следующего, получившего тот же pid.
+    """
+
+    def __init__(self, max_entries=PID_CACHE_SIZE, ttl=PID_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (pid, время старта) -> [сведения, срок хранения или None]
+        self._latest = {}              # pid -> ключ последнего процесса с этим pid
+        self._lock = threading.Lock()
+        self._next_expire = time.monotonic() + ttl
+
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, info):
+        """Запоминает сведения процесса (словарь с pid и start_time, как у read_process_info)"""
+        key = (info["pid"], info.get("start_time"))
+        if time.monotonic() >= self._next_expire:
+            self.expire()
+        with self._lock:
+            if key[1] is not None:
+                self._entries.pop((key[0], None), None)  # копия, сделанная при fork, уточнена после exec
+            self._entries[key] = [info, None]
+            self._entries.move_to_end(key)
+            self._latest[key[0]] = key
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def get(self, pid, start_time=None):
+        """Сведения процесса; без start_time — последнего процесса с этим pid. None — промах"""
+        with self._lock:
+            key = (pid, start_time) if start_time is not None else self._latest.get(pid)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self._forget(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def retire(self, pid, start_time=None):
+        """Процесс завершился: сведения возвращаются и хранятся ещё ttl секунд"""
+        info = self.get(pid, start_time)
+        if info is not None:
+            with self._lock:
+                entry = self._entries.get((pid, info.get("start_time")))
+                if entry is not None:
+                    entry[1] = time.monotonic() + self.ttl
+        return info
+
+    def _forget(self, key):
+        if self._latest.get(key[0]) == key:
+            del self._latest[key[0]]
+
+    def expire(self):
+        """Удаляет завершившиеся процессы с истёкшим сроком; возвращает их число"""
+        now = time.monotonic()
+        self._next_expire = now + self.ttl / 4
+        with self._lock:
+            expired = [key for key, (_, deadline) in self._entries.items() if deadline is not None and deadline < now]
+            for key in expired:
+                del self._entries[key]
+                self._forget(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
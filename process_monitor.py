@@ -0,0 +1,351 @@
+import os
+import pwd
+import time
+import errno
+import socket
+import struct
+from pid_cache import ProcessCache
+
+
+# Константы
+PROC_DIR = "/proc"
+CMDLINE_MAX = 1024  # Длина сохраняемой командной строки, символов
+
+# Константы proc connector (linux/connector.h, linux/cn_proc.h)
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+_NLMSG_HDR = struct.Struct("=IHHII")     # len, type, flags, seq, pid
+_CN_MSG_HDR = struct.Struct("=IIIIHH")   # idx, val, seq, ack, len, flags
+_PROC_EVENT_HDR = struct.Struct("=IIQ")  # what, cpu, timestamp_ns
+_PROC_EVENT_IDS = struct.Struct("=II")   # process_pid, process_tgid
+_PROC_EVENT_FORK = struct.Struct("=IIII")  # parent_pid, parent_tgid, child_pid, child_tgid
+
+
+# Кэш имён пользователей по uid
+_usernames = {}
+
+
+def _username(uid):
+    name = _usernames.get(uid)
+    if name is None:
+        try:
+            name = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            name = str(uid)
+        _usernames[uid] = name
+    return name
+
+
+def read_start_time(pid):
+    """Время старта процесса в тиках с загрузки системы (поле 22 из /proc/<pid>/stat)"""
+    try:
+        with open(f"{PROC_DIR}/{pid}/stat", "rb") as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы, поэтому режем по последней ')'
+    fields = stat[stat.rfind(b")") + 2:].split()
+    return int(fields[19])
+
+
+def read_process_info(pid, start_time=None):
+    """Читает сведения о процессе из /proc; None, если процесс уже завершился"""
+    try:
+        with open(f"{PROC_DIR}/{pid}/stat", "rb") as file:
+            stat = file.read()
+        uid = os.stat(f"{PROC_DIR}/{pid}").st_uid
+    except OSError:
+        return None
+    name_start = stat.find(b"(") + 1
+    name_end = stat.rfind(b")")
+    fields = stat[name_end + 2:].split()
+    # exe чужих процессов без прав недоступен; у потоков ядра нет ни exe, ни cmdline
+    try:
+        exe = os.readlink(f"{PROC_DIR}/{pid}/exe")
+    except OSError:
+        exe = None
+    try:
+        with open(f"{PROC_DIR}/{pid}/cmdline", "rb") as file:
+            cmdline = file.read(CMDLINE_MAX * 4).rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        cmdline = ""
+    return {
+        "pid": pid,
+        "name": stat[name_start:name_end].decode(errors="replace"),
+        "username": _username(uid),
+        "ppid": int(fields[1]),
+        "start_time": start_time if start_time is not None else int(fields[19]),
+        "exe": exe,
+        "cmdline": cmdline[:CMDLINE_MAX],
+    }
+
+
+def unknown_process(pid):
+    """Сведения о процессе, завершившемся раньше, чем его удалось прочитать"""
+    return {"pid": pid, "name": "unknown", "username": "unknown"}
+
+
+def list_pids():
+    """Список pid из /proc"""
+    return [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+
+
+class ProcessMonitorBackend:
+    """Базовый класс источника событий о процессах; считает собственные затраты CPU"""
+
+    name = "base"
+
+    def __init__(self, on_event, report_interval=60, on_tick=None, cache=None):
+        self.on_event = on_event  # on_event(event_type, process_info)
+        self.on_tick = on_tick    # on_tick(длительность шага, CPU шага) или None
+        self.cache = cache if cache is not None else ProcessCache()
+        self.report_interval = report_interval
+        self.ticks = 0
+        self.events = 0
+        self.cpu_time = 0.0
+        self.started = time.monotonic()
+
+    def poll(self):
+        """Один шаг мониторинга; возвращает число обнаруженных изменений"""
+        raise NotImplementedError
+
+    def wait_time(self):
+        """Сколько ждать перед следующим шагом"""
+        return 0
+
+    def tick(self):
+        """Шаг мониторинга с учётом затраченного процессорного времени"""
+        started = time.perf_counter()
+        cpu_before = time.thread_time()
+        changes = self.poll()
+        cpu_time = time.thread_time() - cpu_before
+        self.cpu_time += cpu_time
+        self.ticks += 1
+        self.events += changes
+        if self.on_tick is not None:
+            self.on_tick(time.perf_counter() - started, cpu_time)
+        return changes
+
+    def run(self, stop_event=None):
+        """Цикл мониторинга до установки stop_event"""
+        last_report = time.monotonic()
+        while stop_event is None or not stop_event.is_set():
+            self.tick()
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                print(self.format_stats())
+                last_report = time.monotonic()
+            delay = self.wait_time()
+            if delay:
+                if stop_event is not None:
+                    stop_event.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    def close(self):
+        """Освобождает ресурсы источника"""
+
+    def stats(self):
+        """Собственные затраты монитора"""
+        elapsed = time.monotonic() - self.started
+        return {
+            "backend": self.name,
+            "ticks": self.ticks,
+            "events": self.events,
+            "cpu_time": self.cpu_time,
+            "cpu_percent": 100.0 * self.cpu_time / elapsed if elapsed > 0 else 0.0,
+            "cache": self.cache.stats(),
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        cache = stats["cache"]
+        return (f"Process monitor ({stats['backend']}): {stats['ticks']} ticks, {stats['events']} events, "
+                f"cpu {stats['cpu_time']:.2f}s ({stats['cpu_percent']:.2f}%), "
+                f"cache {cache['size']} processes, {cache['hits']} hits, {cache['misses']} misses")
+
+
+class ProcScanBackend(ProcessMonitorBackend):
+    """Периодическое сравнение содержимого /proc с адаптивным интервалом
+
+    Процессы различаются по паре (pid, время старта), поэтому повторно выданный pid
+    даёт корректные PROCESS_END и PROCESS_START. Сведения о процессе запоминаются при
+    его появлении, так что PROCESS_END содержит имя и пользователя.
+    """
+
+    name = "proc"
+
+    def __init__(self, on_event, min_interval=0.2, max_interval=2.0, report_interval=60, on_tick=None, cache=None):
+        super().__init__(on_event, report_interval, on_tick, cache)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.known = None  # множество (pid, start_time) живых процессов; сведения — в self.cache
+
+    def _scan(self):
+        current = set()
+        for pid in list_pids():
+            start_time = read_start_time(pid)
+            if start_time is not None:
+                current.add((pid, start_time))
+        return current
+
+    def poll(self):
+        current = self._scan()
+        if self.known is None:
+            # Первый проход только запоминает уже работающие процессы
+            for pid, start_time in current:
+                info = read_process_info(pid, start_time)
+                if info is not None:
+                    self.cache.put(info)
+            self.known = current
+            return 0
+
+        changes = 0
+        for key in current - self.known:
+            info = read_process_info(*key)
+            if info is not None:
+                self.cache.put(info)
+                self.on_event("PROCESS_START", info)
+                changes += 1
+
+        # Завершившийся процесс уже не прочитать: сведения только из кэша
+        for key in self.known - current:
+            self.on_event("PROCESS_END", self.cache.retire(*key) or unknown_process(key[0]))
+            changes += 1
+
+        self.known = current
+        # Адаптивный интервал: чаще при активности, реже в простое
+        if changes:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return changes
+
+    def wait_time(self):
+        return self.interval
+
+
+class NetlinkBackend(ProcessMonitorBackend):
+    """События fork/exec/exit от ядра через proc connector (нужны права root)
+
+    Процесс появляется при fork (PROCESS_START) и завершается при exit (PROCESS_END);
+    exec лишь сменяет программу уже известного процесса (PROCESS_EXEC).
+    """
+
+    name = "netlink"
+
+    def __init__(self, on_event, timeout=1.0, report_interval=60, on_tick=None, cache=None):
+        super().__init__(on_event, report_interval, on_tick, cache)
+        for pid in list_pids():
+            info = read_process_info(pid)
+            if info is not None:
+                self.cache.put(info)
+
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            self.sock.bind((0, CN_IDX_PROC))  # порт назначит ядро
+            payload = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+            cn_msg = _CN_MSG_HDR.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0) + payload
+            message = _NLMSG_HDR.pack(_NLMSG_HDR.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid()) + cn_msg
+            self.sock.send(message)
+        except OSError:
+            self.sock.close()
+            raise
+        self.sock.settimeout(timeout)
+
+    def fileno(self):
+        """Сокет для ожидания событий в цикле asyncio (loop.add_reader)"""
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def poll(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return 0
+        except OSError as e:
+            if e.errno == errno.ENOBUFS:
+                # Ядро потеряло часть событий — продолжаем со следующими
+                return 0
+            raise
+
+        changes = 0
+        offset = 0
+        while offset + _NLMSG_HDR.size <= len(data):
+            msg_len = _NLMSG_HDR.unpack_from(data, offset)[0]
+            event_offset = offset + _NLMSG_HDR.size + _CN_MSG_HDR.size
+            changes += self._handle_event(data, event_offset)
+            offset += max(msg_len, _NLMSG_HDR.size)
+        return changes
+
+    def _handle_event(self, data, offset):
+        if offset + _PROC_EVENT_HDR.size + _PROC_EVENT_IDS.size > len(data):
+            return 0
+        what = _PROC_EVENT_HDR.unpack_from(data, offset)[0]
+        if what == PROC_EVENT_FORK:
+            return self._handle_fork(data, offset + _PROC_EVENT_HDR.size)
+        pid, tgid = _PROC_EVENT_IDS.unpack_from(data, offset + _PROC_EVENT_HDR.size)
+        if pid != tgid:
+            return 0  # события отдельных потоков не интересны
+
+        if what == PROC_EVENT_EXEC:
+            info = read_process_info(pid)
+            if info is None:
+                info = unknown_process(pid)
+            else:
+                self.cache.put(info)
+            self.on_event("PROCESS_EXEC", info)
+            return 1
+        if what == PROC_EVENT_EXIT:
+            # В событии exit нет времени старта: берётся последний процесс с этим pid
+            info = self.cache.retire(pid) or unknown_process(pid)
+            self.on_event("PROCESS_END", info)
+            return 1
+        return 0
+
+    def _handle_fork(self, data, offset):
+        if offset + _PROC_EVENT_FORK.size > len(data):
+            return 0
+        _, parent_tgid, child_pid, child_tgid = _PROC_EVENT_FORK.unpack_from(data, offset)
+        if child_pid != child_tgid:
+            return 0  # новый поток, а не процесс
+        # До exec дочерний процесс — копия родителя: сведения берутся из кэша, /proc читается,
+        # только если родитель неизвестен
+        parent = self.cache.get(parent_tgid)
+        if parent is not None:
+            info = {**parent, "pid": child_tgid, "ppid": parent_tgid, "start_time": read_start_time(child_tgid)}
+        else:
+            info = read_process_info(child_tgid)
+        if info is None:
+            info = unknown_process(child_tgid)
+        else:
+            self.cache.put(info)
+        self.on_event("PROCESS_START", info)
+        return 1
+
+
+def create_process_backend(kind, on_event, min_interval=0.2, max_interval=2.0, report_interval=60, on_tick=None,
+                           cache=None):
+    """Создаёт источник событий: proc, netlink или auto (netlink при правах root, иначе proc)"""
+    if kind == "auto":
+        if os.geteuid() == 0:
+            try:
+                return NetlinkBackend(on_event, report_interval=report_interval, on_tick=on_tick, cache=cache)
+            except OSError as e:
+                print(f"Netlink process connector unavailable ({e}), falling back to /proc scan")
+        kind = ProcScanBackend.name
+
+    if kind == NetlinkBackend.name:
+        return NetlinkBackend(on_event, report_interval=report_interval, on_tick=on_tick, cache=cache)
+    if kind == ProcScanBackend.name:
+        return ProcScanBackend(on_event, min_interval, max_interval, report_interval, on_tick, cache)
+    raise ValueError(f"Unknown process monitor backend: {kind}")
@@ -1,23 +1,73 @@
 import os
 import json
-import matplotlib.pyplot as plt
+import mmap
+import time
+import hashlib
+import argparse
+from html import escape
 from datetime import datetime
-from collections import defaultdict, Counter
-
-
-# Функция для загрузки логов из файла
-def load_logs(file_path="event_log.json"):
-    try:
-        with open(file_path, "r") as file:
-            logs = [json.loads(line) for line in file.readlines()]
-        return logs
-    except FileNotFoundError:
-        return []
+from concurrent.futures import ProcessPoolExecutor
+from log_reader import (
+    COMPRESSED_SUFFIX,
+    FINGERPRINT_BYTES,
+    ReadStats,
+    archive_files,
+    find_archived_segment,
+    fingerprint,
+    fingerprint_file,
+    iter_logs,
+    iter_records,
+    load_manifest,
+    log_files,
+    open_log,
+    read_records,
+    segment_identity,
+)
+from log_index import search_log_file
+from binary_log import is_binary_log
+from aggregators import (
+    AGGREGATORS,
+    aggregate,
+    create_aggregators,
+    aggregators_to_state,
+    aggregators_from_state,
+    merge_aggregators,
+)
+
+
+# Состояние инкрементального отчёта хранится рядом с журналом
+REPORT_STATE_SUFFIX = ".report_state"
+
+# Параллельный отчёт: файлы больше этого размера делятся на части по границам строк
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Графики
+CHART_FORMAT = "png"                     # png (matplotlib) / html (SVG без matplotlib) / none
+CHART_WORKERS = 3                        # Процессов для параллельной отрисовки PNG (1 — по очереди)
+CHART_CACHE_FILE = ".chart_cache.json"   # Хеши данных уже нарисованных графиков (в каталоге отчёта)
+CHART_CACHE_VERSION = 1                  # Увеличить при изменении вида графиков
+HTML_REPORT_FILE = "event_log_report.html"
+
+
+# Функция для загрузки логов из файла (повреждённые строки пропускаются)
+def load_logs(file_path="event_log.json", include_archives=False):
+    return list(iter_logs(file_path, include_archives=include_archives))
 
 
 # Функция для фильтрации логов по выбранным критериям
 def filter_logs(logs, event_type=None, user=None, source=None, start_time=None, end_time=None):
-    filtered_logs = []
+    return list(iter_filtered_logs(logs, event_type, user, source, start_time, end_time))
+
+
+# Фильтрация журнала на диске: кандидаты берутся из индексов значений полей и времени
+def filter_log_file(file_path="event_log.json", event_type=None, user=None, source=None, start_time=None, end_time=None):
+    criteria = {"event_type": event_type, "user": user, "source": source}
+    logs = search_log_file(file_path, criteria, start_time, end_time, substring=False)
+    return filter_logs(logs, event_type, user, source, start_time, end_time)
+
+
+# Ленивая фильтрация потока записей (например, из iter_logs)
+def iter_filtered_logs(logs, event_type=None, user=None, source=None, start_time=None, end_time=None):
     for log in logs:
         timestamp = datetime.fromisoformat(log['timestamp'])
 
@@ -36,46 +86,41 @@ def filter_logs(logs, event_type=None, user=None, source=None, start_time=None,
         if end_time and timestamp > end_time:
             continue
 
-        filtered_logs.append(log)
-
-    return filtered_logs
+        yield log
 
 
 # Генерация статистики по типам событий
 def generate_event_type_stats(logs):
-    event_types = defaultdict(int)
-    for log in logs:
-        event_types[log['event_type']] += 1
-    return event_types
+    return aggregate(logs, ["event_type"])["event_type"].result()
 
 
 # Генерация статистики по пользователям
 def generate_user_stats(logs):
-    users = defaultdict(int)
-    for log in logs:
-        users[log.get('user', 'Unknown')] += 1
-    return users
+    return aggregate(logs, ["user"])["user"].result()
 
 
 # Генерация статистики по источникам
 def generate_source_stats(logs):
-    sources = defaultdict(int)
-    for log in logs:
-        sources[log.get('source', 'Unknown')] += 1
-    return sources
+    return aggregate(logs, ["source"])["source"].result()
 
 
 # Генерация распределения по дням недели
 def generate_weekday_stats(logs):
-    weekdays = Counter()
-    for log in logs:
-        timestamp = datetime.fromisoformat(log['timestamp'])
-        weekdays[timestamp.strftime('%A')] += 1
-    return weekdays
+    return aggregate(logs, ["weekday"])["weekday"].result()
 
 
 # Построение графиков
+
+def _pyplot():
+    # matplotlib импортируется только при первой отрисовке и без оконного backend
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def generate_event_type_chart(stats, output_file):
+    plt = _pyplot()
     event_types = list(stats.keys())
     counts = list(stats.values())
     
@@ -91,6 +136,7 @@ def generate_event_type_chart(stats, output_file):
 
 
 def generate_user_activity_chart(stats, output_file):
+    plt = _pyplot()
     users = list(stats.keys())
     counts = list(stats.values())
     
@@ -106,6 +152,7 @@ def generate_user_activity_chart(stats, output_file):
 
 
 def generate_weekday_chart(stats, output_file):
+    plt = _pyplot()
     weekdays = list(stats.keys())
     counts = list(stats.values())
 
@@ -119,35 +166,111 @@ def generate_weekday_chart(stats, output_file):
     plt.close()
 
 
-# Генерация текстового отчёта
-def generate_text_report(logs, output_dir="/home/akpchelkova/audi"):
-    # Создаем директорию, если ее нет
-    os.makedirs(output_dir, exist_ok=True)
+# Графики отчёта: файл, функция отрисовки, агрегатор с данными
+CHARTS = (
+    ("event_type_report.png", generate_event_type_chart, "event_type"),
+    ("user_activity_report.png", generate_user_activity_chart, "user"),
+    ("weekday_distribution.png", generate_weekday_chart, "weekday"),
+)
 
-    # Генерация путей файлов
-    report_file = os.path.join(output_dir, "event_log_report.txt")
-    event_chart_file = os.path.join(output_dir, "event_type_report.png")
-    user_chart_file = os.path.join(output_dir, "user_activity_report.png")
-    weekday_chart_file = os.path.join(output_dir, "weekday_distribution.png")
 
-    # Генерация статистики
-    event_type_stats = generate_event_type_stats(logs)
-    user_stats = generate_user_stats(logs)
-    weekday_stats = generate_weekday_stats(logs)
+def chart_key(chart_file, data):
+    """Хеш входных данных графика: порядок важен, он определяет порядок столбцов"""
+    payload = json.dumps([chart_file, CHART_CACHE_VERSION, list(data.items())], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
 
-    # Генерация графиков
-    generate_event_type_chart(event_type_stats, event_chart_file)
-    generate_user_activity_chart(user_stats, user_chart_file)
-    generate_weekday_chart(weekday_stats, weekday_chart_file)
 
-    # Генерация текстового отчета
+def _load_chart_cache(cache_file):
+    try:
+        with open(cache_file, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def render_charts(stats, output_dir, workers=CHART_WORKERS):
+    """Рисует графики отчёта; неизменившиеся (по хешу данных) не перерисовываются
+
+    Графики рисуются параллельно в отдельных процессах. Возвращает имена перерисованных файлов.
+    """
+    cache_file = os.path.join(output_dir, CHART_CACHE_FILE)
+    cache = _load_chart_cache(cache_file)
+
+    jobs = []
+    for chart_file, draw, name in CHARTS:
+        data = dict(stats[name].result())
+        key = chart_key(chart_file, data)
+        output_file = os.path.join(output_dir, chart_file)
+        if cache.get(chart_file) == key and os.path.exists(output_file):
+            continue
+        jobs.append((chart_file, key, draw, data, output_file))
+
+    if len(jobs) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            futures = [executor.submit(draw, data, output_file) for _, _, draw, data, output_file in jobs]
+            for future in futures:
+                future.result()
+    else:
+        for _, _, draw, data, output_file in jobs:
+            draw(data, output_file)
+
+    if jobs:
+        cache.update({chart_file: key for chart_file, key, _, _, _ in jobs})
+        with open(cache_file, "w") as file:
+            json.dump(cache, file)
+    return [chart_file for chart_file, _, _, _, _ in jobs]
+
+
+# Лёгкий отчёт без matplotlib: HTML со встроенными SVG-диаграммами
+
+def svg_bar_chart(data, title, color, limit=None, width=640, bar_height=22):
+    """Горизонтальная столбчатая диаграмма в виде строки SVG"""
+    items = list(data.items())[:limit]
+    label_width = 200
+    top = 30
+    height = top + bar_height * len(items) + 10
+    peak = max((count for _, count in items), default=0) or 1
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="12">',
+        f'<text x="0" y="18" font-size="14" font-weight="bold">{escape(title)}</text>',
+    ]
+    for row, (label, count) in enumerate(items):
+        y = top + row * bar_height
+        bar = (width - label_width - 60) * count / peak
+        parts.append(f'<text x="{label_width - 6}" y="{y + 15}" text-anchor="end">{escape(str(label))}</text>')
+        parts.append(f'<rect x="{label_width}" y="{y + 3}" width="{bar:.1f}" height="{bar_height - 6}" fill="{color}"/>')
+        parts.append(f'<text x="{label_width + bar + 4:.1f}" y="{y + 15}">{count}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def write_html_report(stats, report_file):
+    user_stats = sorted(stats["user"].result().items(), key=lambda x: x[1], reverse=True)
+    charts = [
+        svg_bar_chart(stats["event_type"].result(), "Event Type Distribution", "skyblue"),
+        svg_bar_chart(dict(user_stats), "Top 10 Users by Activity", "green", limit=10),
+        svg_bar_chart(stats["weekday"].result(), "Events by Day of the Week", "orange"),
+        svg_bar_chart(stats["source"].result(), "Events by Source", "gray"),
+    ]
+    with open(report_file, "w", encoding="utf-8") as file:
+        file.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Event Log Report</title></head><body>\n")
+        file.write(f"<h1>Event Log Report</h1>\n<p>Total Events: {stats['total'].result()}</p>\n")
+        for chart in charts:
+            file.write(f"<div>{chart}</div>\n")
+        file.write("</body></html>\n")
+
+
+# Запись текстового отчёта по посчитанной статистике
+def write_text_report(stats, report_file):
+    user_stats = stats["user"].result()
+
     with open(report_file, "w") as file:
         file.write("Event Log Report\n")
         file.write("=================\n\n")
-        file.write(f"Total Events: {len(logs)}\n\n")
+        file.write(f"Total Events: {stats['total'].result()}\n\n")
 
         file.write("Event Type Statistics:\n")
-        for event_type, count in event_type_stats.items():
+        for event_type, count in stats["event_type"].result().items():
             file.write(f"  {event_type}: {count}\n")
         file.write("\n")
 
@@ -158,12 +281,302 @@ def generate_text_report(logs, output_dir="/home/akpchelkova/audi"):
         file.write("\n")
 
         file.write("Events by Day of the Week:\n")
-        for day, count in weekday_stats.items():
+        for day, count in stats["weekday"].result().items():
             file.write(f"  {day}: {count}\n")
         file.write("\n")
 
         file.write("Source Statistics:\n")
-        for source, count in generate_source_stats(logs).items():
+        for source, count in stats["source"].result().items():
             file.write(f"  {source}: {count}\n")
+        file.write("\n")
+
+        file.write("Events by Hour:\n")
+        for hour, count in sorted(stats["hour"].result().items()):
+            file.write(f"  {hour:02d}:00: {count}\n")
+        file.write("\n")
+
+        file.write("Top Path Prefixes:\n")
+        for prefix, count in stats["path_prefix"].result().most_common(10):
+            file.write(f"  {prefix}: {count}\n")
+        file.write("\n")
+
+        file.write("Top Remote IPs:\n")
+        for ip, count in stats["remote_ip"].result().most_common(10):
+            file.write(f"  {ip}: {count}\n")
+
+        # Только для журналов, собранных коллектором с нескольких хостов
+        host_stats = stats["host"].result()
+        if host_stats:
+            file.write("\n")
+            file.write("Events by Host:\n")
+            for host, count in host_stats.most_common():
+                file.write(f"  {host}: {count}\n")
+
+
+# Генерация графиков и текстового отчёта по посчитанной статистике
+def write_report(stats, output_dir, chart_format=CHART_FORMAT):
+    # Создаем директорию, если ее нет
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Генерация графиков: png — matplotlib (с кэшем), html — SVG без matplotlib
+    if chart_format == "png":
+        render_charts(stats, output_dir)
+    elif chart_format == "html":
+        write_html_report(stats, os.path.join(output_dir, HTML_REPORT_FILE))
 
+    # Генерация текстового отчета
+    report_file = os.path.join(output_dir, "event_log_report.txt")
+    write_text_report(stats, report_file)
     return report_file
+
+
+# Генерация текстового отчёта
+def generate_text_report(logs=None, output_dir="/home/akpchelkova/audi", chart_format=CHART_FORMAT):
+    # Без явно переданных логов читаем журнал потоком
+    if logs is None:
+        logs = iter_logs()
+
+    # Вся статистика считается за один проход по логам
+    stats = aggregate(logs)
+    return write_report(stats, output_dir, chart_format)
+
+
+# Параллельный отчёт по архиву: файлы и части файлов считаются в отдельных процессах
+
+def split_ranges(file_path, chunk_bytes=PARALLEL_CHUNK_BYTES, follow=False):
+    """Делит файл журнала на задачи (путь, начало, конец, follow) по границам строк
+
+    Границы ищутся через mmap, сам файл при этом не читается в память. Сжатые сегменты и
+    бинарный журнал целиком составляют одну задачу: у них нет произвольного доступа по строкам.
+    Сегмент, который успели сжать после получения списка файлов, читается из .gz.
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except FileNotFoundError:
+        if not file_path.endswith(COMPRESSED_SUFFIX) and os.path.exists(file_path + COMPRESSED_SUFFIX):
+            return [(file_path + COMPRESSED_SUFFIX, 0, None, False)]
+        return []
+    if size <= chunk_bytes or file_path.endswith(COMPRESSED_SUFFIX) or is_binary_log(file_path):
+        return [(file_path, 0, None, follow)]
+
+    ranges = []
+    start = 0
+    try:
+        file = open(file_path, "rb")
+    except FileNotFoundError:
+        return [(file_path, 0, None, follow)]  # сжат прямо сейчас: _aggregate_task прочитает .gz
+    with file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        while start + chunk_bytes < size:
+            newline = data.find(b"\n", start + chunk_bytes)
+            if newline == -1:
+                break
+            ranges.append((file_path, start, newline + 1, False))
+            start = newline + 1
+    ranges.append((file_path, start, None, follow))
+    return ranges
+
+
+def _aggregate_task(task):
+    """Частичная статистика одной задачи; выполняется в процессе пула"""
+    file_path, start, end, follow = task
+    read_stats = ReadStats()
+    stats = aggregate(iter_records(file_path, stats=read_stats, start=start, end=end, follow=follow))
+    if not read_stats.files and not file_path.endswith(COMPRESSED_SUFFIX):
+        # Сегмент сжали между составлением задач и чтением; смещения в .gz те же, что в исходном файле
+        aggregate(iter_records(file_path + COMPRESSED_SUFFIX, stats=read_stats, start=start, end=end),
+                  aggregators=stats)
+    return stats, read_stats
+
+
+def generate_parallel_report(file_path="event_log.json", output_dir="/home/akpchelkova/audi", include_archives=True,
+                             workers=None, chunk_bytes=PARALLEL_CHUNK_BYTES, chart_format=CHART_FORMAT):
+    """Отчёт по журналу и архиву, посчитанный пулом процессов
+
+    Каждый сегмент архива (и каждая часть большого файла) считается отдельно, частичные
+    результаты объединяются и записываются в тот же event_log_report.txt. file_path может быть
+    списком журналов (например, всех хостов коллектора) — тогда отчёт общий. Возвращает сводку
+    со временем и скоростью обработки.
+    """
+    started = time.perf_counter()
+    active_logs = [file_path] if isinstance(file_path, str) else list(file_path)
+    tasks = []
+    for active_log in active_logs:
+        for path in log_files(active_log, include_archives):
+            if os.path.exists(path):
+                # Активный журнал может дописываться: незавершённая последняя строка пропускается
+                tasks.extend(split_ranges(path, chunk_bytes, follow=path == active_log))
+
+    stats = create_aggregators()
+    read_stats = ReadStats()
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial, partial_stats in executor.map(_aggregate_task, tasks):
+                merge_aggregators(stats, partial)
+                read_stats.records += partial_stats.records
+                read_stats.malformed += partial_stats.malformed
+    read_stats.files = len({task[0] for task in tasks})
+    aggregated = time.perf_counter()
+
+    report_file = write_report(stats, output_dir, chart_format)
+    finished = time.perf_counter()
+
+    summary = {
+        "report_file": report_file,
+        "files": read_stats.files,
+        "tasks": len(tasks),
+        "workers": workers or os.cpu_count(),
+        "records": read_stats.records,
+        "malformed": read_stats.malformed,
+        "aggregate_seconds": aggregated - started,
+        "total_seconds": finished - started,
+        "records_per_sec": read_stats.records / (aggregated - started) if aggregated > started else 0.0,
+    }
+    print(f"Report: {summary['records']} records from {summary['files']} files "
+          f"({summary['tasks']} tasks, {summary['workers']} workers) in {summary['total_seconds']:.2f} s, "
+          f"{summary['records_per_sec']:.0f} records/s")
+    return summary
+
+
+# Инкрементальный отчёт: состояние между запусками
+
+def load_report_state(state_file):
+    try:
+        with open(state_file, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_report_state(state_file, state):
+    # Запись через временный файл, чтобы прерванный запуск не испортил состояние
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_file, state_file)
+
+
+def update_report_stats(log_file="event_log.json", state_file=None):
+    """Досчитывает статистику по строкам, дописанным с прошлого запуска, и сохраняет состояние
+
+    Состояние: счётчики агрегаторов, смещение последней обработанной строки, inode/устройство
+    и контрольная сумма начала файла. Если журнал ротирован (другой inode или другое начало
+    файла), сначала дочитывается хвост старого сегмента из архива и более новые сегменты, затем
+    новый журнал читается с начала. Если журнал усечён или подменён и в архиве его нет, чтение
+    начинается с нуля.
+    """
+    if state_file is None:
+        state_file = log_file + REPORT_STATE_SUFFIX
+
+    state = load_report_state(state_file)
+    if state and set(state["stats"]) == set(AGGREGATORS):
+        stats = aggregators_from_state(state["stats"])
+        offset = state["offset"]
+    else:
+        # Нет состояния или изменился набор агрегаторов — считаем заново
+        state = None
+        stats = create_aggregators()
+        offset = 0
+
+    try:
+        file = open_log(log_file)
+    except FileNotFoundError:
+        return stats
+
+    # Проверка, чтение и новое состояние берутся из одного открытого файла,
+    # поэтому ротация во время работы не смешивает старый и новый журнал
+    with file:
+        st = os.fstat(file.fileno())
+        if state:
+            same_file = ((st.st_ino, st.st_dev) == (state["inode"], state["device"])
+                         and st.st_size >= offset and fingerprint_file(file, offset) == state["fingerprint"])
+            if not same_file:
+                current = (st.st_ino, st.st_dev, fingerprint_file(file, FINGERPRINT_BYTES))
+                _finish_rotated(log_file, state, offset, stats, current)
+                offset = 0
+
+        read_stats = ReadStats()
+        aggregate(read_records(file, log_file, start=offset, stats=read_stats, follow=True), aggregators=stats)
+        save_report_state(state_file, {
+            "inode": st.st_ino,
+            "device": st.st_dev,
+            "offset": read_stats.offset,
+            "fingerprint": fingerprint_file(file, read_stats.offset),
+            "stats": aggregators_to_state(stats),
+        })
+    return stats
+
+
+def _segment_name(path):
+    name = os.path.basename(path)
+    return name[:-len(COMPRESSED_SUFFIX)] if name.endswith(COMPRESSED_SUFFIX) else name
+
+
+def _aggregate_segment(path, start, stats):
+    read_stats = ReadStats()
+    aggregate(iter_records(path, start=start, stats=read_stats), aggregators=stats)
+    if not read_stats.files and not path.endswith(COMPRESSED_SUFFIX):
+        # Сегмент успели сжать между поиском и чтением
+        aggregate(iter_records(path + COMPRESSED_SUFFIX, start=start), aggregators=stats)
+
+
+def _finish_rotated(log_file, state, offset, stats, current):
+    """Дочитывает хвост ротированного журнала и более новые сегменты архива
+
+    current — (inode, устройство, контрольная сумма начала) открытого активного журнала: если
+    его успели ротировать после открытия, он уже в архиве, но будет прочитан вызывающим,
+    поэтому здесь чтение на нём останавливается.
+    """
+    rotated_file = find_archived_segment(log_file, state["inode"], state["device"],
+                                         head=(offset, state["fingerprint"]))
+    if rotated_file is None:
+        return
+    _aggregate_segment(rotated_file, offset, stats)
+    # Между запусками журнал мог ротироваться несколько раз
+    rotated_name = _segment_name(rotated_file)
+    for path in archive_files(log_file):
+        if _segment_name(path) <= rotated_name:
+            continue
+        segment = _resolve_segment(path)
+        if segment is None:
+            continue  # удалён по правилам хранения
+        path, identity, head = segment
+        if (*identity, head) == current:
+            break
+        _aggregate_segment(path, 0, stats)
+
+
+def _resolve_segment(path):
+    """Путь, (inode, устройство) и контрольная сумма начала сегмента; сегмент могут сжать прямо сейчас"""
+    candidates = [path] if path.endswith(COMPRESSED_SUFFIX) else [path, path + COMPRESSED_SUFFIX]
+    for candidate in candidates:
+        try:
+            identity = segment_identity(candidate, load_manifest(os.path.dirname(candidate)))
+            if identity is not None:
+                return candidate, identity, fingerprint(candidate, FINGERPRINT_BYTES)
+        except (FileNotFoundError, EOFError):
+            continue
+    return None
+
+
+# Генерация отчёта только по новым данным журнала; None, если событий нет
+def generate_incremental_report(log_file="event_log.json", output_dir="/home/akpchelkova/audi", state_file=None,
+                                chart_format=CHART_FORMAT):
+    stats = update_report_stats(log_file, state_file)
+    if not stats["total"].result():
+        return None
+    return write_report(stats, output_dir, chart_format)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event log report over the active log and its archive")
+    parser.add_argument("log_file", nargs="?", default="event_log.json")
+    parser.add_argument("--output-dir", default="/home/akpchelkova/audi")
+    parser.add_argument("--workers", type=int, default=None, help="processes in the pool (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=float, default=PARALLEL_CHUNK_BYTES / (1024 * 1024),
+                        help="split files larger than this into newline-aligned ranges")
+    parser.add_argument("--no-archives", action="store_true", help="only the active log")
+    parser.add_argument("--charts", choices=("png", "html", "none"), default=CHART_FORMAT,
+                        help="png charts (matplotlib) or an HTML page with SVG charts (no matplotlib)")
+    args = parser.parse_args()
+    generate_parallel_report(args.log_file, args.output_dir, not args.no_archives, args.workers,
+                             int(args.chunk_mb * 1024 * 1024), args.charts)
@@ -1,12 +1,280 @@
 import os
+import time
+import atexit
+import base64
+import fnmatch
 import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import zipfile
+import tempfile
+import mimetypes
+from email.header import Header
+from email.utils import formatdate, make_msgid, encode_rfc2231
 
 from config import EMAIL, PASSWORD
 
+# Какие файлы из каталога отчёта прикладываются к письму (журнал и архивы — нет)
+ATTACHMENT_PATTERNS = ("event_log_report.txt", "event_log_report.html", "*.png")
+MAX_ATTACHMENT_BYTES = 5 * 1024 * 1024    # Файлы больше пропускаются
+MAX_TOTAL_BYTES = 15 * 1024 * 1024        # Сумма вложений (base64 добавит ещё треть)
+BUNDLE_ATTACHMENTS = False                # Упаковать все вложения в один zip
+BUNDLE_NAME = "audit_report.zip"
+
+# Соединение с SMTP сервером
+SMTP_TIMEOUT = 30        # с
+SMTP_RETRIES = 3         # Попыток отправки при сетевых и временных (4xx) ошибках
+SMTP_BACKOFF = 1.0       # Пауза перед повтором, с; удваивается с каждой попыткой
+
+_CHUNK_BYTES = 57 * 1024  # Кратно 57 байтам: ровно 1024 строки base64 по 76 символов
+_CRLF = b"\r\n"
+
+
+# Выбор вложений
+
+def select_attachments(directory, patterns=ATTACHMENT_PATTERNS, max_file_bytes=MAX_ATTACHMENT_BYTES,
+                       max_total_bytes=MAX_TOTAL_BYTES):
+    """Файлы каталога, подходящие под шаблоны и ограничения размера; пропущенные печатаются"""
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Указанная директория '{directory}' не существует или это не директория.")
+
+    selected = []
+    total = 0
+    for filename in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, filename)
+        if not os.path.isfile(file_path) or not any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+            continue
+        size = os.path.getsize(file_path)
+        if max_file_bytes and size > max_file_bytes:
+            print(f"Вложение пропущено (больше {max_file_bytes} байт): {filename}")
+            continue
+        if max_total_bytes and total + size > max_total_bytes:
+            print(f"Вложение пропущено (превышен общий размер письма): {filename}")
+            continue
+        selected.append(file_path)
+        total += size
+    return selected
+
+
+def bundle_attachments(paths, bundle_path):
+    """Упаковывает вложения в один zip; возвращает путь архива"""
+    with zipfile.ZipFile(bundle_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for path in paths:
+            bundle.write(path, os.path.basename(path))
+    return bundle_path
+
+
+# Сборка письма потоком в файл: вложения никогда не читаются в память целиком
+
+def _header(name, value):
+    if not value.isascii():
+        value = Header(value, "utf-8").encode()
+    return f"{name}: {value}".encode("ascii") + _CRLF
+
+
+def _write_base64(out, source):
+    while True:
+        chunk = source.read(_CHUNK_BYTES)
+        if not chunk:
+            break
+        out.write(base64.encodebytes(chunk).replace(b"\n", _CRLF))
+
+
+def write_message(out, sender, recipient, subject, body, attachments):
+    """Пишет письмо MIME multipart/mixed в бинарный файл out со строками CRLF"""
+    boundary = f"=={make_msgid().strip('<>').replace('@', '.')}=="
+    out.write(_header("From", sender))
+    out.write(_header("To", recipient))
+    out.write(_header("Subject", subject))
+    out.write(_header("Date", formatdate(localtime=True)))
+    out.write(_header("Message-ID", make_msgid()))
+    out.write(_header("MIME-Version", "1.0"))
+    out.write(_header("Content-Type", f'multipart/mixed; boundary="{boundary}"'))
+    out.write(_CRLF)
+
+    # Текст письма
+    out.write(f"--{boundary}".encode() + _CRLF)
+    out.write(_header("Content-Type", 'text/plain; charset="utf-8"'))
+    out.write(_header("Content-Transfer-Encoding", "base64"))
+    out.write(_CRLF)
+    out.write(base64.encodebytes(body.encode("utf-8")).replace(b"\n", _CRLF))
+
+    for path in attachments:
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if filename.isascii():
+            disposition = f'attachment; filename="{filename}"'
+        else:
+            disposition = f"attachment; filename*={encode_rfc2231(filename, 'utf-8')}"
+        out.write(f"--{boundary}".encode() + _CRLF)
+        out.write(_header("Content-Type", content_type))
+        out.write(_header("Content-Transfer-Encoding", "base64"))
+        out.write(_header("Content-Disposition", disposition))
+        out.write(_CRLF)
+        with open(path, "rb") as source:
+            _write_base64(out, source)
+
+    out.write(f"--{boundary}--".encode() + _CRLF)
+
+
+# Отправка
+
+class SMTPConnection:
+    """Переиспользуемое соединение с SMTP сервером с повторами и потоковой передачей DATA"""
+
+    def __init__(self, host, port, user=None, password=None, starttls=True, timeout=SMTP_TIMEOUT,
+                 retries=SMTP_RETRIES, backoff=SMTP_BACKOFF):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.server = None
+
+    def connect(self):
+        self.close()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls()  # Шифруем соединение
+                server.ehlo()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def _ensure_connected(self):
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.connect()
+
+    def close(self):
+        """Закрывает соединение; ошибки уже разорванного соединения не важны"""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def send(self, sender, recipients, message_file):
+        """Отправляет готовое письмо из файла; временные ошибки повторяются с нарастающей паузой"""
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._ensure_connected()
+                self._send_once(sender, recipients, message_file)
+                return
+            except smtplib.SMTPResponseException as e:
+                # 5xx — постоянная ошибка (адрес, размер, авторизация): повтор не поможет
+                if e.smtp_code >= 500 or attempt == self.retries:
+                    self._reset()
+                    raise
+                self._reset()
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError):
+                # Не ответ с кодом и не обрыв связи, а отказ сервера: повтор не поможет
+                self._reset()
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # Соединение разорвано: закрываем сокет без QUIT, следующая попытка откроет новое
+                if self.server is not None:
+                    self.server.close()
+                    self.server = None
+                if attempt == self.retries:
+                    raise
+            print(f"Ошибка SMTP, повтор через {delay:.1f} с (попытка {attempt + 1} из {self.retries})")
+            time.sleep(delay)
+            delay *= 2
+
+    def _reset(self):
+        try:
+            self.server.rset()
+        except (smtplib.SMTPException, OSError, AttributeError):
+            self.close()
+
+    def _send_once(self, sender, recipients, message_file):
+        server = self.server
+        size = os.path.getsize(message_file)
+        options = []
+        if server.has_extn("size"):
+            limit = int(server.esmtp_features["size"] or 0)
+            if limit and size > limit:
+                raise smtplib.SMTPResponseException(552, f"Message size {size} exceeds server limit {limit}")
+            options.append(f"SIZE={size}")
+
+        code, reply = server.mail(sender, options)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, reply, sender)
+        accepted = 0
+        for recipient in recipients:
+            code, reply = server.rcpt(recipient)
+            if code in (250, 251):
+                accepted += 1
+            elif code >= 500:
+                raise smtplib.SMTPRecipientsRefused({recipient: (code, reply)})
+            else:
+                raise smtplib.SMTPResponseException(code, reply)
+        if not accepted:
+            raise smtplib.SMTPRecipientsRefused({})
+
+        code, reply = server.docmd("data")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, reply)
+
+        # Строки, начинающиеся с точки, удваиваются (RFC 5321, 4.5.2)
+        with open(message_file, "rb") as message:
+            buffer = []
+            buffered = 0
+            for line in message:
+                if line.startswith(b"."):
+                    line = b"." + line
+                buffer.append(line)
+                buffered += len(line)
+                if buffered >= 64 * 1024:
+                    server.send(b"".join(buffer))
+                    buffer = []
+                    buffered = 0
+            buffer.append(b"." + _CRLF)
+            server.send(b"".join(buffer))
+
+        code, reply = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, reply)
+
+
+# Соединения, открытые в этом процессе: (сервер, порт, пользователь) -> SMTPConnection
+_connections = {}
+
+
+def get_connection(smtp_server, smtp_port, user=None, password=None, starttls=True):
+    """Соединение для повторного использования между письмами"""
+    key = (smtp_server, smtp_port, user, starttls)
+    connection = _connections.get(key)
+    if connection is None:
+        connection = _connections[key] = SMTPConnection(smtp_server, smtp_port, user, password, starttls)
+    return connection
+
+
+def close_connections():
+    for connection in _connections.values():
+        connection.close()
+    _connections.clear()
+
+
+atexit.register(close_connections)
+
+
 def send_email_with_attachments(
         smtp_server="smtp.mail.ru",
         smtp_port=587,
@@ -15,53 +283,50 @@ def send_email_with_attachments(
         email_password=PASSWORD,
         subject="Отчет по журналу событий",
         body="Вложенные файлы из указанной директории.",
-        directory="/home/akpchelkova/audi"
+        directory="/home/akpchelkova/audi",
+        patterns=ATTACHMENT_PATTERNS,
+        max_file_bytes=MAX_ATTACHMENT_BYTES,
+        max_total_bytes=MAX_TOTAL_BYTES,
+        bundle=BUNDLE_ATTACHMENTS,
+        starttls=True,
+        keep_connection=True,
     ):
     """
-    Отправляет письмо самому себе с прикрепленными файлами из указанной директории.
+    Отправляет письмо самому себе с файлами отчёта из указанной директории.
 
     :param smtp_server: Адрес SMTP сервера
     :param smtp_port: Порт SMTP сервера
-    :param email_user: Ваш адрес электронной почты
-    :param email_password: Пароль от почты (или пароль приложения)
+    :param email_sender: Ваш адрес электронной почты
+    :param email_password: Пароль от почты (или пароль приложения); пустой — без авторизации
     :param subject: Тема письма
     :param body: Текст сообщения
     :param directory: Директория, из которой будут прикреплены файлы
+    :param patterns: Шаблоны имён прикладываемых файлов
+    :param bundle: Упаковать вложения в один zip
+    :param starttls: Шифровать соединение (False — для локального тестового сервера)
+    :param keep_connection: Оставить соединение открытым для следующих писем
     """
-    # Создание сообщения
-    msg = MIMEMultipart()
-    msg['From'] = email_sender
-    msg['To'] = email_get  # Отправляем самому себе
-    msg['Subject'] = subject
-
-    # Добавление тела письма
-    msg.attach(MIMEText(body, 'plain'))
-
-    # Проверка директории и добавление файлов
-    if os.path.isdir(directory):
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            if os.path.isfile(file_path):  # Проверяем, что это файл
-                with open(file_path, "rb") as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header('Content-Disposition', f"attachment; filename={filename}")
-                    msg.attach(part)
-    else:
-        raise FileNotFoundError(f"Указанная директория '{directory}' не существует или это не директория.")
+    attachments = select_attachments(directory, patterns, max_file_bytes, max_total_bytes)
+
+    # Письмо собирается во временном каталоге и передаётся серверу потоком
+    with tempfile.TemporaryDirectory(prefix="send_report_") as tmp_dir:
+        if bundle and attachments:
+            attachments = [bundle_attachments(attachments, os.path.join(tmp_dir, BUNDLE_NAME))]
+        message_file = os.path.join(tmp_dir, "message.eml")
+        with open(message_file, "wb") as out:
+            write_message(out, email_sender, email_get, subject, body, attachments)
 
-    # Отправка письма через SMTP сервер
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()  # Шифруем соединение
-        server.login(email_sender, email_password)
-        server.sendmail(email_sender, email_get, msg.as_string())
-        print("Сообщение отправлено!")
-    except Exception as e:
-        print(f"Ошибка при отправке письма: {e}")
-    finally:
-        server.quit()
+        connection = get_connection(smtp_server, smtp_port, email_sender, email_password, starttls)
+        try:
+            connection.send(email_sender, [email_get], message_file)
+        except Exception as e:
+            print(f"Ошибка при отправке письма: {e}")
+            connection.close()
+            raise
+        finally:
+            if not keep_connection:
+                connection.close()
+    print("Сообщение отправлено!")
 
 # Пример использования
 if __name__ == "__main__":
@@ -75,5 +340,6 @@ if __name__ == "__main__":
         email_password=PASSWORD,
         subject="Отчет по журналу событий",
         body="Вложенные файлы из указанной директории.",
-        directory="/home/akpchelkova/audi"
+        directory="/home/akpchelkova/audi",
+        keep_connection=False,
     )
@@ -0,0 +1,532 @@
+import os
+import time
+import errno
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.observers import Observer
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileSystemEventHandler,
+)
+
+
+INOTIFY_DIR = "/proc/sys/fs/inotify"
+WATCH_WORKERS = 4          # Параллельная регистрация поддеревьев (своя нить-наблюдатель на каждого)
+MAX_PARTITIONS = 32        # Поддеревьев на корень; каждое — отдельный экземпляр inotify (max_user_instances)
+WATCH_RESERVE = 0.1        # Доля max_user_watches, оставляемая новым каталогам и другим программам
+WATCH_WARN_RATIO = 0.9     # Предупреждать, когда занято больше этой доли лимита
+SCAN_INTERVAL = 60         # Период обхода поддеревьев без inotify, с
+INOTIFY_WATCH_BYTES = 1080  # Память ядра на одну метку inotify (64-bit), для оценки
+
+
+# Лимиты и использование inotify
+
+def read_watch_limits():
+    """(max_user_watches, max_user_instances) или (None, None), если inotify недоступен"""
+    limits = []
+    for name in ("max_user_watches", "max_user_instances"):
+        try:
+            with open(os.path.join(INOTIFY_DIR, name)) as file:
+                limits.append(int(file.read()))
+        except (OSError, ValueError):
+            limits.append(None)
+    return tuple(limits)
+
+
+def inotify_usage(all_processes=True):
+    """(меток, экземпляров) inotify у процессов текущего пользователя (или только у этого процесса)
+
+    Считается по строкам "inotify wd:" в /proc/<pid>/fdinfo; чужие процессы без прав пропускаются.
+    """
+    uid = os.getuid()
+    pids = [name for name in os.listdir("/proc") if name.isdigit()] if all_processes else ["self"]
+    watches = instances = 0
+    for pid in pids:
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            if all_processes and os.stat(f"/proc/{pid}").st_uid != uid:
+                continue
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) != "anon_inode:inotify":
+                    continue
+                with open(f"/proc/{pid}/fdinfo/{fd}") as file:
+                    count = sum(1 for line in file if line.startswith("inotify wd:"))
+            except OSError:
+                continue
+            instances += 1
+            watches += count
+    return watches, instances
+
+
+def rss_bytes():
+    """Резидентная память процесса"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def count_directories(path, path_filter=None, limit=None, stop=None):
+    """Число каталогов поддерева (включая path); обход прекращается, как только превышен limit"""
+    count = 0
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        count += 1
+        if (limit is not None and count > limit) or (stop is not None and stop.is_set()):
+            return count
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not (path_filter and path_filter.is_excluded(entry.path)):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return count
+
+
+# Запасной режим: сравнение снимков (mtime, размер)
+
+class StatScanner:
+    """Периодический обход поддеревьев, которые не удалось поставить на inotify
+
+    Снимок хранит для каждого пути (mtime_ns, размер, каталог ли); разница двух снимков
+    выдаётся обработчику событиями watchdog (создание, удаление, изменение).
+    """
+
+    def __init__(self, handler, path_filter=None):
+        self.handler = handler
+        self.path_filter = path_filter
+        self.roots = []
+        self.snapshots = {}  # корень -> {путь: (mtime_ns, размер, каталог)}
+        self.scans = 0
+        self.scan_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, root, snapshot=None):
+        """Добавляет поддерево; первый снимок снимается сразу, без событий"""
+        if snapshot is None:
+            snapshot = self.snapshot(root)
+        with self._lock:
+            self.roots.append(root)
+            self.snapshots[root] = snapshot
+
+    def remove(self, root):
+        """Убирает поддерево (каталог удалён или перемещён); False, если его не было"""
+        with self._lock:
+            if root not in self.snapshots:
+                return False
+            self.roots.remove(root)
+            del self.snapshots[root]
+            return True
+
+    def snapshot(self, root):
+        entries = {}
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        if self.path_filter is not None and self.path_filter.is_excluded(entry.path):
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        entries[entry.path] = (st.st_mtime_ns, st.st_size, is_dir)
+                        if is_dir:
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return entries
+
+    def scan(self):
+        """Один проход по всем поддеревьям; возвращает число найденных изменений"""
+        started = time.perf_counter()
+        changes = 0
+        with self._lock:
+            roots = list(self.roots)
+        for root in roots:
+            previous = self.snapshots.get(root)
+            if previous is None:
+                continue  # убрано во время обхода
+            current = self.snapshot(root)
+            dispatch = self.handler.dispatch
+            for path in current.keys() - previous.keys():
+                dispatch(DirCreatedEvent(path) if current[path][2] else FileCreatedEvent(path))
+            for path in previous.keys() - current.keys():
+                dispatch(DirDeletedEvent(path) if previous[path][2] else FileDeletedEvent(path))
+            for path, state in current.items():
+                old = previous.get(path)
+                if old is not None and old != state and not state[2]:
+                    dispatch(FileModifiedEvent(path))
+                    changes += 1
+            changes += len(current.keys() ^ previous.keys())
+            with self._lock:
+                if root in self.snapshots:
+                    self.snapshots[root] = current
+        self.scans += 1
+        self.scan_seconds += time.perf_counter() - started
+        return changes
+
+    def entries(self):
+        return sum(len(snapshot) for snapshot in self.snapshots.values())
+
+
+# Наблюдение за несколькими деревьями
+
+class _FlatHandler(FileSystemEventHandler):
+    """Обработчик каталогов без рекурсии: новые подкаталоги становятся новыми разделами"""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        self.watcher.handler.dispatch(event)
+        if not event.is_directory:
+            return
+        if event.event_type in ("deleted", "moved"):
+            self.watcher.remove_partition(event.src_path)
+        if event.event_type in ("created", "moved"):
+            path = event.dest_path if event.event_type == "moved" else event.src_path
+            self.watcher.add_partition(path)
+
+
+class TreeWatcher:
+    """Наблюдение за несколькими корнями: поддеревья регистрируются параллельно и лениво
+
+    Корень ставится на наблюдение без рекурсии сразу, его подкаталоги первого уровня
+    (разделы) — рекурсивно в фоне, начиная с недавно изменённых. Перед регистрацией раздел
+    обходится и число его каталогов сверяется с остатком max_user_watches: разделы, которые
+    не помещаются (или на которых inotify всё же отказал), переходят в режим обхода StatScanner.
+    """
+
+    def __init__(self, roots, handler, path_filter=None, workers=WATCH_WORKERS, max_partitions=MAX_PARTITIONS,
+                 scan_interval=SCAN_INTERVAL, reserve=WATCH_RESERVE, observer_class=Observer):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.handler = handler
+        self.path_filter = path_filter
+        self.workers = workers
+        self.max_partitions = max_partitions
+        self.scan_interval = scan_interval
+        self.observer_class = observer_class
+
+        self.watch_limit, self.instance_limit = read_watch_limits()
+        used, instances = inotify_usage()
+        self._budget = None
+        if self.watch_limit:
+            self._budget = max(0, int(self.watch_limit * (1 - reserve)) - used)
+        # Каждый раздел — отдельный экземпляр inotify; несколько экземпляров оставляем другим программам
+        self._instances = None
+        if self.instance_limit:
+            self._instances = max(0, int(self.instance_limit * (1 - reserve)) - instances)
+        self._budget_lock = threading.Lock()
+
+        self.scanner = StatScanner(handler, path_filter)
+        self._flat_handler = _FlatHandler(self)
+        self._observers = []
+        self._watches = {}          # путь раздела -> (наблюдатель, метка, каталогов) или None при обходе
+        self._local = threading.local()
+        self._executor = None
+        self._futures = []
+        self._stop = threading.Event()
+        self._scan_thread = None
+
+        # Измерения
+        self.partitions = []        # (путь, каталогов, "inotify" / "scan", секунд)
+        self.watched_directories = 0
+        self.started = None
+        self.ready_seconds = None
+        self._rss_before = 0
+        self._warned = False
+
+    # Планирование
+
+    def plan(self, root):
+        """(каталоги без рекурсии, разделы) для корня с учётом исключений"""
+        flat = []
+        partitions = []
+        plan = self.path_filter.watch_plan(root) if self.path_filter is not None else [(root, True)]
+        for path, recursive in plan:
+            if not recursive:
+                flat.append(path)
+                continue
+            try:
+                with os.scandir(path) as entries:
+                    children = [(entry.stat(follow_symlinks=False).st_mtime, entry.path) for entry in entries
+                                if entry.is_dir(follow_symlinks=False)]
+            except OSError:
+                children = None
+            if children is None or len(partitions) + len(children) > self.max_partitions:
+                partitions.append((0, path))  # слишком много подкаталогов: раздел целиком
+                continue
+            flat.append(path)
+            partitions.extend(children)
+        # Ленивый порядок: раньше всего — поддеревья, которые менялись недавно
+        partitions.sort(reverse=True)
+        return flat, [path for _, path in partitions]
+
+    # Регистрация
+
+    def _observer(self):
+        observer = getattr(self._local, "observer", None)
+        if observer is None:
+            observer = self.observer_class()
+            observer.start()
+            self._observers.append(observer)
+            self._local.observer = observer
+        return observer
+
+    def _reserve(self, directories):
+        with self._budget_lock:
+            if self._instances is not None:
+                if not self._instances:
+                    return False
+                self._instances -= 1
+            if self._budget is None:
+                return True
+            if directories > self._budget:
+                if self._instances is not None:
+                    self._instances += 1
+                return False
+            self._budget -= directories
+            return True
+
+    def _register(self, path, announce=False):
+        """Ставит раздел на наблюдение; announce — сообщить о его содержимом (раздел появился после запуска)"""
+        if self._stop.is_set():
+            return
+        started = time.perf_counter()
+        limit = self._budget + 1 if self._budget is not None else None
+        directories = count_directories(path, self.path_filter, limit, self._stop)
+        if self._stop.is_set() or not os.path.isdir(path):
+            return  # каталог успели удалить или переместить
+        mode = "scan"
+        if self._reserve(directories):
+            try:
+                observer = self._observer()
+                watch = observer.schedule(self.handler, path, recursive=True)
+                mode = "inotify"
+            except OSError as e:
+                if e.errno not in (errno.ENOSPC, errno.EMFILE):
+                    raise
+                # Лимит исчерпан чужими метками: часть меток раздела может остаться до перезапуска
+                print(f"inotify limit reached on {path} ({e}), falling back to periodic scan")
+                with self._budget_lock:
+                    self._budget = 0
+        # Снимок — уже после постановки на наблюдение: созданное до неё не теряется,
+        # созданное между ними может прийти дважды
+        snapshot = self.scanner.snapshot(path) if announce or mode == "scan" else None
+        if mode == "scan":
+            self.scanner.add(path, snapshot)
+            entry = None
+        else:
+            entry = (observer, watch, directories)
+        with self._budget_lock:
+            self._watches[path] = entry
+            if entry is not None:
+                self.watched_directories += directories
+            self.partitions.append((path, directories, mode, time.perf_counter() - started))
+        if announce:
+            self._announce(snapshot)
+
+    def _announce(self, entries):
+        """События создания для того, что уже лежит в новом каталоге (mkdir -p a/b && touch a/b/f)"""
+        dispatch = self.handler.dispatch
+        for path in sorted(entries):
+            dispatch(DirCreatedEvent(path) if entries[path][2] else FileCreatedEvent(path))
+
+    def start(self):
+        """Ставит корни на наблюдение и запускает фоновую регистрацию разделов; не ждёт её"""
+        self.started = time.perf_counter()
+        self._rss_before = rss_bytes()
+        partitions = []
+        for root in self.roots:
+            flat, root_partitions = self.plan(root)
+            self._watch_flat(flat)
+            partitions.extend(root_partitions)
+            print(f"Monitoring started on directory: {root} ({len(root_partitions)} subtrees to register)")
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tree-watch")
+        self._futures = [self._executor.submit(self._register, path) for path in partitions]
+        self._scan_thread = threading.Thread(target=self._run, name="tree-scan", daemon=True)
+        self._scan_thread.start()
+        return self
+
+    def _watch_flat(self, paths):
+        for path in paths:
+            if self._reserve(1):
+                observer = self._observer()
+                watch = observer.schedule(self._flat_handler, path, recursive=False)
+                with self._budget_lock:
+                    self._watches[path] = (observer, watch, 1)
+                    self.watched_directories += 1
+            else:
+                print(f"inotify limit reached, {path} is scanned periodically")
+                self.scanner.add(path)
+                with self._budget_lock:
+                    self._watches[path] = None
+
+    def add_partition(self, path):
+        """Регистрирует каталог, появившийся после запуска в каталоге без рекурсии"""
+        if self._stop.is_set() or (self.path_filter is not None and self.path_filter.is_excluded(path)):
+            return
+        if self.path_filter is not None and self.path_filter.has_excluded_below(path):
+            flat, partitions = self.plan(path)
+            self._watch_flat(flat)
+            # Содержимое каталогов без рекурсии (в том числе сами будущие разделы) появилось до
+            # постановки меток; разделы сообщат о своём содержимом сами
+            for directory in flat:
+                self._announce(self._list(directory))
+        else:
+            partitions = [path]
+        try:
+            for partition in partitions:
+                self._executor.submit(self._register, partition, True)
+        except RuntimeError:
+            pass  # остановка уже идёт
+
+    def _list(self, directory):
+        """Непосредственное содержимое каталога в виде снимка StatScanner (без исключённых путей)"""
+        entries = {}
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    if not self.path_filter.is_excluded(entry.path):
+                        entries[entry.path] = (0, 0, entry.is_dir(follow_symlinks=False))
+        except OSError:
+            pass
+        return entries
+
+    def remove_partition(self, path):
+        """Снимает наблюдение с удалённого или перемещённого каталога (и разделов внутри него)
+        и возвращает метки в бюджет; число снятых разделов"""
+        prefix = path + os.sep
+        with self._budget_lock:
+            removed = [(key, self._watches.pop(key)) for key in list(self._watches)
+                       if key == path or key.startswith(prefix)]
+            for _, entry in removed:
+                if entry is None:
+                    continue
+                self.watched_directories -= entry[2]
+                if self._budget is not None:
+                    self._budget += entry[2]
+                if self._instances is not None:
+                    self._instances += 1
+            if removed:
+                keys = {key for key, _ in removed}
+                self.partitions = [partition for partition in self.partitions if partition[0] not in keys]
+        for key, entry in removed:
+            if entry is None:
+                self.scanner.remove(key)
+                continue
+            observer, watch, _ = entry
+            try:
+                observer.unschedule(watch)
+            except (KeyError, OSError):
+                pass  # метка уже снята ядром вместе с каталогом
+        return len(removed)
+
+    def wait_ready(self, timeout=None):
+        """Дожидается регистрации всех разделов; True, если всё зарегистрировано"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in self._futures:
+            if future.cancelled():
+                continue
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                future.result(remaining)
+            except Exception as e:
+                if not future.done():
+                    return False
+                if not future.cancelled():
+                    print(f"Subtree registration failed: {e}")
+        return True
+
+    def _run(self):
+        self.wait_ready()
+        if self._stop.is_set():
+            return
+        self.ready_seconds = time.perf_counter() - self.started
+        print(self.format_stats())
+        self.check_limit()
+        while not self._stop.wait(self.scan_interval):
+            if self.scanner.roots:
+                self.scanner.scan()
+            self.check_limit()
+
+    def check_limit(self):
+        """Предупреждает, когда метки inotify пользователя близки к max_user_watches"""
+        if not self.watch_limit:
+            return None
+        used, instances = inotify_usage()
+        ratio = used / self.watch_limit
+        if ratio >= WATCH_WARN_RATIO:
+            if not self._warned:
+                print(f"inotify watches at {used}/{self.watch_limit} ({100 * ratio:.0f}%); "
+                      f"raise fs.inotify.max_user_watches or exclude subtrees")
+            self._warned = True
+        else:
+            self._warned = False
+        return used, instances
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        for observer in self._observers:
+            observer.stop()
+        for observer in self._observers:
+            observer.join()
+        if self._scan_thread is not None:
+            self._scan_thread.join()
+
+    # Измерения
+
+    def stats(self):
+        # Разделы добавляются и снимаются из других нитей
+        with self._budget_lock:
+            partitions = list(self.partitions)
+        watched = [partition for partition in partitions if partition[2] == "inotify"]
+        scanned = [partition for partition in partitions if partition[2] == "scan"]
+        memory = max(0, rss_bytes() - self._rss_before)
+        return {
+            "roots": len(self.roots),
+            "partitions": len(partitions),
+            "watched_partitions": len(watched),
+            "scanned_partitions": len(scanned),
+            "watched_directories": self.watched_directories,
+            "scanned_entries": self.scanner.entries(),
+            "watch_limit": self.watch_limit,
+            "instance_limit": self.instance_limit,
+            "ready_seconds": self.ready_seconds,
+            "slowest_partition_seconds": max((partition[3] for partition in partitions), default=0.0),
+            "rss_growth_bytes": memory,
+            "rss_bytes_per_directory": memory / self.watched_directories if self.watched_directories else None,
+            "kernel_bytes_estimate": self.watched_directories * INOTIFY_WATCH_BYTES,
+            "scans": self.scanner.scans,
+            "scan_seconds": self.scanner.scan_seconds,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        per_directory = stats["rss_bytes_per_directory"]
+        return (f"File monitor ready in {stats['ready_seconds'] or 0:.2f}s: {stats['watched_directories']} directories "
+                f"watched in {stats['watched_partitions']} subtrees, {stats['scanned_partitions']} subtrees "
+                f"({stats['scanned_entries']} entries) on periodic scan; memory "
+                f"{per_directory or 0:.0f} B/directory in process, ~{INOTIFY_WATCH_BYTES} B/directory in kernel")
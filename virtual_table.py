@@ -0,0 +1,154 @@
+from tkinter import ttk
+
+
+class VirtualTable:
+    """Таблица ttk.Treeview, в которой существуют только строки видимого окна
+
+    Данные хранятся в списке records; строки Treeview создаются один раз на размер
+    окна (видимые строки + запас) и при прокрутке лишь получают новые значения,
+    поэтому открытие и прокрутка результата из миллиона записей стоят одинаково мало.
+    """
+
+    def __init__(self, parent, columns, formatter, height=10, buffer=10):
+        self.columns = columns
+        self.formatter = formatter  # formatter(номер, запись) -> значения строки
+        self.height = height
+        self.buffer = buffer
+        self.records = []
+        self.dropped = 0  # сколько записей отброшено с начала (для сквозной нумерации)
+        self.order = None  # перестановка записей для отображения (None — исходный порядок)
+        self.order_reversed = False
+        self.permutations = {}  # колонка -> перестановка по возрастанию ключа (кэш на набор записей)
+        self.sort_column = None
+        self.first = 0
+        self.items = []
+
+        self.frame = ttk.Frame(parent)
+        self.frame.pack(padx=10, pady=10, fill="both", expand=True)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        # Прокрутку ведёт модель, а не сам Treeview
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.tree.bind("<Prior>", lambda event: self.scroll_by(-self.height))
+        self.tree.bind("<Next>", lambda event: self.scroll_by(self.height))
+        self.tree.bind("<Configure>", self.on_resize)
+
+    def __len__(self):
+        return len(self.records)
+
+    def set_records(self, records):
+        """Заменяет содержимое таблицы"""
+        self.records = records
+        self.dropped = 0
+        self.reset_order()
+        self.first = 0
+        self.render()
+
+    def reset_order(self):
+        """Возвращает исходный порядок и сбрасывает кэш сортировок"""
+        self.order = None
+        self.order_reversed = False
+        self.permutations = {}
+        self.sort_column = None
+
+    def sort_by(self, column, key, reverse=None):
+        """Сортирует модель по колонке; key(номер, запись) -> типизированный ключ
+
+        Ключи вычисляются один раз на колонку и набор записей, перестановка кэшируется,
+        поэтому повторный клик (смена направления) ничего не пересчитывает.
+        Возвращает текущее направление сортировки.
+        """
+        if reverse is None:
+            reverse = not self.order_reversed if column == self.sort_column else False
+        permutation = self.permutations.get(column)
+        if permutation is None:
+            keys = [key(*self.record_at_index(index)) for index in range(len(self.records))]
+            permutation = sorted(range(len(keys)), key=keys.__getitem__)
+            self.permutations[column] = permutation
+        self.order = permutation
+        self.order_reversed = reverse
+        self.sort_column = column
+        self.first = 0
+        self.render()
+        return reverse
+
+    def append_records(self, records, max_rows=None):
+        """Дописывает записи в конец; при превышении max_rows старые записи отбрасываются"""
+        if not records:
+            return
+        at_bottom = self.first + self.height >= len(self.records)
+        self.records.extend(records)
+        self.reset_order()
+        if max_rows is not None and len(self.records) > max_rows:
+            excess = len(self.records) - max_rows
+            del self.records[:excess]
+            self.dropped += excess
+            self.first -= excess
+        if at_bottom:
+            # Если пользователь смотрел в конец таблицы, он продолжает видеть новые строки
+            self.first = len(self.records)
+        self.render()
+
+    def record_at(self, position):
+        """Запись в позиции отображения и её номер в результате"""
+        if self.order is None:
+            return self.record_at_index(position)
+        if self.order_reversed:
+            position = len(self.order) - 1 - position
+        return self.record_at_index(self.order[position])
+
+    def record_at_index(self, index):
+        """Запись по индексу в records и её сквозной номер"""
+        return self.dropped + index + 1, self.records[index]
+
+    def render(self):
+        """Перерисовывает только окно видимых строк"""
+        total = len(self.records)
+        window = self.height + self.buffer
+        self.first = max(0, min(self.first, total - self.height))
+
+        # Пул строк Treeview подстраивается под размер окна, а не под размер результата
+        count = min(window, total - self.first)
+        while len(self.items) < count:
+            self.items.append(self.tree.insert("", "end"))
+        while len(self.items) > count:
+            self.tree.delete(self.items.pop())
+
+        for item, position in zip(self.items, range(self.first, self.first + count)):
+            number, record = self.record_at(position)
+            self.tree.item(item, values=self.formatter(number, record)[:len(self.columns)])
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_by(self, rows):
+        self.first += rows
+        self.render()
+        return "break"
+
+    def on_scroll(self, *args):
+        """Команда ползунка: moveto <доля> или scroll <n> units|pages"""
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.records))
+            self.render()
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def on_mouse_wheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_resize(self, event):
+        # Число видимых строк зависит от высоты виджета
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        height = max(1, event.height // int(row_height) - 1)
+        if height != self.height:
+            self.height = height
+            self.render()
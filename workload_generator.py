@@ -0,0 +1,142 @@
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from binary_log import BinaryLogWriter
+
+
+# Доли источников в наблюдаемом журнале (почти всё — изменения файлов)
+SOURCE_MIX = {"file": 0.93, "process": 0.05, "network": 0.02}
+
+# Типы событий внутри источника и их доли
+FILE_EVENTS = {"FILE_MODIFIED": 0.90, "FILE_CREATED": 0.05, "FILE_DELETED": 0.03, "FILE_MOVED": 0.02}
+PROCESS_EVENTS = {"PROCESS_START": 0.45, "PROCESS_END": 0.55}
+NETWORK_EVENTS = {"New connection": 0.5, "Closed connection": 0.5}
+TCP_STATUSES = {"ESTABLISHED": 0.6, "TIME_WAIT": 0.15, "LISTEN": 0.1, "SYN_SENT": 0.1, "CLOSE_WAIT": 0.05}
+
+DEBOUNCED_SHARE = 0.3      # Доля FILE_MODIFIED со счётчиком склейки (count, first/last_timestamp)
+ATTRIBUTED_SHARE = 0.2     # Доля сетевых событий с pid владельца
+EVENTS_PER_SECOND = 50     # Средний темп событий: задаёт разброс временных меток
+PATHS = 5000               # Сколько разных путей «живёт» в наблюдаемых каталогах
+PROCESSES = 400
+
+DIRECTORIES = ("/home/user/project/src", "/home/user/project/build", "/home/user/.cache/pip",
+               "/home/user/Documents", "/var/tmp/session", "/home/user/.config/app")
+EXTENSIONS = (".py", ".o", ".json", ".txt", ".log", ".tmp", ".cache", "")
+PROCESS_NAMES = ("python3", "bash", "sshd", "systemd", "chrome", "code", "git", "cc1", "ld", "sleep", "cron")
+USERS = ("root", "user", "www-data", "postgres")
+LOCAL_IPS = ("127.0.0.1", "192.168.1.23", "::1")
+REMOTE_IPS = ("93.184.216.34", "140.82.121.4", "151.101.1.69", "10.0.0.5", "2a00:1450:4010:c05::71")
+SERVICE_PORTS = (22, 80, 443, 5432, 8080)
+
+
+def _chooser(rng, weights):
+    values = list(weights)
+    cumulative = []
+    total = 0.0
+    for value in values:
+        total += weights[value]
+        cumulative.append(total)
+    return lambda: rng.choices(values, cum_weights=cumulative)[0]
+
+
+class WorkloadGenerator:
+    """Синтетический журнал в формате one_file_logger с наблюдаемым составом источников и форм записей
+
+    Записи детерминированы зерном seed, время монотонно растёт от start.
+    """
+
+    def __init__(self, seed=0, start=None, events_per_second=EVENTS_PER_SECOND, source_mix=SOURCE_MIX):
+        self.rng = random.Random(seed)
+        self.now = start or datetime(2024, 1, 1, 9, 0, 0)
+        self.mean_gap = 1.0 / events_per_second
+        self.next_source = _chooser(self.rng, source_mix)
+        self.next_file_event = _chooser(self.rng, FILE_EVENTS)
+        self.next_process_event = _chooser(self.rng, PROCESS_EVENTS)
+        self.next_network_event = _chooser(self.rng, NETWORK_EVENTS)
+        self.next_status = _chooser(self.rng, TCP_STATUSES)
+
+        rng = self.rng
+        self.paths = [f"{rng.choice(DIRECTORIES)}/{rng.choice(('main', 'util', 'data', 'index', 'tmp'))}"
+                      f"_{number}{rng.choice(EXTENSIONS)}" for number in range(PATHS)]
+        self.processes = [{"pid": rng.randint(300, 4_000_000), "name": rng.choice(PROCESS_NAMES),
+                           "user": rng.choice(USERS)} for _ in range(PROCESSES)]
+
+    def _tick(self):
+        self.now += timedelta(seconds=self.rng.expovariate(1.0 / self.mean_gap))
+        return self.now.isoformat()
+
+    def file_event(self, timestamp):
+        rng = self.rng
+        event_type = self.next_file_event()
+        # Изменения сосредоточены на небольшой части путей
+        path = self.paths[int(rng.paretovariate(1.2)) % len(self.paths)]
+        record = {"timestamp": timestamp, "source": "file", "event_type": event_type, "src_path": path,
+                  "dest_path": None}
+        if event_type == "FILE_MOVED":
+            record["dest_path"] = path + ".bak"
+        elif event_type == "FILE_MODIFIED" and rng.random() < DEBOUNCED_SHARE:
+            first = (self.now - timedelta(milliseconds=rng.randint(1, 500))).isoformat()
+            record.update(count=rng.randint(2, 40), first_timestamp=first, last_timestamp=timestamp)
+        return record
+
+    def process_event(self, timestamp):
+        event_type = self.next_process_event()
+        process = self.rng.choice(self.processes)
+        user = process["user"]
+        if event_type == "PROCESS_END" and self.rng.random() < 0.5:
+            user = "unknown"  # процесс завершился раньше, чем о нём успели узнать
+        return {"timestamp": timestamp, "source": "process", "event_type": event_type, "pid": process["pid"],
+                "name": process["name"], "user": user}
+
+    def network_event(self, timestamp):
+        rng = self.rng
+        status = self.next_status()
+        local = {"ip": rng.choice(LOCAL_IPS), "port": rng.choice(SERVICE_PORTS) if status == "LISTEN"
+                 else rng.randint(32768, 60999)}
+        remote = None if status == "LISTEN" else {"ip": rng.choice(REMOTE_IPS), "port": rng.choice(SERVICE_PORTS)}
+        record = {"timestamp": timestamp, "source": "network", "event_type": self.next_network_event(),
+                  "local_address": local, "remote_address": remote, "status": status}
+        if rng.random() < ATTRIBUTED_SHARE:
+            record["pid"] = rng.choice(self.processes)["pid"]
+        return record
+
+    def records(self, count):
+        """Генератор count записей"""
+        makers = {"file": self.file_event, "process": self.process_event, "network": self.network_event}
+        for _ in range(count):
+            yield makers[self.next_source()](self._tick())
+
+
+def generate_log(path, count, seed=0, log_format="json", batch=10000):
+    """Пишет журнал из count записей (json — строки как у one_file_logger, binary — см. binary_log)"""
+    generator = WorkloadGenerator(seed)
+    if log_format == "binary":
+        with open(path, "wb") as file:
+            writer = BinaryLogWriter(file)
+            for record in generator.records(count):
+                writer.write(record)
+            writer.flush_block()
+        return path
+
+    with open(path, "w", encoding="utf-8") as file:
+        lines = []
+        for record in generator.records(count):
+            lines.append(json.dumps(record) + "\n")
+            if len(lines) >= batch:
+                file.writelines(lines)
+                lines = []
+        file.writelines(lines)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic event log with the observed event mix")
+    parser.add_argument("path", nargs="?", default="event_log.json")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("json", "binary"), default="json")
+    args = parser.parse_args()
+    generate_log(args.path, args.records, args.seed, args.format)
+    print(f"Generated {args.records} records: {args.path}")